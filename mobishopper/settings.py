@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "ms_baseline.query_stats.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -148,6 +149,44 @@ MOBISHOPPER_PAGE_SIZE = 30
 MOBISHOPPER_MODAL_PAGE_SIZE = 15
 MOBISHOPPER_REST_PAGE_SIZE = 30
 
+# Query statistics, visible to staff members at /management/query-stats/
+MOBISHOPPER_QUERY_STATS = True
+MOBISHOPPER_QUERY_STATS_SLOWEST = 5
+# Budgets per view name: maximum number of queries, or a dict with "queries" and/or "time_ms" (SQL time).
+# The query budgets are the highest counts measured by the benchmarks (make benchmark) for each view.
+MOBISHOPPER_QUERY_BUDGETS = {
+    "ms_products_api:products": 11,
+    "ms_products_api:products_details": 7,
+    "ms_products_api:vendors_products_list": 7,
+    "ms_products_api:productgroups_list": 10,
+    "ms_deals_api:deals_list": 8,
+    "ms_deals_api:coupons_list": 8,
+    "ms_deals_api:coupon_sets_list": 8,
+    "ms_maps_api:product_locations_bulk": 7,
+}
+MOBISHOPPER_QUERY_BUDGET_DEFAULT = None
+# "log" (warning in the logs) or "raise" (QueryBudgetExceeded)
+MOBISHOPPER_QUERY_BUDGET_ACTION = "log"
+
+# Migrate objects that depend on a replaced revision with bulk queries (instead of saving them one by one).
+MOBISHOPPER_BULK_REVISION_MIGRATIONS = True
+
+# Answer conditional GET requests to catalog API endpoints with 304 Not Modified (based on ETags).
+MOBISHOPPER_CONDITIONAL_GET = True
+
+# Application cache (values are versioned with generation counters, see ms_baseline.cache).
+# The cache backend must be shared by all processes that write to the database.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "mobishopper",
+    }
+}
+MOBISHOPPER_CACHE_ALIAS = "default"
+MOBISHOPPER_CACHE_ENABLED = True
+# Timeout of cached values, in seconds (generation counters never expire).
+MOBISHOPPER_CACHE_TIMEOUT = 3600
+
 MOBISHOPPER_EMAIL = "mobishopper@krzysztofwojciechowski.pl"
 MOBISHOPPER_INVITE_SUBJECT = "[MobiShopper] {user} zaprasza do listy zakupów"
 MOBISHOPPER_INVITE_PLAINTEXT = (
@@ -160,7 +199,34 @@ MOBISHOPPER_INVITE_HTML = (
     "<small>Zaproszenie wygaśnie {date}.</small>"
 )
 
+# Search products and groups with a full-text index (SQLite FTS5 or PostgreSQL, see ms_products.search).
+MOBISHOPPER_FULL_TEXT_SEARCH = True
+# Bounds of price bands in facet counts of product lists (see ms_products.facets).
+MOBISHOPPER_PRICE_BANDS = [5, 10, 20, 50]
+
+# Delta sync for the mobile app (see ms_baseline.sync): rows per model in one response, seconds of changes that are
+# sent again (to catch transactions that committed late), and days after which tombstones are pruned.
+MOBISHOPPER_SYNC_PAGE_SIZE = 500
+MOBISHOPPER_SYNC_OVERLAP = 60
+MOBISHOPPER_SYNC_TOMBSTONE_DAYS = 30
+
+# Catalog snapshots for the first launch of the mobile app (see ms_baseline.snapshots): seconds after which the
+# snapshot endpoint checks if the snapshot of a store is out of date (and rebuilds it within the request, so run the
+# buildsnapshots command more often than that), and the number of snapshots kept per store.
+MOBISHOPPER_SNAPSHOT_MAX_AGE = 300
+MOBISHOPPER_SNAPSHOT_KEEP = 2
+
+# The maximum number of operations in one batch change of shopping list entries (see ms_userdata.batch).
+MOBISHOPPER_LIST_BATCH_MAX_OPERATIONS = 500
+
+# Render API responses with orjson, serializing attrs classes directly (see ms_baseline.renderers).
+MOBISHOPPER_FAST_JSON = True
+
 REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": (
+        "ms_baseline.renderers.FastJSONRenderer" if MOBISHOPPER_FAST_JSON else "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_PAGINATION_CLASS": "ms_baseline.api_utils.PageNumberIncludedPagination",
     "PAGE_SIZE": MOBISHOPPER_REST_PAGE_SIZE,
     "DEFAULT_AUTHENTICATION_CLASSES": (
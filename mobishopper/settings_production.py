@@ -11,6 +11,12 @@ DATABASES = {
         "PORT": os.getenv("DB_PORT", "5432"),
     }
 }
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("DJANGO_CACHE_PATH", "/tmp/mobishopper-cache"),
+    }
+}
 MOBISHOPPER_MASK_LANDING = True
 STATIC_ROOT = "/srv/mobishopper.krzysztofwojciechowski.pl/static"
 MEDIA_ROOT = "/srv/mobishopper.krzysztofwojciechowski.pl/media"
@@ -8,9 +8,11 @@ _("Employees")
 _("Group")
 _("More filters…")
 _("Name")
+_("Price per unit")
 _("Price")
 _("Product")
 _("Reset password")
+_("Reset statistics")
 _("Save")
 _("Search")
 _("Validity")
@@ -1,20 +1,60 @@
 """Utilities for APIs in MobiShopper."""
+import base64
 import collections
+import functools
+import json
+import operator
+import typing
 
 import attr
+import django.core.exceptions
 import django.http
+import rest_framework.exceptions
 import rest_framework.pagination
 import rest_framework.response
+from django.conf import settings
+from django.db.models import F, OrderBy, Q, QuerySet
+from django.utils.translation import gettext_lazy as _
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from ms_baseline import cache
+from ms_baseline.models import DateRangedTrackedModel
+from ms_baseline.renderers import dumps
+from ms_baseline.utils import get_next_validity_change, get_visited_store_id
 
 
 def asdict_json_response(obj, status=200):
-    """Create a JsonResponse, based on an attrs class."""
-    return django.http.JsonResponse(attr.asdict(obj), status=status)
+    """Create a JSON response, based on an attrs class (serialized directly, see ms_baseline.renderers).
+
+    Dates are formatted like in JsonResponse, with milliseconds.
+    """
+    return django.http.HttpResponse(dumps(obj, django_dates=True), status=status, content_type="application/json")
+
+
+def asdict_nested(obj):
+    """Convert attrs classes in lists and dicts to dicts."""
+    if attr.has(type(obj)):
+        return attr.asdict(obj)
+    if isinstance(obj, (list, tuple)):
+        return [asdict_nested(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: asdict_nested(value) for key, value in obj.items()}
+    return obj
+
+
+def drf_data(obj):
+    """Prepare data containing attrs classes for a DRF Response.
+
+    FastJSONRenderer serializes attrs classes directly. If it is disabled, they are converted to dicts.
+    """
+    if getattr(settings, "MOBISHOPPER_FAST_JSON", True):
+        return obj
+    return asdict_nested(obj)
 
 
 def asdict_drf_response(obj, status=200):
     """Create a DRF Response, based on an attrs class."""
-    return rest_framework.response.Response(attr.asdict(obj), status=status)
+    return rest_framework.response.Response(drf_data(obj), status=status)
 
 
 class PageNumberIncludedPagination(rest_framework.pagination.PageNumberPagination):
@@ -33,3 +73,162 @@ class PageNumberIncludedPagination(rest_framework.pagination.PageNumberPaginatio
                 ]
             )
         )
+
+
+# An ordering key: field or annotation name, descending, nullable, nulls first
+OrderKey = typing.Tuple[str, bool, bool, bool]
+
+
+def get_order_keys(queryset: QuerySet) -> typing.List[OrderKey]:
+    """Get the ordering of a queryset as keys for keyset pagination, ending with the primary key."""
+    query = queryset.query
+    meta = queryset.model._meta
+    ordering = query.order_by or (meta.ordering if query.default_ordering else ())
+    keys = []
+    for item in ordering:
+        if isinstance(item, str):
+            name, descending, nulls_first = item.lstrip("-"), item.startswith("-"), False
+        elif isinstance(item, OrderBy) and isinstance(item.expression, F):
+            name, descending, nulls_first = item.expression.name, item.descending, bool(item.nulls_first)
+        else:
+            raise ValueError(f"Unsupported ordering for keyset pagination: {item!r}")
+        if name == "pk":
+            name = meta.pk.name
+        if name in query.annotations:
+            nullable = True
+        else:
+            field = meta.get_field(name)
+            if field.is_relation:
+                raise ValueError(f"Unsupported ordering for keyset pagination: {item!r}")
+            nullable = field.null
+        keys.append((name, descending, nullable, nulls_first and nullable))
+    if not any(name == meta.pk.name for name, *_rest in keys):
+        keys.append((meta.pk.name, False, False, False))
+    return keys
+
+
+def _order_by_keys(queryset: QuerySet, keys: typing.Sequence[OrderKey]) -> QuerySet:
+    """Order a queryset by the keys, with explicit placement of nulls (which differs between databases by default)."""
+    ordering = []
+    for name, descending, nullable, nulls_first in keys:
+        if nullable:
+            ordering.append(
+                OrderBy(F(name), descending=descending, nulls_first=nulls_first, nulls_last=not nulls_first)
+            )
+        else:
+            ordering.append(OrderBy(F(name), descending=descending))
+    return queryset.order_by(*ordering)
+
+
+def _filter_after(queryset: QuerySet, keys: typing.Sequence[OrderKey], values: typing.Sequence) -> QuerySet:
+    """Filter objects that come after the object with the given key values."""
+    conditions = []
+    equal = Q()
+    for (name, descending, nullable, nulls_first), value in zip(keys, values):
+        if value is None:
+            after = Q(**{name + "__isnull": False}) if nulls_first else None
+            equal_key = Q(**{name + "__isnull": True})
+        else:
+            after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if nullable and not nulls_first:
+                after |= Q(**{name + "__isnull": True})
+            equal_key = Q(**{name: value})
+        if after is not None:
+            conditions.append(equal & after)
+        equal &= equal_key
+    if not conditions:
+        return queryset.none()
+    return queryset.filter(functools.reduce(operator.or_, conditions))
+
+
+class KeysetOrPageNumberPagination(PageNumberIncludedPagination):
+    """A paginator which uses keyset (cursor) pagination if requested, and page numbers otherwise.
+
+    Clients opt in with the cursor query parameter (empty for the first page, then the cursor from the next link).
+    Pages are found by the values of the ordering fields of the last object, so they do not need OFFSET or COUNT(*).
+    The total count is only included if requested with count=1, and it is cached.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = _("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate a queryset."""
+        self.cursor_mode = self.cursor_query_param in request.query_params and isinstance(queryset, QuerySet)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        keys = get_order_keys(queryset)
+        queryset = _order_by_keys(queryset, keys)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("1", "true"):
+            self.count = self.get_count(queryset, request)
+
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = _filter_after(queryset, keys, self.decode_cursor(queryset, keys, cursor))
+        objects = list(queryset[: page_size + 1])
+        self.next_cursor = None
+        if len(objects) > page_size:
+            objects = objects[:page_size]
+            self.next_cursor = self.encode_cursor([getattr(objects[-1], name) for name, *_rest in keys])
+        return objects
+
+    def encode_cursor(self, values: typing.Sequence) -> str:
+        """Encode the key values of an object as a cursor."""
+        return base64.urlsafe_b64encode(dumps(list(values))).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, queryset: QuerySet, keys: typing.Sequence[OrderKey], cursor: str) -> typing.List:
+        """Decode the key values from a cursor."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii") + b"=" * (-len(cursor) % 4)))
+            if not isinstance(values, list) or len(values) != len(keys):
+                raise ValueError("Wrong number of values")
+            return [
+                None if value is None else queryset.query.resolve_ref(name).output_field.to_python(value)
+                for (name, *_rest), value in zip(keys, values)
+            ]
+        except (ValueError, TypeError, django.core.exceptions.ValidationError):
+            raise rest_framework.exceptions.NotFound(self.invalid_cursor_message)
+
+    def get_count_dependencies(self, request) -> typing.List[cache.Dependency]:
+        """Get the cache namespaces the count depends on (by default, the catalog of the visited store)."""
+        return [(cache.CATALOG, get_visited_store_id(request)), (cache.REFERENCE, None)]
+
+    def get_count(self, queryset: QuerySet, request) -> int:
+        """Count the objects in a queryset (cached until the data changes or an object goes in or out of effect)."""
+        model = queryset.model
+
+        def valid_until():
+            if issubclass(model, DateRangedTrackedModel):
+                return get_next_validity_change(model._default_manager.all())
+            return None
+
+        return cache.get_or_set(
+            self.get_count_dependencies(request),
+            ["count", *cache.queryset_key_parts(queryset.order_by())],
+            queryset.count,
+            valid_until=valid_until,
+        )
+
+    def get_next_link(self):
+        """Get the link to the next page."""
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        """Get a paginated response."""
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        content = [("next", self.get_next_link())]
+        if self.count is not None:
+            content.append(("count", self.count))
+        content.append(("results", data))
+        return rest_framework.response.Response(collections.OrderedDict(content))
@@ -0,0 +1,508 @@
+"""Query-count and timing benchmarks of all API routes, run against a large synthetic dataset.
+
+The benchmarks are not part of the regular test suite. Run them with:
+
+    ./manage.py test ms_baseline.benchmarks
+
+Environment variables: MOBISHOPPER_BENCHMARK_SCALE (dataset scale factor, default 1),
+MOBISHOPPER_BENCHMARK_SEED (default 0), MOBISHOPPER_BENCHMARK_REPEAT (runs of read-only routes, default 3),
+MOBISHOPPER_BENCHMARK_OUTPUT (path of the JSON results file, default benchmark-results.json).
+"""
+import base64
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import time
+import typing
+
+import attr
+import django.utils.timezone
+from django.conf import settings
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ms_baseline import snapshots, sync
+from ms_baseline.api_utils import asdict_nested
+from ms_baseline.models import CheckoutApiKey, MsUser, Store, UserStorePermission
+from ms_baseline.renderers import FastJSONRenderer
+from ms_baseline.synthetic_data import SyntheticDataGenerator
+from ms_baseline.utils import filter_in_effect
+from ms_baseline.vue_models import MapDTO, MapTileDTO
+from ms_deals.models import Coupon, CouponSet, Deal
+from ms_maps.models import Aisle, Map, Subaisle
+from ms_products.models import Product, ProductGroup, StandardMetaField, Subcategory, Vendor
+from ms_products.serializers import ProductBasicSerializer
+from ms_userdata.models import CouponUse, ShoppingList, ShoppingListEntry, ShoppingListInvite
+
+BENCHMARKED_URLCONFS = [
+    "ms_baseline.urls_api",
+    "ms_products.urls_api",
+    "ms_deals.urls_api",
+    "ms_maps.urls_api",
+    "ms_userdata.urls_lists_api",
+    "ms_userdata.urls_checkout_api",
+]
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class BenchmarkRoute:
+    """A request to benchmark."""
+
+    name: str
+    max_queries: int
+    method: str = "get"
+    args: typing.Tuple = ()
+    # Query string (GET requests) and request body (other requests).
+    query: typing.Dict[str, typing.Any] = attr.ib(factory=dict)
+    data: typing.Any = None
+    json: bool = False
+    client: str = "user"
+
+    @property
+    def is_read_only(self) -> bool:
+        """Check if the request does not change anything, and thus can be repeated."""
+        return self.method == "get"
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class BenchmarkResult:
+    """The result of benchmarking a route."""
+
+    name: str
+    method: str
+    path: str
+    status: int
+    queries: int
+    max_queries: int
+    runs: int
+    time_ms_min: float
+    time_ms_median: float
+    time_ms_max: float
+
+
+def _get_url_names(urlconf: str) -> typing.Set[str]:
+    """Get the namespaced names of all routes in an URLconf."""
+    resolver = get_resolver(urlconf)
+    namespace = getattr(resolver.urlconf_module, "app_name", None)
+    names = set()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLPattern) and pattern.name:
+            names.add(f"{namespace}:{pattern.name}" if namespace else pattern.name)
+        elif isinstance(pattern, URLResolver):
+            names |= _get_url_names(pattern.urlconf_name)
+    return names
+
+
+class ApiQueryBenchmark(TestCase):
+    """Benchmark the query counts and timings of API routes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Generate the dataset and the objects used by the benchmarked requests."""
+        cls.scale = float(os.environ.get("MOBISHOPPER_BENCHMARK_SCALE", "1"))
+        cls.seed = int(os.environ.get("MOBISHOPPER_BENCHMARK_SEED", "0"))
+        cls.dataset = SyntheticDataGenerator(cls.scale, cls.seed).generate()
+        now = django.utils.timezone.now()
+
+        cls.store = Store.objects.order_by("id").first()
+        cls.product = Product.objects.filter(replaced_by=None, date_ended=None).order_by("id").first()
+        cls.old_product = Product.objects.exclude(replaced_by=None).order_by("id").first()
+        cls.vendor = Vendor.objects.order_by("id").first()
+        cls.group = ProductGroup.objects.order_by("id").first()
+        cls.subcategory = Subcategory.objects.order_by("id").first()
+        cls.meta_field = StandardMetaField.objects.filter(expected_units="weight").order_by("id").first()
+        cls.aisle = Aisle.objects.filter(store=cls.store).order_by("id").first()
+        cls.subaisle = Subaisle.objects.filter(store=cls.store).order_by("id").first()
+        cls.map = Map.objects.get(store=cls.store)
+        cls.location_product_ids = list(
+            cls.store.productlocation_set.order_by("id").values_list("product_id", flat=True)[:20]
+        )
+
+        cls.user = MsUser.objects.create_user(
+            "benchmark@synthetic.invalid", "benchmark", first_name="Bench", last_name="Mark", default_store=cls.store
+        )
+        cls.member = MsUser.objects.create_user(
+            "member@synthetic.invalid", "benchmark", first_name="List", last_name="Member", default_store=cls.store
+        )
+        cls.manager = MsUser.objects.create_user(
+            "manager@synthetic.invalid", "benchmark", first_name="Store", last_name="Manager", is_manager=True
+        )
+        UserStorePermission(
+            user=cls.manager,
+            store=cls.store,
+            can_manage_deals=True,
+            can_manage_employees=True,
+            can_view_statistics=True,
+        ).save()
+
+        products = list(Product.objects.filter(replaced_by=None, date_ended=None).order_by("id")[:85])
+        cls.lists = []
+        for i in range(3):
+            shopping_list = ShoppingList(name=f"Benchmark list {i + 1}", user=cls.user, store=cls.store)
+            shopping_list.save()
+            for j, product in enumerate(products[i * 20 : (i + 1) * 20]):
+                ShoppingListEntry(
+                    list=shopping_list, product=product, amount=j % 3 + 1, bought=j % 4 == 0, user=cls.user
+                ).save()
+            shopping_list.shared_with.add(cls.member)
+            cls.lists.append(shopping_list)
+        ShoppingListEntry(list=cls.lists[0], product=cls.old_product, amount=1, user=cls.user).save()
+        # A recipe added to the second list in one batch, with some of its entries bought or removed
+        cls.batch_operations = [{"op": "add", "product": p.id, "amount": 2} for p in products[60:85]]
+        cls.batch_operations += [{"op": "bought", "product": p.id} for p in products[20:25]]
+        cls.batch_operations += [{"op": "delete", "product": p.id} for p in products[25:30]]
+        cls.invite = ShoppingListInvite(list=cls.lists[0], email="invitee@synthetic.invalid")
+        cls.invite.save()
+
+        valid_until = now + datetime.timedelta(days=1)
+        cls.coupon = Coupon(
+            name="Benchmark coupon", product=cls.product, price=1, is_global=True, one_use=False, date_started=now
+        )
+        cls.coupon.save()
+        cls.coupon_set = CouponSet(name="Benchmark coupon set", is_global=True, one_use=False, date_started=now)
+        cls.coupon_set.save()
+        cls.coupon_set.coupons.add(cls.coupon)
+        cls.api_key = CheckoutApiKey(name="Benchmark register", store=cls.store)
+        cls.api_key.save()
+        cls.coupon_use = CouponUse(user=cls.user, store=cls.store, coupon=cls.coupon, valid_until=valid_until)
+        cls.coupon_use.save()
+        cls.refresh_token = str(RefreshToken.for_user(cls.user))
+
+    def setUp(self):
+        """Set up clients, and build the catalog snapshot of the store (in a temporary media directory)."""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        snapshots.update_snapshot(self.store)
+
+        store_header = {"HTTP_X_MS_STORE": str(self.store.id)}
+        self.clients = {
+            "anonymous": Client(**store_header),
+            "user": Client(**store_header),
+            "member": Client(**store_header),
+            "manager": Client(),
+            "checkout": Client(HTTP_X_MS_CHECKOUT_API_KEY=str(self.api_key.key)),
+        }
+        self.clients["user"].force_login(self.user)
+        self.clients["member"].force_login(self.member)
+        self.clients["manager"].force_login(self.manager)
+        session = self.clients["manager"].session
+        session["store"] = self.store.id
+        session.save()
+
+    def get_routes(self) -> typing.List[BenchmarkRoute]:
+        """Get the benchmarked requests. Read-only requests go first, as the others change the dataset.
+
+        The query budgets reflect the current state of each route. Lower them when a route is optimized.
+        """
+        lists = self.lists
+        coupon_code = base64.b64encode(
+            f"c.{self.coupon.uuid}.{self.user.id}.{self.coupon_use.uuid}".encode("utf-8")
+        ).decode("ascii")
+        map_save_request = {
+            "map": attr.asdict(MapDTO.from_db(self.map)),
+            "tiles": [attr.asdict(MapTileDTO.from_db(t)) for t in self.map.tiles.all()],
+            "date": django.utils.timezone.now().isoformat(),
+        }
+        return [
+            # ms_baseline
+            BenchmarkRoute(name="ms_baseline_api:api_list_stores", max_queries=2, client="anonymous"),
+            BenchmarkRoute(name="ms_baseline_api:api_whoami", max_queries=3),
+            BenchmarkRoute(name="ms_baseline_api:profile", max_queries=3),
+            BenchmarkRoute(name="ms_baseline_api:api_sync", max_queries=12),
+            BenchmarkRoute(
+                name="ms_baseline_api:api_sync",
+                max_queries=11,
+                query={"token": sync.make_token(self.store.id, django.utils.timezone.now())},
+            ),
+            BenchmarkRoute(name="ms_baseline_api:api_snapshot", max_queries=5),
+            # ms_products
+            BenchmarkRoute(name="ms_products_api:standard_meta_fields", max_queries=7, client="manager"),
+            BenchmarkRoute(
+                name="ms_products_api:standard_meta_fields_subcategory",
+                max_queries=7,
+                client="manager",
+                args=(self.subcategory.id,),
+            ),
+            BenchmarkRoute(name="ms_products_api:products_modal", max_queries=23, client="manager"),
+            BenchmarkRoute(
+                name="ms_products_api:products_modal", max_queries=24, client="manager", query={"q": "product 12"}
+            ),
+            BenchmarkRoute(name="ms_products_api:vendors_modal", max_queries=8, client="manager"),
+            BenchmarkRoute(name="ms_products_api:groups_modal", max_queries=8, client="manager"),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=8),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=8, query={"page": 3}),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=8, query={"unit": "kg", "order": "unit_price"}),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=7, query={"cursor": ""}),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=8, query={"q": "product 12"}),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=9, query={"cursor": "", "count": 1}),
+            BenchmarkRoute(name="ms_products_api:products_details", max_queries=7, args=(self.product.id,)),
+            BenchmarkRoute(name="ms_products_api:categories_structure", max_queries=6),
+            BenchmarkRoute(name="ms_products_api:subcategories_list", max_queries=5),
+            BenchmarkRoute(name="ms_products_api:subcategories_best_value", max_queries=9, args=(self.subcategory.id,)),
+            BenchmarkRoute(name="ms_products_api:subcategories_properties", max_queries=6, args=(self.subcategory.id,)),
+            BenchmarkRoute(
+                name="ms_products_api:subcategories_properties",
+                max_queries=7,
+                args=(self.subcategory.id,),
+                query={f"prop.{self.meta_field.slug}.min": "100 g"},
+            ),
+            BenchmarkRoute(
+                name="ms_products_api:products",
+                max_queries=9,
+                query={f"prop.{self.meta_field.slug}.min": "100 g"},
+            ),
+            BenchmarkRoute(name="ms_products_api:products", max_queries=11, query={"facets": "1"}),
+            BenchmarkRoute(
+                name="ms_products_api:products",
+                max_queries=11,
+                query={"facets": "1", "subcategories": str(self.subcategory.id)},
+            ),
+            BenchmarkRoute(name="ms_products_api:vendors_list", max_queries=6),
+            BenchmarkRoute(name="ms_products_api:vendors_details", max_queries=5, args=(self.vendor.id,)),
+            BenchmarkRoute(name="ms_products_api:vendors_products_list", max_queries=7, args=(self.vendor.id,)),
+            BenchmarkRoute(name="ms_products_api:productgroups_list", max_queries=8),
+            BenchmarkRoute(name="ms_products_api:productgroups_list", max_queries=10, query={"facets": "1"}),
+            BenchmarkRoute(name="ms_products_api:productgroups_list", max_queries=8, query={"name": "group 1"}),
+            BenchmarkRoute(name="ms_products_api:productgroups_details", max_queries=7, args=(self.group.id,)),
+            BenchmarkRoute(
+                name="ms_products_api:bulk_find_products",
+                max_queries=10,
+                query={"product": [self.old_product.id] + self.location_product_ids},
+            ),
+            # ms_deals
+            BenchmarkRoute(name="ms_deals_api:coupons_modal", max_queries=23, client="manager"),
+            BenchmarkRoute(name="ms_deals_api:deals_all", max_queries=12),
+            BenchmarkRoute(name="ms_deals_api:deals_list", max_queries=8),
+            BenchmarkRoute(name="ms_deals_api:deals_list", max_queries=7, query={"cursor": ""}),
+            BenchmarkRoute(name="ms_deals_api:deals_details", max_queries=6, args=(self._first_deal_id(),)),
+            BenchmarkRoute(name="ms_deals_api:coupons_list", max_queries=7),
+            BenchmarkRoute(name="ms_deals_api:coupons_list", max_queries=8, query={"cursor": "", "count": 1}),
+            BenchmarkRoute(name="ms_deals_api:coupons_usable", max_queries=4, args=(self.coupon.id,)),
+            BenchmarkRoute(name="ms_deals_api:coupon_sets_list", max_queries=8),
+            BenchmarkRoute(name="ms_deals_api:coupon_sets_usable", max_queries=4, args=(self.coupon_set.id,)),
+            # ms_maps
+            BenchmarkRoute(name="ms_maps_api:get_map", max_queries=510),
+            BenchmarkRoute(name="ms_maps_api:aisles_structure", max_queries=7),
+            BenchmarkRoute(name="ms_maps_api:aisles_add", max_queries=6, client="manager"),
+            BenchmarkRoute(name="ms_maps_api:aisles_edit", max_queries=8, client="manager", args=(self.aisle.id,)),
+            BenchmarkRoute(name="ms_maps_api:subaisles_add", max_queries=9, client="manager"),
+            BenchmarkRoute(
+                name="ms_maps_api:subaisles_edit", max_queries=12, client="manager", args=(self.subaisle.id,)
+            ),
+            BenchmarkRoute(
+                name="ms_maps_api:product_locations_bulk", max_queries=7, query={"product": self.location_product_ids}
+            ),
+            BenchmarkRoute(
+                name="ms_maps_api:product_locations_product", max_queries=7, args=(self.location_product_ids[0],)
+            ),
+            BenchmarkRoute(name="ms_maps_api:maps_current", max_queries=7),
+            BenchmarkRoute(name="ms_maps_api:product_locations", max_queries=115, client="manager"),
+            BenchmarkRoute(name="ms_maps_api:product_locations_groups", max_queries=510, client="manager"),
+            # ms_userdata (lists)
+            BenchmarkRoute(name="ms_userdata_api:lists_list", max_queries=9),
+            BenchmarkRoute(name="ms_userdata_api:lists_detail", max_queries=18, args=(lists[0].id,)),
+            BenchmarkRoute(name="ms_userdata_api:lists_entry", max_queries=16, args=(lists[0].id, self.product.id)),
+            BenchmarkRoute(name="ms_userdata_api:lists_invites_list", max_queries=6, args=(lists[0].id,)),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_invites_detail", max_queries=6, args=(lists[0].id, self.invite.id)
+            ),
+            BenchmarkRoute(name="ms_userdata_api:lists_members", max_queries=6, args=(lists[0].id,)),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_invite_details_accept",
+                max_queries=6,
+                client="member",
+                args=(self.invite.id,),
+            ),
+            # Requests that change data.
+            BenchmarkRoute(
+                name="ms_baseline_api:token_obtain_pair",
+                max_queries=2,
+                method="post",
+                client="anonymous",
+                data={"email": self.user.email, "password": "benchmark"},
+            ),
+            BenchmarkRoute(
+                name="ms_baseline_api:token_refresh",
+                max_queries=1,
+                method="post",
+                client="anonymous",
+                data={"refresh": self.refresh_token},
+            ),
+            BenchmarkRoute(
+                name="ms_baseline_api:register",
+                max_queries=2,
+                method="post",
+                client="anonymous",
+                json=True,
+                data={
+                    "email": "registered@synthetic.invalid",
+                    "password": "benchmark",
+                    "repeat_password": "benchmark",
+                    "first_name": "New",
+                    "last_name": "User",
+                    "default_store_id": self.store.id,
+                },
+            ),
+            BenchmarkRoute(
+                name="ms_baseline_api:api_default_store", max_queries=4, method="post", data={"store": self.store.id}
+            ),
+            BenchmarkRoute(name="ms_deals_api:coupons_details", max_queries=7, method="post", args=(self.coupon.id,)),
+            BenchmarkRoute(
+                name="ms_deals_api:coupon_sets_details", max_queries=9, method="post", args=(self.coupon_set.id,)
+            ),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_entry",
+                max_queries=18,
+                method="post",
+                json=True,
+                args=(lists[1].id, self.product.id),
+                data={"amount": 2, "bought": True},
+            ),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_entries_batch",
+                max_queries=25,
+                method="post",
+                json=True,
+                args=(lists[1].id,),
+                data={"operations": self.batch_operations},
+            ),
+            BenchmarkRoute(name="ms_userdata_api:lists_share", max_queries=5, method="post", args=(lists[1].id,)),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_clean_done_items", max_queries=96, method="post", args=(lists[2].id,)
+            ),
+            BenchmarkRoute(
+                name="ms_userdata_api:lists_members_remove",
+                max_queries=8,
+                method="delete",
+                args=(lists[2].id, self.member.id),
+            ),
+            BenchmarkRoute(
+                name="ms_userdata_checkout_api:checkout_coupon",
+                max_queries=10,
+                method="post",
+                client="checkout",
+                json=True,
+                data={"code": coupon_code},
+            ),
+            BenchmarkRoute(
+                name="ms_maps_api:maps_save",
+                max_queries=530,
+                method="post",
+                client="manager",
+                json=True,
+                data=map_save_request,
+            ),
+        ]
+
+    def _first_deal_id(self) -> int:
+        """Get the ID of a deal visible in the benchmarked store."""
+        return Deal.objects.filter(filter_in_effect(), is_global=True).order_by("id").values_list("id", flat=True)[0]
+
+    def _run(self, route: BenchmarkRoute) -> BenchmarkResult:
+        """Benchmark a route."""
+        client = self.clients[route.client]
+        path = reverse(route.name, args=route.args)
+        runs = int(os.environ.get("MOBISHOPPER_BENCHMARK_REPEAT", "3")) if route.is_read_only else 1
+        request_method = getattr(client, route.method)
+        if route.is_read_only:
+            request_args = {"data": route.query}
+        elif route.json:
+            request_args = {"data": json.dumps(route.data), "content_type": "application/json"}
+        else:
+            request_args = {"data": route.data}
+
+        timings = []
+        queries = 0
+        status = 0
+        for _i in range(max(1, runs)):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request_method(path, **request_args)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(captured.captured_queries))
+            status = response.status_code
+
+        return BenchmarkResult(
+            name=route.name,
+            method=route.method.upper(),
+            path=path,
+            status=status,
+            queries=queries,
+            max_queries=route.max_queries,
+            runs=len(timings),
+            time_ms_min=min(timings),
+            time_ms_median=statistics.median(timings),
+            time_ms_max=max(timings),
+        )
+
+    def _benchmark_renderers(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """Compare the time of rendering typical payloads with the standard DRF renderer and with FastJSONRenderer."""
+        runs = int(os.environ.get("MOBISHOPPER_BENCHMARK_REPEAT", "3"))
+        tiles = list(self.map.tiles.all())
+        products = Product.objects.filter(replaced_by=None, date_ended=None).order_by("id")[:100]
+        payloads = {
+            "map": {"map": MapDTO.from_db(self.map), "tiles": [MapTileDTO.from_db(t) for t in tiles]},
+            "products": ProductBasicSerializer(products, many=True, context={"store_id": self.store.id}).data,
+        }
+        renderers = {
+            "standard": lambda data: JSONRenderer().render(asdict_nested(data)),
+            "fast": lambda data: FastJSONRenderer().render(data),
+        }
+        results = {}
+        for payload_name, payload in payloads.items():
+            for renderer_name, render in renderers.items():
+                timings = []
+                for _i in range(max(1, runs)):
+                    start = time.perf_counter()
+                    render(payload)
+                    timings.append((time.perf_counter() - start) * 1000)
+                results[f"{payload_name}/{renderer_name}"] = {
+                    "time_ms_min": min(timings),
+                    "time_ms_median": statistics.median(timings),
+                }
+        return results
+
+    def test_all_routes_benchmarked(self):
+        """Test that every route of the API URLconfs has a benchmark."""
+        benchmarked = {route.name for route in self.get_routes()}
+        for urlconf in BENCHMARKED_URLCONFS:
+            for name in _get_url_names(urlconf):
+                with self.subTest(name=name):
+                    self.assertIn(name, benchmarked)
+
+    def test_query_counts(self):
+        """Run all requests, check their query counts against the budgets, and write the results to a file."""
+        results = []
+        for route in self.get_routes():
+            with self.subTest(name=route.name, method=route.method.upper(), args=route.args):
+                result = self._run(route)
+                results.append(result)
+                self.assertLess(result.status, 400)
+                self.assertLessEqual(result.queries, route.max_queries)
+
+        output = os.environ.get(
+            "MOBISHOPPER_BENCHMARK_OUTPUT", os.path.join(settings.BASE_DIR, "benchmark-results.json")
+        )
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "date": django.utils.timezone.now().isoformat(),
+                    "database": connection.vendor,
+                    "scale": self.scale,
+                    "seed": self.seed,
+                    "dataset": self.dataset,
+                    "results": [attr.asdict(r) for r in results],
+                    "renderers": self._benchmark_renderers(),
+                },
+                fh,
+                indent=2,
+            )
@@ -0,0 +1,27 @@
+"""Helpers for bulk writes."""
+import typing
+
+from django.db import connections, models, router
+from django.db.models import Max
+
+BATCH_SIZE = 500
+
+
+def can_bulk_create_with_pks(model: typing.Type[models.Model]) -> bool:
+    """Check if objects of a model can be created in bulk with known primary keys.
+
+    The keys are returned by the database on PostgreSQL. On SQLite, explicit keys are assigned, which is safe because
+    SQLite allows only one writer at a time.
+    """
+    connection = connections[router.db_for_write(model)]
+    return connection.features.can_return_rows_from_bulk_insert or connection.vendor == "sqlite"
+
+
+def bulk_create_with_pks(model: typing.Type[models.Model], objects: typing.List[models.Model]):
+    """Create objects in bulk, making sure their primary keys are known (see can_bulk_create_with_pks)."""
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        next_id = (model._default_manager.aggregate(max_id=Max("pk"))["max_id"] or 0) + 1
+        for i, obj in enumerate(objects):
+            obj.pk = next_id + i
+    model._default_manager.bulk_create(objects, batch_size=BATCH_SIZE)
@@ -0,0 +1,205 @@
+"""Versioned application cache, with generation counters that are bumped when the underlying data changes.
+
+Cache keys include the generations of their namespace. Bumping a generation makes all keys that used the old one
+unreachable (they expire on their own), so no key needs to be deleted explicitly. This works with any Django cache
+backend that is shared by all processes that write to the database: locmem (single process), file-based (single
+node), or memcached/Redis (multiple nodes).
+
+Namespaces:
+
+* CATALOG — products, overrides and deals. Scoped by store; the global scope (None) is a part of every store’s key,
+  so global changes invalidate all stores.
+* REFERENCE — reference data (categories, subcategories, properties, stores).
+* MAP — maps, aisles and product locations. Scoped by store.
+
+A value can depend on more than one namespace (e.g. an aisle structure depends on the map of a store and on the
+reference data). A value that depends on the data of all stores (e.g. product counts) uses the ANY_SCOPE scope, which
+is bumped by changes in every scope.
+"""
+import datetime
+import hashlib
+import logging
+import re
+import time
+import typing
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction
+from django.utils import timezone
+
+logger = logging.getLogger("ms_baseline.cache")
+
+CATALOG = "catalog"
+REFERENCE = "reference"
+MAP = "map"
+NAMESPACES = (CATALOG, REFERENCE, MAP)
+ANY_SCOPE = "any"
+# The root generation is a part of every key. It is bumped by invalidate_all().
+_ROOT = "root"
+
+_MISSING = object()
+# A datetime query parameter as a string, up to the minute
+_DATETIME_PARAM_RE = re.compile(r"^(\d{4}-\d\d-\d\d[ T]\d\d:\d\d):\d\d(?:\.\d+)?(?:[+-]\d\d:\d\d|Z)?$")
+
+Scope = typing.Union[int, str, None]
+ScopeFunc = typing.Callable[[models.Model], typing.Optional[int]]
+# A (namespace, scope) pair
+Dependency = typing.Tuple[str, Scope]
+
+
+def get_cache():
+    """Get the cache backend used by MobiShopper."""
+    return caches[getattr(settings, "MOBISHOPPER_CACHE_ALIAS", "default")]
+
+
+def is_enabled() -> bool:
+    """Check if the application cache is enabled."""
+    return getattr(settings, "MOBISHOPPER_CACHE_ENABLED", True)
+
+
+def _generation_key(namespace: str, scope: Scope) -> str:
+    """Get the cache key of a generation counter."""
+    return f"ms:gen:{namespace}:{'global' if scope is None else scope}"
+
+
+def _initial_generation() -> int:
+    """Get a value for a generation counter that was lost (evicted), which is higher than any value used before."""
+    return time.time_ns() // 1000
+
+
+def get_generations(keys: typing.Sequence[Dependency]) -> typing.List[int]:
+    """Get the current generations of (namespace, scope) pairs."""
+    cache = get_cache()
+    cache_keys = [_generation_key(namespace, scope) for namespace, scope in keys]
+    generations = cache.get_many(cache_keys)
+    for key in cache_keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), timeout=None)
+            generations[key] = cache.get(key, 0)
+    return [generations[key] for key in cache_keys]
+
+
+def get_generation(namespace: str, scope: Scope = None) -> int:
+    """Get the current generation of a namespace."""
+    return get_generations([(namespace, scope)])[0]
+
+
+def bump_generation(namespace: str, scope: Scope = None):
+    """Bump the generation of a namespace, invalidating all cached values that depend on it."""
+    cache = get_cache()
+    keys = [_generation_key(namespace, scope)]
+    if scope is not None and scope != ANY_SCOPE:
+        keys.append(_generation_key(namespace, ANY_SCOPE))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter does not exist (yet, or anymore).
+            cache.set(key, _initial_generation(), timeout=None)
+
+
+def bump_generation_on_commit(namespace: str, scope: Scope = None):
+    """Bump the generation of a namespace immediately, and again after the current transaction commits.
+
+    Other requests could cache data from before the change until the transaction commits.
+    """
+    bump_generation(namespace, scope)
+    transaction.on_commit(lambda: bump_generation(namespace, scope))
+
+
+def invalidate_all():
+    """Invalidate all cached values (e.g. after bulk changes that do not send model signals)."""
+    bump_generation_on_commit(_ROOT)
+
+
+def make_key(dependencies: typing.Sequence[Dependency], *parts) -> str:
+    """Build a versioned cache key for a value that depends on some namespaces."""
+    keys = [(_ROOT, None)]
+    for namespace, scope in dependencies:
+        keys.append((namespace, None))
+        if scope is not None:
+            keys.append((namespace, scope))
+    keys = list(dict.fromkeys(keys))
+    generations = get_generations(keys)
+    namespace, scope = dependencies[0]
+    digest = hashlib.sha1(repr((dependencies, parts)).encode("utf-8")).hexdigest()
+    return f"ms:{namespace}:{'global' if scope is None else scope}:{'.'.join(map(str, generations))}:{digest}"
+
+
+def _truncate_datetime(param):
+    """Truncate a datetime query parameter (a datetime, or a string on some databases) to the minute."""
+    if isinstance(param, datetime.datetime):
+        return param.replace(second=0, microsecond=0)
+    if isinstance(param, str):
+        match = _DATETIME_PARAM_RE.match(param)
+        if match:
+            return match.group(1)
+    return param
+
+
+def queryset_key_parts(queryset) -> typing.List:
+    """Get cache key parts that identify the results of a queryset.
+
+    Datetime parameters (e.g. the current time in filters of objects in effect) are truncated to the minute, so that
+    the key does not change on every request. Values that depend on the current time must use valid_until.
+    """
+    sql, params = queryset.query.sql_with_params()
+    return [queryset.db, sql, [_truncate_datetime(param) for param in params]]
+
+
+def get_or_set(
+    dependencies: typing.Sequence[Dependency],
+    parts: typing.Sequence,
+    compute: typing.Callable[[], typing.Any],
+    timeout=_MISSING,
+    valid_until: typing.Optional[typing.Callable[[], typing.Optional[datetime.datetime]]] = None,
+):
+    """Get a cached value, or compute and cache it.
+
+    The valid_until function is called after a value is computed. It returns the date of the next change that does not
+    send a signal (e.g. an object going in effect), or None. The value is not cached past that date.
+    """
+    if not is_enabled():
+        return compute()
+    if timeout is _MISSING:
+        timeout = getattr(settings, "MOBISHOPPER_CACHE_TIMEOUT", 3600)
+    cache = get_cache()
+    key = make_key(dependencies, *parts)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        expiry = valid_until() if valid_until else None
+        if expiry is not None:
+            seconds_left = max(0, int((expiry - timezone.now()).total_seconds()))
+            timeout = seconds_left if timeout is None else min(timeout, seconds_left)
+        if timeout != 0:
+            cache.set(key, value, timeout=timeout)
+    return value
+
+
+def invalidate_on_change(namespace: str, *senders: typing.Type[models.Model], scope: typing.Optional[ScopeFunc] = None):
+    """Bump the generation of a namespace whenever an object of one of the models is saved or deleted.
+
+    The scope function returns the scope of the generation to bump (e.g. the store ID of the object), or None for the
+    global scope.
+    """
+
+    def receiver(sender, instance, action=None, **kwargs):
+        if not is_enabled() or (action is not None and not action.startswith("post_")):
+            return
+        try:
+            instance_scope = scope(instance) if scope else None
+        except Exception:
+            logger.exception(f"Failed to get the cache scope of {sender} #{instance.pk}")
+            instance_scope = None
+        bump_generation_on_commit(namespace, instance_scope)
+
+    for sender in senders:
+        uid = f"ms_baseline.cache:{namespace}:{sender._meta.label}"
+        models.signals.post_save.connect(receiver, sender=sender, weak=False, dispatch_uid=uid)
+        models.signals.post_delete.connect(receiver, sender=sender, weak=False, dispatch_uid=uid)
+        for field in sender._meta.local_many_to_many:
+            models.signals.m2m_changed.connect(
+                receiver, sender=field.remote_field.through, weak=False, dispatch_uid=f"{uid}:{field.name}"
+            )
@@ -0,0 +1,92 @@
+"""Conditional GET support: ETags derived from the state of the tables a view reads."""
+import functools
+import hashlib
+import typing
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, DateTimeField, IntegerField, Max, Q, Value
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from ms_baseline.models import DateRangedTrackedModel
+from ms_baseline.utils import filter_given_store, get_resolved_store, get_visited_store_id
+
+StoreIdFunc = typing.Callable[[typing.Any], typing.Optional[int]]
+
+
+def get_resolved_store_id(request) -> typing.Optional[int]:
+    """Get the ID of the resolved store for this request."""
+    store = get_resolved_store(request)
+    return store.id if store else None
+
+
+def _table_state_queryset(index: int, model: typing.Type[models.Model], store_id, when):
+    """Build a single-row queryset that describes the state of a table.
+
+    The state consists of the row count (which catches deletions), the last modification date, and for date-ranged
+    models, the last validity start/end that has passed (which catches objects going in and out of effect).
+    """
+    queryset = model._default_manager.order_by()
+    if store_id and any(f.name == "store" for f in model._meta.concrete_fields):
+        queryset = queryset.filter(filter_given_store(store_id))
+    if issubclass(model, DateRangedTrackedModel):
+        started = Max("date_started", filter=Q(date_started__lte=when), output_field=DateTimeField())
+        ended = Max("date_ended", filter=Q(date_ended__lte=when), output_field=DateTimeField())
+    else:
+        started = ended = Value(None, output_field=DateTimeField())
+    return (
+        queryset.annotate(index=Value(index, output_field=IntegerField()))
+        .values("index")
+        .annotate(count=Count("pk"), modified=Max("date_modified"), started=started, ended=ended)
+        .values_list("index", "count", "modified", "started", "ended")
+    )
+
+
+def get_table_states(watched_models: typing.Sequence[typing.Type[models.Model]], store_id) -> typing.List[tuple]:
+    """Get the states of the watched tables (in a single query)."""
+    when = timezone.now()
+    querysets = [_table_state_queryset(i, model, store_id, when) for i, model in enumerate(watched_models)]
+    return sorted(querysets[0].union(*querysets[1:], all=True))
+
+
+def compute_etag(request, watched_models: typing.Sequence[typing.Type[models.Model]], store_id) -> str:
+    """Compute an ETag for a request, based on the state of the watched tables (in a single query)."""
+    states = get_table_states(watched_models, store_id)
+    key = repr([request.get_full_path(), store_id, getattr(request, "LANGUAGE_CODE", None), states])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def conditional_on(*watched_models: typing.Type[models.Model], store_id_func: StoreIdFunc = get_visited_store_id):
+    """Decorate a view to answer conditional GET requests with 304 Not Modified if the watched tables did not change.
+
+    The view must not depend on any other data than the watched tables, the URL and the store. Changes made with
+    QuerySet.update() that do not touch date_modified, and changes to many-to-many relations, are not detected.
+
+    Responses vary on the X-MS-Store header. If store_id_func can also take the store from the user (their default
+    store, or the store of their session) and the header was not sent, they vary on Cookie and Authorization as well.
+    """
+    watched_models = tuple(watched_models)
+    store_from_user = store_id_func is not get_visited_store_id
+
+    def etag_func(request, *args, **kwargs):
+        if not getattr(settings, "MOBISHOPPER_CONDITIONAL_GET", True):
+            return None
+        return compute_etag(request, watched_models, store_id_func(request))
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @functools.wraps(view_func)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            vary = ["X-MS-Store"]
+            if store_from_user and not get_visited_store_id(request):
+                vary += ["Cookie", "Authorization"]
+            patch_vary_headers(response, vary)
+            return response
+
+        return inner
+
+    return decorator
@@ -0,0 +1,26 @@
+"""The buildsnapshots command."""
+
+from django.core.management.base import BaseCommand
+
+from ms_baseline import snapshots
+from ms_baseline.models import Store
+
+
+class Command(BaseCommand):
+    """Implement the buildsnapshots command, which updates the catalog snapshots of stores."""
+
+    help = "Build the catalog snapshots of stores whose data changed since their latest snapshot."
+
+    def add_arguments(self, parser):
+        """Add arguments to the command."""
+        parser.add_argument("stores", nargs="*", type=int, help="IDs of stores (all stores by default)")
+        parser.add_argument("--force", action="store_true", help="Rebuild snapshots even if nothing changed")
+
+    def handle(self, *args, **options):
+        """Update the snapshots."""
+        stores = Store.objects.order_by("id")
+        if options["stores"]:
+            stores = stores.filter(id__in=options["stores"])
+        for store in stores:
+            snapshot = snapshots.update_snapshot(store, options["force"])
+            self.stdout.write(f"{store}: {snapshot.content_hash} ({snapshot.size} bytes)")
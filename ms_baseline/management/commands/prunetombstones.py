@@ -0,0 +1,16 @@
+"""The prunetombstones command."""
+
+from django.core.management.base import BaseCommand
+
+from ms_baseline import sync
+
+
+class Command(BaseCommand):
+    """Implement the prunetombstones command, which deletes tombstones of the delta sync that are no longer needed."""
+
+    help = "Delete tombstones older than MOBISHOPPER_SYNC_TOMBSTONE_DAYS."
+
+    def handle(self, *args, **options):
+        """Delete old tombstones."""
+        count = sync.prune_tombstones()
+        self.stdout.write(f"{count} tombstones deleted")
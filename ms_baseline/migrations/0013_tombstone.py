@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_baseline', '0012_checkoutapikey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='model')),
+                ('object_id', models.IntegerField(verbose_name='object ID')),
+                ('store_id', models.IntegerField(blank=True, null=True, verbose_name='store ID')),
+                ('date_deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date deleted')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['date_deleted', 'id'], name='ms_baseline_date_de_e51bc7_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_baseline', '0013_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='content hash')),
+                ('state', models.CharField(max_length=40, verbose_name='state')),
+                ('file', models.FileField(max_length=200, upload_to='', verbose_name='file')),
+                ('size', models.PositiveIntegerField(verbose_name='size')),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date created')),
+                ('date_checked', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date checked')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ms_baseline.store', verbose_name='store')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='catalogsnapshot',
+            index=models.Index(fields=['store', 'date_checked'], name='ms_baseline_store_i_ee1e80_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogsnapshot',
+            constraint=models.UniqueConstraint(fields=('store', 'content_hash'), name='unique_snapshot_content'),
+        ),
+    ]
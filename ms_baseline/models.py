@@ -10,14 +10,14 @@ from django.contrib import messages
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, lookups
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from ms_baseline import constants
+from ms_baseline import cache, constants
 
 logger = logging.getLogger("ms_baseline.models")
 
@@ -71,11 +71,79 @@ class DateTrackedModel(BaseModel):
         abstract = True
 
 
+# Open validity bounds are stored as sentinel dates instead of NULLs, so that “in effect at T” checks are plain
+# range conditions (date_started <= T < date_ended) that can use indexes.
+VALIDITY_START_SENTINEL = datetime.datetime(1900, 1, 1, tzinfo=datetime.timezone.utc)
+VALIDITY_END_SENTINEL = datetime.datetime(9999, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class ValidityBoundField(models.DateTimeField):
+    """A date/time field for a validity bound, which stores None as a sentinel date.
+
+    Python code (and the API) sees None for open bounds. Lookups for None (and isnull lookups) are translated to
+    comparisons with the sentinel.
+    """
+
+    def __init__(self, *args, bound: str = "start", **kwargs):
+        """Initialize the field (bound is either "start" or "end")."""
+        if bound not in ("start", "end"):
+            raise ValueError(f"Invalid validity bound: {bound}")
+        self.bound = bound
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        """Deconstruct the field for migrations."""
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["bound"] = self.bound
+        return name, path, args, kwargs
+
+    @property
+    def sentinel(self) -> datetime.datetime:
+        """Get the date that represents an open bound in the database."""
+        sentinel = VALIDITY_START_SENTINEL if self.bound == "start" else VALIDITY_END_SENTINEL
+        if not settings.USE_TZ:
+            return timezone.make_naive(sentinel, datetime.timezone.utc)
+        return sentinel
+
+    def get_prep_value(self, value):
+        """Convert None to the sentinel."""
+        if value is None:
+            value = self.sentinel
+        return super().get_prep_value(value)
+
+    def from_db_value(self, value, expression, connection):
+        """Convert the sentinel to None."""
+        if value is None:
+            return None
+        sentinel = self.sentinel
+        if timezone.is_aware(value) != timezone.is_aware(sentinel):
+            sentinel = sentinel.replace(tzinfo=value.tzinfo)
+        return None if value == sentinel else value
+
+
+@ValidityBoundField.register_lookup
+class ValidityBoundIsNull(lookups.IsNull):
+    """An isnull lookup for validity bounds, which compares with the sentinel."""
+
+    def as_sql(self, compiler, connection):
+        """Compile the lookup."""
+        if not isinstance(self.rhs, bool):
+            raise ValueError("The QuerySet value for an isnull lookup must be True or False.")
+        sentinel = self.lhs.output_field.sentinel
+        if self.rhs:
+            lookup = lookups.Exact(self.lhs, sentinel)
+        elif self.lhs.output_field.bound == "start":
+            lookup = lookups.GreaterThan(self.lhs, sentinel)
+        else:
+            lookup = lookups.LessThan(self.lhs, sentinel)
+        return lookup.as_sql(compiler, connection)
+
+
 class DateRangedTrackedModel(DateTrackedModel):
     """Abstract model with a start/end date."""
 
-    date_started = models.DateTimeField(_("valid from"), null=True, blank=True)
-    date_ended = models.DateTimeField(_("valid until"), null=True, blank=True)
+    date_started = ValidityBoundField(_("valid from"), null=True, blank=True, bound="start")
+    date_ended = ValidityBoundField(_("valid until"), null=True, blank=True, bound="end")
 
     REVISION_MIGRATIONS: typing.List[typing.Tuple[typing.Type["DateRangedTrackedModel"], str]] = []
 
@@ -105,6 +173,8 @@ class DateRangedTrackedModel(DateTrackedModel):
         if not success:
             return False
 
+        if isinstance(self, RevisionedModel) and isinstance(old_obj, RevisionedModel):
+            self.lineage = old_obj.lineage
         if quiet:
             self.save_with_error_message(request)
         else:
@@ -128,6 +198,20 @@ class DateRangedTrackedModel(DateTrackedModel):
 
     def migrate_with_revision(self, request, old_obj: "DateRangedTrackedModel"):
         """Migrate an object from old_obj to self, based on the list of REVISION_MIGRATIONS."""
+        from ms_baseline.revisions import bulk_migrate_revisions, can_migrate_in_bulk
+
+        if can_migrate_in_bulk(type(self)):
+            try:
+                bulk_migrate_revisions(self, old_obj)
+                return
+            except Exception:
+                logger.exception(
+                    f"Bulk migration of {self} ({self.__class__} #{self.id}) failed, migrating objects one by one."
+                )
+        self.migrate_with_revision_per_row(request, old_obj)
+
+    def migrate_with_revision_per_row(self, request, old_obj: "DateRangedTrackedModel"):
+        """Migrate an object from old_obj to self, saving dependent objects one by one."""
         now = timezone.now()
 
         for cls, field in self.REVISION_MIGRATIONS:
@@ -145,7 +229,7 @@ class DateRangedTrackedModel(DateTrackedModel):
                         )
                 continue
 
-            instances = cls.objects.filter(Q(date_ended=None) | Q(date_ended__gt=now), **{field: old_obj})
+            instances = cls.objects.filter(date_ended__gt=now, **{field: old_obj})
             for instance in instances:
                 old_id = instance.id
                 try:
@@ -170,7 +254,7 @@ class DateRangedTrackedModel(DateTrackedModel):
                         old_instance.replaced_by = instance
                     old_instance.save_with_error_message(request)
 
-                    instance.migrate_with_revision(request, old_instance)
+                    instance.migrate_with_revision_per_row(request, old_instance)
                 except Exception as e:
                     if request is not None:
                         messages.warning(request, _("There was an issue migrating objects with revisions."))
@@ -182,6 +266,59 @@ class DateRangedTrackedModel(DateTrackedModel):
         abstract = True
 
 
+class RevisionedModel(DateRangedTrackedModel):
+    """Abstract model whose revisions are linked with replaced_by (defined by subclasses).
+
+    All revisions of an object share a lineage identifier, which allows finding current revisions in bulk.
+    """
+
+    lineage = models.UUIDField(_("lineage"), default=uuid4, editable=False, db_index=True)
+
+    def get_replacement_date(self) -> typing.Optional[datetime.datetime]:
+        """Get the date since which this revision is superseded by its replacement (None if it was not replaced)."""
+        return self.date_ended if getattr(self, "replaced_by_id", None) is not None else None
+
+    @classmethod
+    def resolve_revisions(
+        cls,
+        revisions: typing.Iterable["RevisionedModel"],
+        when: typing.Optional[datetime.datetime] = None,
+        queryset=None,
+    ) -> typing.Dict[int, "RevisionedModel"]:
+        """Find the current revisions of objects, with at most one query.
+
+        A revision is upgraded (by following replaced_by) until a revision in effect at the given date, or the last one
+        in the chain, is found. Return a mapping of the given revision IDs to their current revisions. The links are
+        followed within the revisions of the same lineage, as the order of IDs need not match the order of revisions.
+        """
+        if when is None:
+            when = timezone.now()
+        revisions = list(revisions)
+        result = {r.id: r for r in revisions}
+        outdated = [r for r in revisions if r.replaced_by_id is not None and not r.in_effect(when)]
+        if not outdated:
+            return result
+
+        if queryset is None:
+            queryset = cls._default_manager.all()
+        lineage_revisions = {r.id: r for r in queryset.filter(lineage__in={r.lineage for r in outdated})}
+
+        for revision in outdated:
+            current = revision
+            seen = {current.id}
+            while current.replaced_by_id is not None and not current.in_effect(when):
+                replacement = lineage_revisions.get(current.replaced_by_id)
+                if replacement is None or replacement.id in seen:
+                    break
+                current = replacement
+                seen.add(current.id)
+            result[revision.id] = current
+        return result
+
+    class Meta:
+        abstract = True
+
+
 class Store(DateTrackedModel):
     """A store."""
 
@@ -307,6 +444,45 @@ class CheckoutApiKey(DateTrackedModel):
         return reverse("ms_baseline:checkout_api_keys_edit", args=(self.id,))
 
 
+class Tombstone(models.Model):
+    """A record of a deleted object, used for delta synchronization (see ms_baseline.sync)."""
+
+    model = models.CharField(_("model"), max_length=50)
+    object_id = models.IntegerField(_("object ID"))
+    # The store of the deleted object (None for global objects)
+    store_id = models.IntegerField(_("store ID"), blank=True, null=True)
+    date_deleted = models.DateTimeField(_("date deleted"), default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["date_deleted", "id"])]
+
+    def __str__(self):
+        """Return a description of the tombstone."""
+        return f"{self.model} #{self.object_id}"
+
+
+class CatalogSnapshot(models.Model):
+    """A compressed snapshot of the catalog of a store, served as a static file (see ms_baseline.snapshots)."""
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name=_("store"))
+    # The SHA-256 hash of the uncompressed content, which is also the name of the file
+    content_hash = models.CharField(_("content hash"), max_length=64)
+    # A fingerprint of the tables the snapshot was built from, used to skip rebuilding unchanged stores
+    state = models.CharField(_("state"), max_length=40)
+    file = models.FileField(_("file"), max_length=200)
+    size = models.PositiveIntegerField(_("size"))
+    date_created = models.DateTimeField(_("date created"), default=timezone.now)
+    date_checked = models.DateTimeField(_("date checked"), default=timezone.now)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["store", "content_hash"], name="unique_snapshot_content")]
+        indexes = [models.Index(fields=["store", "date_checked"])]
+
+    def __str__(self):
+        """Return a description of the snapshot."""
+        return f"{self.store_id}/{self.content_hash}"
+
+
 PriceField = functools.partial(models.DecimalField, decimal_places=2, max_digits=10)
 
 
@@ -314,3 +490,6 @@ PriceField = functools.partial(models.DecimalField, decimal_places=2, max_digits
 def ensure_full_clean(instance: BaseModel, **kwargs):
     """Ensure all models are validated."""
     instance.full_clean()
+
+
+cache.invalidate_on_change(cache.REFERENCE, Store)
@@ -0,0 +1,143 @@
+"""Automatic select_related/prefetch_related planning, based on the fields of DRF serializers."""
+import functools
+import typing
+
+from django.db.models import Model, Prefetch, QuerySet, prefetch_related_objects
+from rest_framework import relations, serializers
+
+
+class QueryPlan(typing.NamedTuple):
+    """The related objects required to serialize instances of a model."""
+
+    select_related: typing.Tuple[str, ...]
+    # (lookup, related model, plan for the related model)
+    prefetch_related: typing.Tuple[typing.Tuple[str, typing.Type[Model], "QueryPlan"], ...]
+
+
+EMPTY_PLAN = QueryPlan(select_related=(), prefetch_related=())
+
+
+def _get_relation(model: typing.Type[Model], name: str):
+    """Find a relation (forward or reverse) of a model by its attribute name."""
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if not field.auto_created or field.concrete:
+            if field.name == name:
+                return field
+        elif field.get_accessor_name() == name:
+            return field
+    return None
+
+
+def _follow_source(model: typing.Type[Model], source_attrs: typing.Sequence[str]):
+    """Follow the source of a serializer field.
+
+    Return the path of to-one relations, the to-many relation (if any) and the model at the end of the path.
+    """
+    path = []
+    for attr_name in source_attrs:
+        relation = _get_relation(model, attr_name)
+        if relation is None:
+            return path, None, None
+        path.append(attr_name)
+        model = relation.related_model
+        if relation.one_to_many or relation.many_to_many:
+            return path, path, model
+    return path, None, model
+
+
+def _merge_plan(
+    select_related: typing.List[str],
+    prefetch_related: typing.List[typing.Tuple[str, typing.Type[Model], QueryPlan]],
+    prefix: str,
+    plan: QueryPlan,
+):
+    """Merge a plan of a related object into a plan, prefixing all lookups."""
+    select_related.extend(prefix + s for s in plan.select_related)
+    prefetch_related.extend((prefix + lookup, model, subplan) for lookup, model, subplan in plan.prefetch_related)
+
+
+@functools.lru_cache(maxsize=None)
+def plan_serializer(serializer_class: typing.Type[serializers.Serializer], model: typing.Type[Model]) -> QueryPlan:
+    """Build the query plan for a serializer class (the results are cached)."""
+    select_related: typing.List[str] = []
+    prefetch_related: typing.List[typing.Tuple[str, typing.Type[Model], QueryPlan]] = []
+
+    for field in serializer_class().fields.values():
+        if field.source == "*":
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            nested = field.child
+        elif isinstance(field, relations.ManyRelatedField):
+            nested = field.child_relation
+        else:
+            nested = field
+
+        if not isinstance(nested, (serializers.BaseSerializer, relations.RelatedField)):
+            continue
+
+        path, many_path, related_model = _follow_source(model, field.source_attrs)
+        if related_model is None:
+            continue
+
+        if isinstance(nested, serializers.BaseSerializer):
+            subplan = plan_serializer(type(nested), related_model)
+        else:
+            subplan = EMPTY_PLAN
+
+        lookup = "__".join(path)
+        if many_path is not None:
+            prefetch_related.append((lookup, related_model, subplan))
+        elif isinstance(nested, relations.PrimaryKeyRelatedField):
+            # The primary key is read from the foreign key column, no related object is needed.
+            continue
+        else:
+            select_related.append(lookup)
+            _merge_plan(select_related, prefetch_related, lookup + "__", subplan)
+
+    return QueryPlan(select_related=tuple(select_related), prefetch_related=tuple(prefetch_related))
+
+
+def _existing_prefetch_lookups(queryset: QuerySet) -> typing.Set[str]:
+    """Get the prefetch lookups that are already present in a queryset."""
+    return {
+        lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup for lookup in queryset._prefetch_related_lookups
+    }
+
+
+def apply_query_plan(queryset: QuerySet, plan: QueryPlan) -> QuerySet:
+    """Apply a query plan to a queryset. Lookups already prefetched by the queryset are kept as they are."""
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    existing = _existing_prefetch_lookups(queryset)
+    for lookup, model, subplan in plan.prefetch_related:
+        if lookup in existing or any(e.startswith(lookup + "__") for e in existing):
+            continue
+        related_queryset = apply_query_plan(model._default_manager.all(), subplan)
+        queryset = queryset.prefetch_related(Prefetch(lookup, queryset=related_queryset))
+    return queryset
+
+
+def plan_queryset(queryset: QuerySet, serializer_class: typing.Type[serializers.Serializer]) -> QuerySet:
+    """Add the select_related/prefetch_related lookups needed by a serializer to a queryset."""
+    if not isinstance(queryset, QuerySet):
+        return queryset
+    return apply_query_plan(queryset, plan_serializer(serializer_class, queryset.model))
+
+
+def is_prefetched(manager) -> bool:
+    """Check if the objects of a related manager have already been prefetched."""
+    return manager.all()._result_cache is not None
+
+
+def prefetch_for_serializer(instances: typing.Sequence[Model], serializer_class: typing.Type[serializers.Serializer]):
+    """Fetch the related objects needed by a serializer for instances that were already loaded."""
+    if not instances:
+        return
+    plan = plan_serializer(serializer_class, type(instances[0]))
+    lookups = list(plan.select_related)
+    for lookup, model, subplan in plan.prefetch_related:
+        lookups.append(Prefetch(lookup, queryset=apply_query_plan(model._default_manager.all(), subplan)))
+    prefetch_related_objects(instances, *lookups)
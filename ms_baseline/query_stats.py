@@ -0,0 +1,211 @@
+"""Per-view database query statistics and query budgets."""
+import logging
+import os
+import sys
+import threading
+import time
+import typing
+
+import attr
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("ms_baseline.query_stats")
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+class QueryBudgetExceeded(Exception):
+    """An exception raised when a view exceeds its query budget (if budgets are configured to fail)."""
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class QueryRecord:
+    """A single executed statement."""
+
+    sql: str
+    duration: float
+    frame: str
+
+    @property
+    def duration_ms(self) -> float:
+        """Get the duration in milliseconds."""
+        return self.duration * 1000
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class ViewQueryStats:
+    """Aggregated query statistics of a view."""
+
+    view_name: str
+    requests: int = 0
+    queries: int = 0
+    max_queries: int = 0
+    sql_time: float = 0.0
+    max_sql_time: float = 0.0
+    budget_exceeded: int = 0
+    slowest: typing.List[QueryRecord] = attr.ib(factory=list)
+
+    @property
+    def avg_queries(self) -> float:
+        """Get the average number of queries per request."""
+        return self.queries / self.requests if self.requests else 0
+
+    @property
+    def avg_sql_time(self) -> float:
+        """Get the average SQL time per request."""
+        return self.sql_time / self.requests if self.requests else 0
+
+    @property
+    def avg_sql_time_ms(self) -> float:
+        """Get the average SQL time per request in milliseconds."""
+        return self.avg_sql_time * 1000
+
+    @property
+    def max_sql_time_ms(self) -> float:
+        """Get the maximum SQL time of a request in milliseconds."""
+        return self.max_sql_time * 1000
+
+
+def _find_origin_frame() -> str:
+    """Find the innermost frame of project code (outside of Django and other libraries) on the stack."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_PROJECT_DIR) and filename != _THIS_FILE and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryCollector:
+    """A database execute wrapper that counts and times queries of a request."""
+
+    def __init__(self, keep_slowest: int):
+        """Initialize the collector."""
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.time = 0.0
+        self.slowest: typing.List[QueryRecord] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute and time a statement."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.time += duration
+            self._record(sql, duration)
+
+    def _record(self, sql, duration):
+        """Remember the statement if it is one of the slowest ones."""
+        if self.keep_slowest <= 0:
+            return
+        if len(self.slowest) >= self.keep_slowest and duration <= self.slowest[-1].duration:
+            return
+        # The origin is only looked up for statements that are kept, to keep the overhead low.
+        self.slowest.append(QueryRecord(sql=sql, duration=duration, frame=_find_origin_frame()))
+        self.slowest.sort(key=lambda r: r.duration, reverse=True)
+        del self.slowest[self.keep_slowest :]
+
+
+class QueryStatsRegistry:
+    """Query statistics of all views in this process."""
+
+    def __init__(self):
+        """Initialize the registry."""
+        self._lock = threading.Lock()
+        self._stats: typing.Dict[str, ViewQueryStats] = {}
+
+    def record(self, view_name: str, collector: QueryCollector, budget_exceeded: bool):
+        """Record statistics of a request."""
+        with self._lock:
+            stats = self._stats.get(view_name)
+            if stats is None:
+                stats = self._stats[view_name] = ViewQueryStats(view_name=view_name)
+            stats.requests += 1
+            stats.queries += collector.count
+            stats.max_queries = max(stats.max_queries, collector.count)
+            stats.sql_time += collector.time
+            stats.max_sql_time = max(stats.max_sql_time, collector.time)
+            if budget_exceeded:
+                stats.budget_exceeded += 1
+            keep_slowest = collector.keep_slowest
+            stats.slowest = sorted(stats.slowest + collector.slowest, key=lambda r: r.duration, reverse=True)[
+                :keep_slowest
+            ]
+
+    def get_all(self) -> typing.List[ViewQueryStats]:
+        """Get statistics of all views, the views with most queries per request first."""
+        with self._lock:
+            stats = [attr.evolve(s, slowest=list(s.slowest)) for s in self._stats.values()]
+        return sorted(stats, key=lambda s: (-s.avg_queries, s.view_name))
+
+    def reset(self):
+        """Remove all recorded statistics."""
+        with self._lock:
+            self._stats.clear()
+
+
+registry = QueryStatsRegistry()
+
+
+def get_query_budget(view_name: str) -> typing.Tuple[typing.Optional[int], typing.Optional[float]]:
+    """Get the query budget of a view, as the number of queries and SQL time in milliseconds."""
+    budgets = getattr(settings, "MOBISHOPPER_QUERY_BUDGETS", {})
+    budget = budgets.get(view_name, getattr(settings, "MOBISHOPPER_QUERY_BUDGET_DEFAULT", None))
+    if budget is None:
+        return None, None
+    if isinstance(budget, int):
+        return budget, None
+    return budget.get("queries"), budget.get("time_ms")
+
+
+def check_query_budget(view_name: str, collector: QueryCollector) -> bool:
+    """Check if a request fits into the budget of its view. Log or fail (depending on settings) if it does not."""
+    max_queries, max_time_ms = get_query_budget(view_name)
+    time_ms = collector.time * 1000
+    problems = []
+    if max_queries is not None and collector.count > max_queries:
+        problems.append(f"{collector.count} queries (budget: {max_queries})")
+    if max_time_ms is not None and time_ms > max_time_ms:
+        problems.append(f"{time_ms:.1f} ms of SQL time (budget: {max_time_ms} ms)")
+    if not problems:
+        return True
+
+    message = f"View {view_name} exceeded its query budget: {', '.join(problems)}"
+    if getattr(settings, "MOBISHOPPER_QUERY_BUDGET_ACTION", "log") == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    return False
+
+
+class QueryStatsMiddleware:
+    """Middleware that records query statistics for each resolved view and enforces query budgets."""
+
+    def __init__(self, get_response):
+        """Initialize middleware."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Handle a request."""
+        if not getattr(settings, "MOBISHOPPER_QUERY_STATS", True):
+            return self.get_response(request)
+
+        collector = QueryCollector(getattr(settings, "MOBISHOPPER_QUERY_STATS_SLOWEST", 5))
+        with connections["default"].execute_wrapper(collector):
+            response = self.get_response(request)
+
+        resolver_match = getattr(request, "resolver_match", None)
+        if resolver_match is not None:
+            view_name = resolver_match.view_name
+            try:
+                within_budget = check_query_budget(view_name, collector)
+            except QueryBudgetExceeded:
+                registry.record(view_name, collector, True)
+                raise
+            registry.record(view_name, collector, not within_budget)
+        return response
@@ -0,0 +1,130 @@
+"""Fast JSON serialization of API responses (DRF data and attrs classes), based on orjson if it is installed."""
+import datetime
+import decimal
+import functools
+import json
+import typing
+import uuid
+
+import attr
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# U+2028 and U+2029 are valid in JSON, but not in JavaScript (see rest_framework.renderers.JSONRenderer).
+_JS_UNSAFE = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_attr_names(cls: type) -> typing.Tuple[str, ...]:
+    """Get the names of attributes of an attrs class."""
+    return tuple(a.name for a in attr.fields(cls))
+
+
+def default(obj):
+    """Convert an object that is not natively supported by JSON.
+
+    Attrs classes are converted one level at a time (nested values are handled by the encoder). Decimals are converted
+    to strings, which keeps their exact value and formatting. Other types are handled like in the DRF encoder.
+    """
+    cls = type(obj)
+    if attr.has(cls):
+        return {name: getattr(obj, name) for name in _get_attr_names(cls)}
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if representation.endswith("+00:00"):
+            representation = representation[:-6] + "Z"
+        return representation
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if isinstance(obj, (QuerySet, tuple, set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "__getitem__") and hasattr(obj, "keys"):
+        return dict(obj)
+    if hasattr(obj, "__iter__"):
+        return list(obj)
+    raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def django_default(obj):
+    """Convert an object like default(), with dates, times and durations formatted like in DjangoJSONEncoder.
+
+    DjangoJSONEncoder (used by JsonResponse) truncates times to milliseconds, and formats durations in ISO 8601.
+    """
+    if isinstance(obj, (datetime.date, datetime.time, datetime.timedelta)):
+        return _django_encoder.default(obj)
+    return default(obj)
+
+
+class FastJSONEncoder(json.JSONEncoder):
+    """A JSON encoder for the standard library, used if orjson is not available."""
+
+    default_func = staticmethod(default)
+
+    def default(self, obj):
+        """Convert an object that is not natively supported by JSON."""
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return self.default_func(obj)
+
+
+class DjangoDatesJSONEncoder(FastJSONEncoder):
+    """A JSON encoder for the standard library, which formats dates like DjangoJSONEncoder."""
+
+    default_func = staticmethod(django_default)
+
+
+def dumps(obj, django_dates: bool = False) -> bytes:
+    """Serialize an object (possibly containing attrs classes and Decimals) to compact UTF-8 JSON.
+
+    With django_dates, dates, times and durations are formatted like in JsonResponse (see django_default).
+    """
+    if orjson is not None:
+        content = orjson.dumps(
+            obj,
+            default=django_default if django_dates else default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    else:
+        encoder = DjangoDatesJSONEncoder if django_dates else FastJSONEncoder
+        content = json.dumps(obj, cls=encoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    for unsafe, escaped in _JS_UNSAFE:
+        if unsafe in content:
+            content = content.replace(unsafe, escaped)
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """A DRF renderer that serializes data with dumps(), including attrs classes.
+
+    Indented output (requested with the indent media type parameter) is rendered by the standard renderer.
+    """
+
+    encoder_class = FastJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into JSON."""
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,119 @@
+"""Set-based migration of dependent objects to new revisions (see DateRangedTrackedModel.REVISION_MIGRATIONS)."""
+import datetime
+import typing
+
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import Case, Value, When
+from django.dispatch import Signal
+from django.utils import timezone
+
+from ms_baseline import cache
+from ms_baseline.bulk import BATCH_SIZE, bulk_create_with_pks, can_bulk_create_with_pks
+
+# Sent after objects were replaced by new revisions in bulk (without saving them), with the model as the sender, and
+# id_map (old revision IDs to new revision IDs) and date_started (the date of the replacement) as arguments.
+revisions_migrated = Signal()
+
+
+def can_migrate_in_bulk(model: typing.Type[models.Model]) -> bool:
+    """Check if bulk migrations are enabled and supported by the database of a model."""
+    if not getattr(settings, "MOBISHOPPER_BULK_REVISION_MIGRATIONS", True):
+        return False
+    return can_bulk_create_with_pks(model)
+
+
+def _reassign(model: typing.Type[models.Model], field: str, id_map: typing.Dict[int, int]):
+    """Point a foreign key of all objects of a non-revisioned model to the new revisions."""
+    attname = model._meta.get_field(field).attname
+    whens = [When(**{attname: old_id}, then=Value(new_id)) for old_id, new_id in id_map.items()]
+    model._default_manager.filter(**{attname + "__in": list(id_map)}).update(**{attname: Case(*whens)})
+
+
+def _copy_many_to_many(model: typing.Type[models.Model], id_map: typing.Dict[int, int]):
+    """Copy many-to-many relations of old revisions to their new revisions."""
+    for m2m_field in model._meta.local_many_to_many:
+        through = m2m_field.remote_field.through
+        if not through._meta.auto_created:
+            continue
+        source = m2m_field.m2m_field_name() + "_id"
+        target = m2m_field.m2m_reverse_field_name() + "_id"
+        rows = through._default_manager.filter(**{source + "__in": list(id_map)}).values_list(source, target)
+        through._default_manager.bulk_create(
+            [through(**{source: id_map[source_id], target: target_id}) for source_id, target_id in rows],
+            batch_size=BATCH_SIZE,
+        )
+
+
+def _migrate_dependents(
+    model: typing.Type[models.Model],
+    field: str,
+    id_map: typing.Dict[int, int],
+    date_started: typing.Optional[datetime.datetime],
+    now: datetime.datetime,
+) -> typing.Dict[int, int]:
+    """Create new revisions of objects of a model that depend on migrated objects.
+
+    Return a mapping of old revision IDs to new revision IDs of the model.
+    """
+    attname = model._meta.get_field(field).attname
+    old_instances = list(model._default_manager.filter(date_ended__gt=now, **{attname + "__in": list(id_map)}))
+    copied_fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    has_replaced_by = any(f.name == "replaced_by" for f in copied_fields)
+
+    pairs = []
+    for old_instance in old_instances:
+        if date_started and old_instance.date_ended and old_instance.date_ended < date_started:
+            continue  # Migrating does not make sense.
+        new_instance = model(**{f.attname: getattr(old_instance, f.attname) for f in copied_fields})
+        new_instance.date_started = date_started
+        setattr(new_instance, attname, id_map[getattr(old_instance, attname)])
+        pairs.append((old_instance, new_instance))
+
+    if not pairs:
+        return {}
+
+    bulk_create_with_pks(model, [new_instance for _old_instance, new_instance in pairs])
+
+    update_fields = ["date_started", "date_ended", "date_modified"]
+    if has_replaced_by:
+        update_fields.append("replaced_by")
+    for old_instance, new_instance in pairs:
+        old_instance.date_ended = date_started
+        if old_instance.date_started and date_started and old_instance.date_started > date_started:
+            old_instance.date_started = date_started
+        old_instance.date_modified = now
+        if has_replaced_by:
+            old_instance.replaced_by_id = new_instance.pk
+    model._default_manager.bulk_update([old for old, _new in pairs], update_fields, batch_size=BATCH_SIZE)
+
+    new_id_map = {old_instance.pk: new_instance.pk for old_instance, new_instance in pairs}
+    _copy_many_to_many(model, new_id_map)
+    return new_id_map
+
+
+def bulk_migrate_revisions(new_obj, old_obj):
+    """Migrate objects that depend on old_obj to new_obj, including the whole cascade of dependent revisions.
+
+    The cascade is processed level by level, with a bounded number of queries for each dependent model, in one
+    transaction. Objects are created and updated in bulk, so save() and model signals are not called (and the whole
+    application cache is invalidated instead).
+    """
+    from ms_baseline.models import DateRangedTrackedModel
+
+    now = timezone.now()
+    date_started = new_obj.date_started
+    pending = [(type(new_obj), {old_obj.pk: new_obj.pk})]
+
+    with transaction.atomic(using=router.db_for_write(type(new_obj))):
+        while pending:
+            parent_model, id_map = pending.pop(0)
+            for model, field in parent_model.REVISION_MIGRATIONS:
+                if not issubclass(model, DateRangedTrackedModel):
+                    _reassign(model, field, id_map)
+                    continue
+                new_id_map = _migrate_dependents(model, field, id_map, date_started, now)
+                if new_id_map:
+                    pending.append((model, new_id_map))
+                    revisions_migrated.send(sender=model, id_map=new_id_map, date_started=date_started or now)
+        cache.invalidate_all()
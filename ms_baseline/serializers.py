@@ -9,6 +9,7 @@ import rest_framework.parsers
 from rest_framework import serializers
 
 from ms_baseline import models
+from ms_baseline.query_planner import plan_queryset
 from ms_baseline.utils import get_visited_store_id
 
 
@@ -39,7 +40,7 @@ def get_serializer_context(
 
 
 class SerializerContextMixin:
-    """A mixin with the serializer context."""
+    """A mixin with the serializer context, which also prefetches everything the serializer needs."""
 
     def get_serializer_context(self):
         """Get the serializer context."""
@@ -47,6 +48,13 @@ class SerializerContextMixin:
         context = super().get_serializer_context()
         return get_serializer_context(context=context)
 
+    def filter_queryset(self, queryset):
+        """Filter the queryset and add the related objects required by the serializer."""
+        # noinspection PyUnresolvedReferences
+        queryset = super().filter_queryset(queryset)
+        # noinspection PyUnresolvedReferences
+        return plan_queryset(queryset, self.get_serializer_class())
+
 
 class JSONDecimalParser(rest_framework.parsers.JSONParser):
     """A JSON parser that reads all floats as decimal.Decimal."""
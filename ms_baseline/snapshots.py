@@ -0,0 +1,207 @@
+"""Catalog snapshots: the whole catalog of a store in one compressed file, for the first launch of the mobile app.
+
+A snapshot holds the products in effect in the store (with their prices and availability in the store), vendors,
+categories, deals, coupons and coupon sets, the aisles, the current map with its tiles, and product locations, in the
+same format as the API endpoints. It is stored as gzipped JSON, named by the SHA-256 hash of its content, and served
+as a static file from the default storage (so it can be cached forever).
+
+Snapshots are built by the buildsnapshots command, which only rebuilds stores whose tables changed since their last
+snapshot (the tables are compared with the same states as conditional GET), and by the snapshot endpoint if the latest
+snapshot of a store is out of date. The endpoint builds the snapshot within the request, which takes as long as
+serializing the whole catalog, so buildsnapshots should run more often than MOBISHOPPER_SNAPSHOT_MAX_AGE to keep
+builds off the request path. Snapshots are versioned by their content hash: a rebuild that produces the same
+content keeps the existing file.
+"""
+import datetime
+import gzip
+import hashlib
+import typing
+
+import attr
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ms_baseline.conditional import get_table_states
+from ms_baseline.models import CatalogSnapshot, Store
+from ms_baseline.query_planner import plan_queryset
+from ms_baseline.renderers import dumps
+from ms_baseline.utils import filter_in_effect, filter_in_effect_given_store
+from ms_deals.models import Coupon, CouponSet, Deal
+from ms_deals.serializers import CouponSerializer, CouponSetSerializer, DealSerializer
+from ms_maps.models import Aisle, Map, MapTile, ProductLocation, Subaisle
+from ms_maps.serializers import ProductLocationSerializer
+from ms_products.models import Category, LocalProductOverride, Product, Subcategory, Vendor
+from ms_products.serializers import ProductBasicSerializer, VendorSerializer
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_DIRECTORY = "snapshots"
+
+# The tables snapshots are built from (a change in any of them means the snapshot of a store is out of date)
+WATCHED_MODELS = [
+    Product,
+    LocalProductOverride,
+    Vendor,
+    Category,
+    Subcategory,
+    Deal,
+    Coupon,
+    CouponSet,
+    Aisle,
+    Subaisle,
+    Map,
+    MapTile,
+    ProductLocation,
+]
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class SnapshotInfo:
+    """The latest catalog snapshot of a store."""
+
+    store: int
+    version: str
+    url: str
+    size: int
+    date_created: datetime.datetime
+
+    @classmethod
+    def from_db(cls, snapshot: CatalogSnapshot, request=None) -> "SnapshotInfo":
+        """Convert a database CatalogSnapshot to a SnapshotInfo (with an absolute URL if a request is given)."""
+        url = snapshot.file.url
+        return cls(
+            store=snapshot.store_id,
+            version=snapshot.content_hash,
+            url=request.build_absolute_uri(url) if request is not None else url,
+            size=snapshot.size,
+            date_created=snapshot.date_created,
+        )
+
+
+def get_state(store_id: int) -> str:
+    """Get a fingerprint of the tables snapshots of a store are built from (in a single query)."""
+    states = get_table_states(WATCHED_MODELS, store_id)
+    return hashlib.sha1(repr([SNAPSHOT_FORMAT, store_id, states]).encode("utf-8")).hexdigest()
+
+
+def _serialize(queryset, serializer_class, context) -> list:
+    """Serialize all objects of a queryset."""
+    return serializer_class(plan_queryset(queryset, serializer_class), many=True, context=context).data
+
+
+def build_snapshot(store: Store, now: typing.Optional[datetime.datetime] = None) -> typing.Dict[str, typing.Any]:
+    """Build the catalog snapshot of a store."""
+    # The API models of ms_maps and ms_products import each other through ms_baseline.vue_models.
+    from ms_maps.api_models import MapDTO, MapTileDTO, build_vue_aisles_structure
+    from ms_products.api_models import build_vue_categories_structure
+
+    if now is None:
+        now = timezone.now()
+    # One context for all lists, so the product overrides are only fetched once per product.
+    context = {"store_id": store.id}
+    in_store = filter_in_effect_given_store(store, now)
+    deals_in_store = filter_in_effect(now) & (Q(stores=store) | Q(is_global=True))
+
+    store_map = (
+        Map.objects.filter(filter_in_effect(now), store=store)
+        .prefetch_related("tiles__subaisle__parent", "tiles__subaisle__subcategories__parent")
+        .order_by("-date_started", "-id")
+        .first()
+    )
+
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "store": store.id,
+        "products": _serialize(Product.objects.filter(in_store).order_by("id"), ProductBasicSerializer, context),
+        "vendors": _serialize(Vendor.objects.filter(in_store).order_by("name", "id"), VendorSerializer, context),
+        "categories": build_vue_categories_structure(),
+        "deals": _serialize(Deal.objects.filter(deals_in_store).distinct().order_by("id"), DealSerializer, context),
+        "coupons": _serialize(
+            Coupon.objects.filter(deals_in_store).distinct().order_by("id"), CouponSerializer, context
+        ),
+        "coupon_sets": _serialize(
+            CouponSet.objects.filter(deals_in_store).distinct().order_by("id"), CouponSetSerializer, context
+        ),
+        "aisles": build_vue_aisles_structure(store),
+        "map": {
+            "map": MapDTO.from_db(store_map) if store_map else None,
+            "tiles": [MapTileDTO.from_db(t) for t in store_map.tiles.all()] if store_map else [],
+        },
+        "product_locations": _serialize(
+            ProductLocation.objects.filter(in_store).order_by("id"), ProductLocationSerializer, context
+        ),
+    }
+
+
+def get_latest(store_id: int) -> typing.Optional[CatalogSnapshot]:
+    """Get the latest catalog snapshot of a store."""
+    return CatalogSnapshot.objects.filter(store=store_id).order_by("-date_checked", "-id").first()
+
+
+def _prune(store: Store):
+    """Delete old snapshots of a store, keeping MOBISHOPPER_SNAPSHOT_KEEP (clients may still be downloading them)."""
+    keep = max(getattr(settings, "MOBISHOPPER_SNAPSHOT_KEEP", 2), 1)
+    for snapshot in CatalogSnapshot.objects.filter(store=store).order_by("-date_checked", "-id")[keep:]:
+        snapshot.file.delete(save=False)
+        snapshot.delete()
+
+
+def _create_snapshot(store: Store, content: bytes, content_hash: str) -> CatalogSnapshot:
+    """Save a new snapshot file and its row (or get the row of the same snapshot, if it was created concurrently)."""
+    name = f"{SNAPSHOT_DIRECTORY}/{store.id}/{content_hash}.json.gz"
+    if not default_storage.exists(name):
+        # mtime=0 makes the compressed file depend only on the content.
+        name = default_storage.save(name, ContentFile(gzip.compress(content, mtime=0)))
+    snapshot = CatalogSnapshot(store=store, content_hash=content_hash, file=name, size=default_storage.size(name))
+    try:
+        with transaction.atomic():
+            snapshot.save()
+    except IntegrityError:
+        # Another request or buildsnapshots built the same snapshot at the same time.
+        existing = CatalogSnapshot.objects.select_for_update().get(store=store, content_hash=content_hash)
+        if existing.file.name != name:
+            default_storage.delete(name)
+        return existing
+    return snapshot
+
+
+def update_snapshot(store: Store, force: bool = False) -> CatalogSnapshot:
+    """Build the catalog snapshot of a store, unless the tables did not change since the latest snapshot."""
+    # The state is read before building, so changes made in the meantime are picked up by the next update.
+    state = get_state(store.id)
+    latest = get_latest(store.id)
+    if latest is not None and latest.state == state and not force:
+        return latest
+
+    content = dumps(build_snapshot(store))
+    content_hash = hashlib.sha256(content).hexdigest()
+    now = timezone.now()
+    with transaction.atomic():
+        snapshot = CatalogSnapshot.objects.select_for_update().filter(store=store, content_hash=content_hash).first()
+        if snapshot is None:
+            snapshot = _create_snapshot(store, content, content_hash)
+        snapshot.state = state
+        snapshot.date_checked = now
+        snapshot.save()
+    _prune(store)
+    return snapshot
+
+
+def get_snapshot(store: Store) -> CatalogSnapshot:
+    """Get the catalog snapshot of a store, updated if it was not checked for MOBISHOPPER_SNAPSHOT_MAX_AGE seconds."""
+    latest = get_latest(store.id)
+    max_age = datetime.timedelta(seconds=getattr(settings, "MOBISHOPPER_SNAPSHOT_MAX_AGE", 300))
+    if latest is not None and latest.date_checked > timezone.now() - max_age:
+        return latest
+    return update_snapshot(store)
+
+
+def update_snapshots(stores: typing.Optional[typing.Iterable[Store]] = None, force: bool = False):
+    """Update the catalog snapshots of stores (all stores by default)."""
+    if stores is None:
+        stores = Store.objects.order_by("id")
+    for store in stores:
+        update_snapshot(store, force)
@@ -0,0 +1,287 @@
+"""Delta synchronization of catalog data for the mobile app, based on modification dates and tombstones.
+
+Clients send the token from their previous sync, and get the rows of synced models that were created or changed since
+then (in their store), and the IDs of rows that were deleted or left the store (which should be applied first). Changes
+are found with indexed scans of date_modified, in (date_modified, id) order, so large change sets are split into pages
+(more=True means the client should sync again right away). Deletions are recorded as Tombstones.
+
+The token stores the position of every model. As date_modified is set before a transaction commits, positions of
+models with no more changes are moved back by MOBISHOPPER_SYNC_OVERLAP seconds, so rows committed late are sent again
+(clients must apply changes idempotently). A token that is invalid, belongs to another store, or is older than the
+tombstones (MOBISHOPPER_SYNC_TOMBSTONE_DAYS) starts a full sync (reset=True: the client should drop its data first).
+"""
+import base64
+import datetime
+import json
+import typing
+
+import attr
+from django.conf import settings
+from django.db import models
+from django.db.models import BooleanField, Case, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from ms_baseline.models import Tombstone
+from ms_baseline.renderers import dumps
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+TOKEN_VERSION = 1
+# Position of the tombstones in tokens
+TOMBSTONES = "_deleted"
+
+# A position in a table: date_modified (in microseconds since the epoch) and ID of the last row
+Position = typing.Tuple[int, int]
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class SyncedModel:
+    """A model whose rows are synchronized.
+
+    Rows are scoped to stores by store_field: "store" (a foreign key, None for global rows), "stores" (a many-to-many
+    field, with an is_global flag), or None (global rows).
+    """
+
+    name: str
+    model: typing.Type[models.Model]
+    fields: typing.Tuple[str, ...]
+    store_field: typing.Optional[str] = None
+    m2m_fields: typing.Tuple[str, ...] = ()
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class SyncResponse:
+    """Changes since a sync token."""
+
+    token: str
+    more: bool
+    reset: bool
+    changes: typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]]
+    deleted: typing.Dict[str, typing.List[int]]
+
+
+SYNCED_MODELS: typing.Dict[str, SyncedModel] = {}
+
+
+def _to_micros(when: datetime.datetime) -> int:
+    """Convert a date to microseconds since the epoch."""
+    return (when - EPOCH) // MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime.datetime:
+    """Convert microseconds since the epoch to a date."""
+    return EPOCH + micros * MICROSECOND
+
+
+def _touch(model: typing.Type[models.Model], object_ids: typing.Iterable[int]):
+    """Mark objects as changed (for changes that do not save them, e.g. in many-to-many relations)."""
+    model._default_manager.filter(pk__in=list(object_ids)).update(date_modified=timezone.now())
+
+
+def track(
+    name: str,
+    model: typing.Type[models.Model],
+    fields: typing.Sequence[str],
+    *,
+    store_field: typing.Optional[str] = None,
+    m2m_fields: typing.Sequence[str] = (),
+):
+    """Synchronize the rows of a model (registered in models.py of its app).
+
+    Deletions are recorded as tombstones. Changes of the many-to-many fields (the stores, and m2m_fields) mark the
+    objects as changed.
+    """
+    SYNCED_MODELS[name] = SyncedModel(
+        name=name, model=model, fields=tuple(fields), store_field=store_field, m2m_fields=tuple(m2m_fields)
+    )
+
+    def record_deletion(sender, instance, **kwargs):
+        store_id = instance.store_id if store_field == "store" else None
+        Tombstone.objects.create(model=name, object_id=instance.pk, store_id=store_id)
+
+    def record_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ("pre_clear", "post_add", "post_remove"):
+            return
+        if not reverse:
+            _touch(model, [instance.pk])
+        elif pk_set is not None:
+            _touch(model, pk_set)
+        else:
+            field = next(f for f in model._meta.local_many_to_many if f.remote_field.through is sender)
+            sources = sender._default_manager.filter(**{field.m2m_reverse_field_name(): instance.pk})
+            _touch(model, sources.values_list(field.m2m_field_name() + "_id", flat=True))
+
+    uid = f"ms_baseline.sync:{model._meta.label}"
+    models.signals.post_delete.connect(record_deletion, sender=model, weak=False, dispatch_uid=uid)
+    m2m_names = (["stores"] if store_field == "stores" else []) + list(m2m_fields)
+    for field_name in m2m_names:
+        through = model._meta.get_field(field_name).remote_field.through
+        models.signals.m2m_changed.connect(
+            record_m2m_change, sender=through, weak=False, dispatch_uid=f"{uid}:{field_name}"
+        )
+
+
+def encode_token(store_id: typing.Optional[int], since: int, positions: typing.Dict[str, Position]) -> str:
+    """Encode a sync token."""
+    data = {"v": TOKEN_VERSION, "store": store_id, "since": since, "positions": positions}
+    return base64.urlsafe_b64encode(dumps(data)).decode("ascii").rstrip("=")
+
+
+def decode_token(token: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """Decode a sync token. Return None if it is invalid."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii") + b"=" * (-len(token) % 4)))
+        if data["v"] != TOKEN_VERSION:
+            return None
+        data["positions"] = {str(name): (int(t), int(i)) for name, (t, i) in data["positions"].items()}
+        data["since"] = int(data["since"])
+        return data
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def make_token(store_id: typing.Optional[int], when: datetime.datetime) -> str:
+    """Make a token of a client that synced everything at a date."""
+    micros = _to_micros(when)
+    positions = {name: (micros, 0) for name in [*SYNCED_MODELS, TOMBSTONES]}
+    return encode_token(store_id, 0, positions)
+
+
+def _in_scope(synced: SyncedModel, store_id: typing.Optional[int]):
+    """Get an expression that checks if a row is in the scope of a store."""
+    if synced.store_field == "store":
+        whens = [When(store=None, then=Value(True))]
+        if store_id:
+            whens.append(When(store=store_id, then=Value(True)))
+    elif synced.store_field == "stores":
+        whens = [When(is_global=True, then=Value(True))]
+        if store_id:
+            field = synced.model._meta.get_field("stores")
+            through = field.remote_field.through
+            in_store = through._default_manager.filter(
+                **{field.m2m_field_name(): OuterRef("pk"), field.m2m_reverse_field_name(): store_id}
+            )
+            whens.append(When(Exists(in_store), then=Value(True)))
+    else:
+        return Value(True, output_field=BooleanField())
+    return Case(*whens, default=Value(False), output_field=BooleanField())
+
+
+def _after(date_field: str, position: Position) -> Q:
+    """Filter rows after a position."""
+    when = _from_micros(position[0])
+    return Q(**{date_field + "__gt": when}) | Q(**{date_field: when, "id__gt": position[1]})
+
+
+def _get_m2m_values(synced: SyncedModel, field_name: str, object_ids: typing.List[int]) -> typing.Dict[int, list]:
+    """Get the IDs of related objects in a many-to-many field of some objects."""
+    field = synced.model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source, target = field.m2m_field_name() + "_id", field.m2m_reverse_field_name() + "_id"
+    values = {object_id: [] for object_id in object_ids}
+    for source_id, target_id in through._default_manager.filter(**{source + "__in": object_ids}).values_list(
+        source, target
+    ):
+        values[source_id].append(target_id)
+    return values
+
+
+def _file_url(value) -> typing.Optional[str]:
+    """Get the URL of a stored file."""
+    from django.core.files.storage import default_storage
+
+    return default_storage.url(value) if value else None
+
+
+def get_changes(store_id: typing.Optional[int], token: typing.Optional[str]) -> SyncResponse:
+    """Get the changes in a store since a sync token."""
+    now = timezone.now()
+    page_size = getattr(settings, "MOBISHOPPER_SYNC_PAGE_SIZE", 500)
+    overlap = datetime.timedelta(seconds=getattr(settings, "MOBISHOPPER_SYNC_OVERLAP", 60))
+    tombstone_cutoff = now - datetime.timedelta(days=getattr(settings, "MOBISHOPPER_SYNC_TOMBSTONE_DAYS", 30))
+    completed = (_to_micros(now - overlap), 0)
+
+    data = decode_token(token) if token else None
+    reset = (
+        data is None
+        or data["store"] != store_id
+        or data["positions"].get(TOMBSTONES, (0, 0))[0] < _to_micros(tombstone_cutoff)
+    )
+    if reset:
+        # Rows that are not in the store are only reported as deleted if they changed after the full sync started.
+        since = completed[0]
+        positions = {TOMBSTONES: completed}
+    else:
+        since = data["since"]
+        positions = data["positions"]
+
+    more = False
+    new_positions = {}
+    changes = {}
+    deleted = {}
+    for name, synced in SYNCED_MODELS.items():
+        position = positions.get(name, (0, 0))
+        fields = [*synced.fields, "id", "date_modified"]
+        rows = list(
+            synced.model._default_manager.filter(_after("date_modified", position))
+            .annotate(in_scope=_in_scope(synced, store_id))
+            .order_by("date_modified", "id")
+            .values(*fields, "in_scope")[: page_size + 1]
+        )
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            more = True
+            new_positions[name] = (_to_micros(rows[-1]["date_modified"]), rows[-1]["id"])
+        else:
+            new_positions[name] = completed
+
+        changed = []
+        deleted[name] = []
+        for row in rows:
+            if row.pop("in_scope"):
+                changed.append(row)
+            elif _to_micros(row["date_modified"]) >= since:
+                deleted[name].append(row["id"])
+        file_fields = [f for f in synced.fields if isinstance(synced.model._meta.get_field(f), models.FileField)]
+        for row in changed:
+            for field_name in file_fields:
+                row[field_name] = _file_url(row[field_name])
+        for field_name in synced.m2m_fields:
+            related = _get_m2m_values(synced, field_name, [row["id"] for row in changed]) if changed else {}
+            for row in changed:
+                row[field_name] = related[row["id"]]
+        changes[name] = changed
+
+    position = positions[TOMBSTONES]
+    store_filter = Q(store_id=None) | Q(store_id=store_id) if store_id else Q(store_id=None)
+    tombstones = list(
+        Tombstone.objects.filter(store_filter, _after("date_deleted", position))
+        .order_by("date_deleted", "id")
+        .values_list("model", "object_id", "date_deleted", "id")[: page_size + 1]
+    )
+    if len(tombstones) > page_size:
+        tombstones = tombstones[:page_size]
+        more = True
+        new_positions[TOMBSTONES] = (_to_micros(tombstones[-1][2]), tombstones[-1][3])
+    else:
+        new_positions[TOMBSTONES] = completed
+    for model_name, object_id, _date_deleted, _id in tombstones:
+        if model_name in deleted:
+            deleted[model_name].append(object_id)
+
+    return SyncResponse(
+        token=encode_token(store_id, since, new_positions),
+        more=more,
+        reset=reset,
+        changes=changes,
+        deleted=deleted,
+    )
+
+
+def prune_tombstones(now: typing.Optional[datetime.datetime] = None) -> int:
+    """Delete tombstones older than MOBISHOPPER_SYNC_TOMBSTONE_DAYS. Return the number of deleted tombstones."""
+    if now is None:
+        now = timezone.now()
+    cutoff = now - datetime.timedelta(days=getattr(settings, "MOBISHOPPER_SYNC_TOMBSTONE_DAYS", 30))
+    count, _details = Tombstone.objects.filter(date_deleted__lt=cutoff).delete()
+    return count
@@ -0,0 +1,629 @@
+"""Generation of large synthetic datasets, for benchmarks and capacity planning."""
+import datetime
+import decimal
+import itertools
+import random
+import typing
+
+import django.utils.timezone
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Model
+
+from ms_baseline import cache
+from ms_baseline.models import CheckoutApiKey, MsUser, Store
+from ms_deals.models import Coupon, CouponSet, Deal
+from ms_maps.models import Aisle, Map, MapTile, ProductLocation, Subaisle
+from ms_products import properties, search
+from ms_products.constants import UNIT_CHOICES, UNIT_GROUPS
+from ms_products.models import (
+    Category,
+    LocalProductOverride,
+    Product,
+    ProductGroup,
+    StandardMetaField,
+    Subcategory,
+    Vendor,
+)
+from ms_userdata.models import CouponSetUse, CouponUse, ShoppingList, ShoppingListEntry
+
+# Dataset sizes for scale = 1. Values under 1 are ratios.
+BASE_SIZES = {
+    "stores": 24,
+    "categories": 12,
+    "subcategories_per_category": 6,
+    "vendors": 150,
+    "groups": 300,
+    "products": 3000,
+    "product_revision_ratio": 0.2,
+    "max_product_revisions": 3,
+    "overrides_per_store": 150,
+    "deals": 300,
+    "coupons": 300,
+    "coupon_sets": 30,
+    "aisles_per_store": 8,
+    "subaisles_per_aisle": 6,
+    "map_width": 24,
+    "map_height": 16,
+    "location_ratio": 0.3,
+    "users": 300,
+    "lists_per_user": 2,
+    "entries_per_list": 20,
+    "outdated_entry_ratio": 0.05,
+    "shared_list_ratio": 0.1,
+    "coupon_uses_per_user": 4,
+}
+# Sizes that do not grow with the scale factor.
+UNSCALED_SIZES = {
+    "categories",
+    "subcategories_per_category",
+    "product_revision_ratio",
+    "max_product_revisions",
+    "aisles_per_store",
+    "subaisles_per_aisle",
+    "map_width",
+    "map_height",
+    "location_ratio",
+    "lists_per_user",
+    "entries_per_list",
+    "outdated_entry_ratio",
+    "shared_list_ratio",
+    "coupon_uses_per_user",
+}
+BATCH_SIZE = 1000
+PASSWORD = "synthetic"
+
+
+class SyntheticDataGenerator:
+    """Generate a synthetic dataset with bulk inserts. The output depends only on the seed and scale factor.
+
+    Objects are inserted with bulk_create, so model save() methods and signals (including validation) are skipped.
+    """
+
+    def __init__(
+        self,
+        scale: float = 1.0,
+        seed: int = 0,
+        now: typing.Optional[datetime.datetime] = None,
+        log: typing.Optional[typing.Callable[[str], None]] = None,
+    ):
+        """Initialize the generator."""
+        self.scale = scale
+        self.log = log
+        self.random = random.Random(seed)
+        # Product properties use a separate generator, so that they do not change the rest of the dataset.
+        self.properties_random = random.Random(f"{seed}:properties")
+        self.now = now if now is not None else django.utils.timezone.now()
+        self.sizes = {k: v if k in UNSCALED_SIZES else max(1, int(round(v * scale))) for k, v in BASE_SIZES.items()}
+        self.counts: typing.Dict[str, int] = {}
+        self._used_models: typing.List[typing.Type[Model]] = []
+
+    def generate(self) -> typing.Dict[str, int]:
+        """Generate the dataset. Return the number of objects created per model."""
+        with transaction.atomic():
+            stores = self._generate_stores()
+            subcategories = self._generate_categories()
+            meta_fields = self._generate_meta_fields()
+            products, old_revisions = self._generate_products(subcategories, meta_fields)
+            self._generate_overrides(stores, products)
+            coupons, coupon_sets = self._generate_deals(stores, products)
+            subaisles = self._generate_maps(stores, subcategories)
+            self._generate_locations(stores, products, subaisles)
+            users = self._generate_users(stores)
+            self._generate_shopping_lists(users, products, old_revisions)
+            self._generate_coupon_uses(stores, users, coupons, coupon_sets)
+            self._reset_sequences()
+            search.rebuild_index()
+            properties.rebuild_properties()
+            cache.invalidate_all()
+        return self.counts
+
+    def _days_ago(self, max_days: int) -> datetime.datetime:
+        """Get a random date in the past."""
+        return self.now - datetime.timedelta(
+            days=self.random.randint(1, max_days), minutes=self.random.randint(0, 1439)
+        )
+
+    def _price(self) -> decimal.Decimal:
+        """Get a random price."""
+        return decimal.Decimal(self.random.randint(99, 9999)) / 100
+
+    def _bulk_create(
+        self, model: typing.Type[Model], objects: typing.Iterable[Model], *, keep: bool = True
+    ) -> typing.List[Model]:
+        """Insert objects in batches.
+
+        Integer IDs are assigned explicitly, so that the objects can be referenced without querying the database.
+        If keep is False, the objects are not returned (which saves memory for the largest tables).
+        """
+        assign_ids = model._meta.pk.get_internal_type() in {"AutoField", "BigAutoField"}
+        next_id = self._next_id(model) if assign_ids else None
+        created = []
+        count = 0
+        iterator = iter(objects)
+        while True:
+            batch = list(itertools.islice(iterator, BATCH_SIZE))
+            if not batch:
+                break
+            if assign_ids:
+                for obj in batch:
+                    obj.pk = next_id
+                    next_id += 1
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            if keep:
+                created += batch
+
+        self._count(model, count)
+        if assign_ids and model not in self._used_models:
+            self._used_models.append(model)
+        return created
+
+    @staticmethod
+    def _next_id(model: typing.Type[Model]) -> int:
+        """Get the ID of the next object of a model."""
+        return (model.objects.aggregate(max_id=Max("pk"))["max_id"] or 0) + 1
+
+    def _bulk_create_m2m(self, field, pairs: typing.Iterable[typing.Tuple[int, int]]):
+        """Insert rows of a many-to-many relation, given as (source ID, target ID) pairs."""
+        through = field.remote_field.through
+        source_name = field.m2m_field_name() + "_id"
+        target_name = field.m2m_reverse_field_name() + "_id"
+        rows = (through(**{source_name: source, target_name: target}) for source, target in pairs)
+        self._bulk_create(through, rows, keep=False)
+
+    def _count(self, model: typing.Type[Model], count: int):
+        """Count created objects."""
+        label = model._meta.label
+        self.counts[label] = self.counts.get(label, 0) + count
+        if self.log is not None:
+            self.log(f"{label}: {count} created")
+
+    def _reset_sequences(self):
+        """Reset database sequences after inserting rows with explicit IDs."""
+        statements = connection.ops.sequence_reset_sql(no_style(), self._used_models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _generate_stores(self) -> typing.List[Store]:
+        """Generate stores."""
+        stores = [
+            Store(name=f"Store {i + 1}", address=f"{i + 1} Main Street", city=f"City {i % 7 + 1}", region_code="PL")
+            for i in range(self.sizes["stores"])
+        ]
+        return self._bulk_create(Store, stores)
+
+    def _generate_categories(self) -> typing.List[Subcategory]:
+        """Generate categories and subcategories."""
+        categories = self._bulk_create(
+            Category, [Category(name=f"Category {i + 1}") for i in range(self.sizes["categories"])]
+        )
+        subcategories = [
+            Subcategory(name=f"{category.name}.{i + 1}", parent_id=category.id)
+            for category in categories
+            for i in range(self.sizes["subcategories_per_category"])
+        ]
+        return self._bulk_create(Subcategory, subcategories)
+
+    def _generate_meta_fields(self) -> typing.List[StandardMetaField]:
+        """Generate standard meta fields (properties)."""
+        return self._bulk_create(
+            StandardMetaField,
+            [
+                StandardMetaField(name="Weight", expected_units="weight"),
+                StandardMetaField(name="Colour", expected_units="_str"),
+                StandardMetaField(name="Organic", expected_units="_bool"),
+            ],
+        )
+
+    def _extra_metadata(self, meta_fields: typing.List[StandardMetaField]) -> typing.List[typing.Dict[str, str]]:
+        """Get random extra metadata (values of standard properties) of a product."""
+        metadata = []
+        for field in meta_fields:
+            if self.properties_random.random() < 0.5:
+                continue
+            if field.expected_units == "weight":
+                units = self.properties_random.choice(UNIT_GROUPS["weight"])
+                value = str(self.properties_random.choice([1, 5, 10, 50, 100, 250, 500]))
+                text = f"{value} {units}"
+            elif field.expected_units == "_bool":
+                units = ""
+                value = self.properties_random.choice(["0", "1"])
+                text = str(UNIT_GROUPS["_bool"][value == "0"])
+            else:
+                units = ""
+                value = text = self.properties_random.choice(["Red", "Green", "Blue", "White"])
+            metadata.append({"slug": field.slug, "name": field.name, "value": value, "units": units, "text": text})
+        return metadata
+
+    def _generate_products(
+        self, subcategories: typing.List[Subcategory], meta_fields: typing.List[StandardMetaField]
+    ) -> typing.Tuple[typing.List[Product], typing.Dict[int, typing.List[Product]]]:
+        """Generate vendors, product groups and products.
+
+        Some products have chains of older revisions (linked with replaced_by). Return the current products, and the
+        older revisions of each product (newest first).
+        """
+        vendors = self._bulk_create(
+            Vendor,
+            [Vendor(name=f"Vendor {i + 1}", date_started=self._days_ago(720)) for i in range(self.sizes["vendors"])],
+        )
+        groups = self._bulk_create(
+            ProductGroup,
+            [
+                ProductGroup(
+                    name=f"Group {i + 1}",
+                    vendor_id=self.random.choice(vendors).id,
+                    subcategory_id=self.random.choice(subcategories).id,
+                    date_started=self._days_ago(720),
+                )
+                for i in range(self.sizes["groups"])
+            ],
+        )
+
+        products = []
+        for i in range(self.sizes["products"]):
+            group = self.random.choice(groups) if self.random.random() < 0.3 else None
+            products.append(
+                Product(
+                    name=f"Product {i + 1}",
+                    description=f"Synthetic product {i + 1}",
+                    vendor_id=group.vendor_id if group else self.random.choice(vendors).id,
+                    subcategory_id=group.subcategory_id if group else self.random.choice(subcategories).id,
+                    group_id=group.id if group else None,
+                    price=self._price(),
+                    amount=decimal.Decimal(self.random.choice([1, 100, 250, 500, 1000])),
+                    amount_unit=self.random.choice(UNIT_CHOICES)[0],
+                    date_started=self._days_ago(90),
+                )
+            )
+        for product in products:
+            product.update_unit_price()
+            product.extra_metadata_raw = self._extra_metadata(meta_fields)
+            product.extra_metadata_dict = Product.build_extra_metadata_dict_from_raw(product.extra_metadata_raw)
+
+        revised = self.random.sample(products, int(len(products) * self.sizes["product_revision_ratio"]))
+        chain_lengths = [self.random.randint(1, self.sizes["max_product_revisions"]) for _product in revised]
+        # Older revisions are built newest first: per level, (index of the current product, revision, its replacement).
+        levels: typing.List[typing.List[typing.Tuple[int, Product, Product]]] = []
+        newer = list(enumerate(revised))
+        for level in range(self.sizes["max_product_revisions"]):
+            if not newer:
+                break
+            triples = []
+            for index, product in newer:
+                older = Product(
+                    name=product.name,
+                    description=product.description,
+                    vendor_id=product.vendor_id,
+                    subcategory_id=product.subcategory_id,
+                    group_id=product.group_id,
+                    price=self._price(),
+                    amount=product.amount,
+                    amount_unit=product.amount_unit,
+                    date_started=product.date_started - datetime.timedelta(days=self.random.randint(7, 180)),
+                    date_ended=product.date_started,
+                    lineage=product.lineage,
+                )
+                older.update_unit_price()
+                triples.append((index, older, product))
+            levels.append(triples)
+            newer = [(index, older) for index, older, _product in triples if chain_lengths[index] > level + 1]
+
+        # Revisions are created oldest first (and linked afterwards), so that a replacement has a higher ID than the
+        # revisions it replaces, like revisions saved one by one.
+        for triples in reversed(levels):
+            self._bulk_create(Product, [older for _index, older, _product in triples])
+        self._bulk_create(Product, products)
+        old_revisions: typing.Dict[int, typing.List[Product]] = {product.id: [] for product in revised}
+        for triples in levels:
+            for index, older, replacement in triples:
+                older.replaced_by_id = replacement.id
+                old_revisions[revised[index].id].append(older)
+        Product.objects.bulk_update(
+            [older for triples in levels for _index, older, _product in triples], ["replaced_by"], batch_size=BATCH_SIZE
+        )
+        return products, old_revisions
+
+    def _generate_overrides(self, stores: typing.List[Store], products: typing.List[Product]):
+        """Generate local product overrides (including expired ones)."""
+        count = min(len(products), self.sizes["overrides_per_store"])
+
+        def make_override(store: Store, product: Product) -> LocalProductOverride:
+            override = LocalProductOverride(
+                product_id=product.id,
+                store_id=store.id,
+                price=self._price(),
+                available=self.random.random() < 0.9,
+                date_started=self._days_ago(60),
+                date_ended=self.now - datetime.timedelta(hours=1) if self.random.random() < 0.2 else None,
+            )
+            override.update_unit_price(product)
+            return override
+
+        overrides = (
+            make_override(store, product) for store in stores for product in self.random.sample(products, count)
+        )
+        self._bulk_create(LocalProductOverride, overrides, keep=False)
+
+    def _deal_dates(self) -> typing.Dict[str, datetime.datetime]:
+        """Get random validity dates of a deal or coupon (some of them expired)."""
+        date_started = self._days_ago(30)
+        if self.random.random() < 0.2:
+            return {"date_started": date_started, "date_ended": self.now - datetime.timedelta(hours=1)}
+        return {
+            "date_started": date_started,
+            "date_ended": self.now + datetime.timedelta(days=self.random.randint(1, 30)),
+        }
+
+    def _store_pairs(self, objects: typing.List[Model], stores: typing.List[Store]):
+        """Assign random stores to non-global objects."""
+        for obj in objects:
+            if not obj.is_global:
+                for store in self.random.sample(stores, min(len(stores), self.random.randint(1, 3))):
+                    yield obj.id, store.id
+
+    def _generate_deals(
+        self, stores: typing.List[Store], products: typing.List[Product]
+    ) -> typing.Tuple[typing.List[Coupon], typing.List[CouponSet]]:
+        """Generate deals, coupons and coupon sets."""
+        deals = self._bulk_create(
+            Deal,
+            [
+                Deal(
+                    name=f"Deal {i + 1}",
+                    product_id=self.random.choice(products).id,
+                    price=self._price(),
+                    is_global=self.random.random() < 0.25,
+                    **self._deal_dates(),
+                )
+                for i in range(self.sizes["deals"])
+            ],
+        )
+        self._bulk_create_m2m(Deal.stores.field, self._store_pairs(deals, stores))
+
+        coupons = self._bulk_create(
+            Coupon,
+            [
+                Coupon(
+                    name=f"Coupon {i + 1}",
+                    product_id=self.random.choice(products).id,
+                    price=self._price(),
+                    is_global=self.random.random() < 0.25,
+                    one_use=self.random.random() < 0.5,
+                    require_account=self.random.random() < 0.5,
+                    **self._deal_dates(),
+                )
+                for i in range(self.sizes["coupons"])
+            ],
+        )
+        self._bulk_create_m2m(Coupon.stores.field, self._store_pairs(coupons, stores))
+
+        coupon_sets = self._bulk_create(
+            CouponSet,
+            [
+                CouponSet(
+                    name=f"Coupon set {i + 1}",
+                    is_global=self.random.random() < 0.25,
+                    one_use=self.random.random() < 0.5,
+                    **self._deal_dates(),
+                )
+                for i in range(self.sizes["coupon_sets"])
+            ],
+        )
+        self._bulk_create_m2m(CouponSet.stores.field, self._store_pairs(coupon_sets, stores))
+        self._bulk_create_m2m(
+            CouponSet.coupons.field,
+            (
+                (coupon_set.id, coupon.id)
+                for coupon_set in coupon_sets
+                for coupon in self.random.sample(coupons, min(len(coupons), self.random.randint(2, 6)))
+            ),
+        )
+        return coupons, coupon_sets
+
+    def _generate_maps(
+        self, stores: typing.List[Store], subcategories: typing.List[Subcategory]
+    ) -> typing.Dict[int, typing.Dict[int, Subaisle]]:
+        """Generate aisles, subaisles and maps. Return subaisles of each store, by subcategory."""
+        aisles = self._bulk_create(
+            Aisle,
+            [
+                Aisle(name=f"Aisle {i + 1}", code=str(i + 1), store_id=store.id)
+                for store in stores
+                for i in range(self.sizes["aisles_per_store"])
+            ],
+        )
+        subaisles = self._bulk_create(
+            Subaisle,
+            [
+                Subaisle(
+                    name=f"{aisle.name}.{i + 1}", code=chr(ord("A") + i), parent_id=aisle.id, store_id=aisle.store_id
+                )
+                for aisle in aisles
+                for i in range(self.sizes["subaisles_per_aisle"])
+            ],
+        )
+
+        store_subaisles: typing.Dict[int, typing.List[Subaisle]] = {store.id: [] for store in stores}
+        for subaisle in subaisles:
+            store_subaisles[subaisle.store_id].append(subaisle)
+        # Each subcategory is located in one subaisle of each store.
+        by_subcategory: typing.Dict[int, typing.Dict[int, Subaisle]] = {store.id: {} for store in stores}
+        for store_id, store_subaisle_list in store_subaisles.items():
+            for subcategory in subcategories:
+                by_subcategory[store_id][subcategory.id] = self.random.choice(store_subaisle_list)
+        self._bulk_create_m2m(
+            Subaisle.subcategories.field,
+            (
+                (subaisle.id, subcategory_id)
+                for mapping in by_subcategory.values()
+                for subcategory_id, subaisle in mapping.items()
+            ),
+        )
+
+        width, height = self.sizes["map_width"], self.sizes["map_height"]
+        maps = self._bulk_create(
+            Map,
+            [Map(store_id=store.id, width=width, height=height, date_started=self._days_ago(180)) for store in stores],
+        )
+        self._bulk_create(
+            MapTile, (tile for store_map in maps for tile in self._map_tiles(store_map, store_subaisles)), keep=False
+        )
+        return by_subcategory
+
+    @staticmethod
+    def _map_tiles(store_map: Map, store_subaisles: typing.Dict[int, typing.List[Subaisle]]):
+        """Generate tiles of a map: entrance, registers, and rows of shelves."""
+        shelves = store_subaisles[store_map.store_id]
+        for x in range(store_map.width):
+            for y in range(store_map.height):
+                tile = MapTile(map_id=store_map.id, x=x, y=y, tile_type="space")
+                if y == 0 and x == 0:
+                    tile.tile_type = "ee"
+                elif y == 0 and x < 4:
+                    tile.tile_type = "register"
+                elif y % 3 == 1 and 0 < x < store_map.width - 1:
+                    tile.tile_type = "subaisle"
+                    tile.subaisle_id = shelves[(x + y * store_map.width) % len(shelves)].id
+                yield tile
+
+    def _generate_locations(
+        self,
+        stores: typing.List[Store],
+        products: typing.List[Product],
+        subaisles: typing.Dict[int, typing.Dict[int, Subaisle]],
+    ):
+        """Generate automatic product locations."""
+        count = int(len(products) * self.sizes["location_ratio"])
+        locations = (
+            ProductLocation(
+                product_id=product.id,
+                store_id=store.id,
+                subaisle_id=subaisles[store.id][product.subcategory_id].id,
+                is_auto=True,
+                date_started=self._days_ago(60),
+            )
+            for store in stores
+            for product in self.random.sample(products, count)
+        )
+        self._bulk_create(ProductLocation, locations, keep=False)
+
+    def _generate_users(self, stores: typing.List[Store]) -> typing.List[MsUser]:
+        """Generate customer accounts."""
+        password = make_password(PASSWORD)
+        # E-mail addresses are numbered by user ID, so that the generator can be run multiple times.
+        first_id = self._next_id(MsUser)
+        return self._bulk_create(
+            MsUser,
+            [
+                MsUser(
+                    email=f"user{first_id + i}@synthetic.invalid",
+                    first_name="User",
+                    last_name=str(first_id + i),
+                    password=password,
+                    default_store_id=self.random.choice(stores).id,
+                )
+                for i in range(self.sizes["users"])
+            ],
+        )
+
+    def _generate_shopping_lists(
+        self,
+        users: typing.List[MsUser],
+        products: typing.List[Product],
+        old_revisions: typing.Dict[int, typing.List[Product]],
+    ):
+        """Generate shopping lists. Some entries reference outdated revisions, and some lists are shared."""
+        lists = []
+        entries = []
+        for user in users:
+            for i in range(self.sizes["lists_per_user"]):
+                shopping_list = ShoppingList(name=f"List {i + 1}", user_id=user.id, store_id=user.default_store_id)
+                list_entries = []
+                for product in self.random.sample(products, min(len(products), self.sizes["entries_per_list"])):
+                    if product.id in old_revisions and self.random.random() < self.sizes["outdated_entry_ratio"]:
+                        product = self.random.choice(old_revisions[product.id])
+                    list_entries.append(
+                        ShoppingListEntry(
+                            product_id=product.id,
+                            user_id=user.id,
+                            amount=decimal.Decimal(self.random.randint(1, 5)),
+                            bought=self.random.random() < 0.3,
+                        )
+                    )
+                    list_entries[-1].product = product
+                # Cached prices ignore local overrides, they are recomputed when the products are upgraded.
+                for entry in list_entries:
+                    entry.price_cached = entry.compute_price(entry.product.price)
+                shopping_list.price_cached = sum(e.price_cached for e in list_entries)
+                shopping_list.entry_count = len(list_entries)
+                shopping_list.bought_count = sum(e.bought for e in list_entries)
+                shopping_list.completion = round(shopping_list.bought_count * 100 / shopping_list.entry_count)
+                shopping_list.stale_since = min(
+                    filter(None, (e.product.get_replacement_date() for e in list_entries)), default=None
+                )
+                lists.append(shopping_list)
+                entries.append(list_entries)
+
+        self._bulk_create(ShoppingList, lists)
+        for shopping_list, list_entries in zip(lists, entries):
+            for entry in list_entries:
+                entry.list_id = shopping_list.id
+        self._bulk_create(ShoppingListEntry, (entry for list_entries in entries for entry in list_entries), keep=False)
+        self._bulk_create_m2m(
+            ShoppingList.shared_with.field,
+            (
+                (shopping_list.id, self.random.choice(users).id)
+                for shopping_list in lists
+                if self.random.random() < self.sizes["shared_list_ratio"]
+            ),
+        )
+
+    def _generate_coupon_uses(
+        self,
+        stores: typing.List[Store],
+        users: typing.List[MsUser],
+        coupons: typing.List[Coupon],
+        coupon_sets: typing.List[CouponSet],
+    ):
+        """Generate checkout API keys, and uses of coupons and coupon sets (some of them used at checkout)."""
+        api_keys = self._bulk_create(
+            CheckoutApiKey, [CheckoutApiKey(name=f"Register {store.id}", store_id=store.id) for store in stores]
+        )
+        api_keys_by_store = {key.store_id: key for key in api_keys}
+
+        def _use_fields(user: MsUser) -> typing.Dict[str, typing.Any]:
+            """Get random fields of a coupon use."""
+            valid_until = self.now + datetime.timedelta(minutes=self.random.randint(-43200, 15))
+            used = valid_until < self.now and self.random.random() < 0.7
+            return {
+                "user_id": user.id,
+                "store_id": user.default_store_id,
+                "valid_until": valid_until,
+                "is_used": used,
+                "used_date": valid_until - datetime.timedelta(minutes=5) if used else None,
+                "used_with_id": api_keys_by_store[user.default_store_id].id if used else None,
+            }
+
+        uses_per_user = self.sizes["coupon_uses_per_user"]
+        self._bulk_create(
+            CouponUse,
+            (
+                CouponUse(coupon_id=self.random.choice(coupons).id, **_use_fields(user))
+                for user in users
+                for _i in range(uses_per_user)
+            ),
+            keep=False,
+        )
+        self._bulk_create(
+            CouponSetUse,
+            (
+                CouponSetUse(coupon_set_id=self.random.choice(coupon_sets).id, **_use_fields(user))
+                for user in users
+                for _i in range(max(1, uses_per_user // 4))
+            ),
+            keep=False,
+        )
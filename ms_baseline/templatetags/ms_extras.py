@@ -1,9 +1,14 @@
 """Template extras for MobiShopper."""
 import copy
+import functools
+import types
+import typing
 
 import django.utils.html
 from django import template
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
@@ -35,28 +40,88 @@ def _set_visibility(item, usp, user):
         item["visible"] = True
 
 
+def _iter_items(structure):
+    """Iterate over all items of a menu or sidebar structure (including sidebar groups)."""
+    if isinstance(structure, dict):
+        for group in structure["groups"]:
+            yield group
+            yield from group["items"]
+    else:
+        yield from structure
+
+
+def _get_structure(section: typing.Optional[str]):
+    """Get the menu (if section is None) or a sidebar from the settings."""
+    return settings.MOBISHOPPER_MENU if section is None else settings.MOBISHOPPER_SIDEBAR[section]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_permission_names(
+    section: typing.Optional[str],
+) -> typing.Tuple[typing.Tuple[str, ...], typing.Tuple[str, ...]]:
+    """Get the names of user and store permissions that affect the visibility of a menu or sidebar."""
+    user_perms = set()
+    store_perms = set()
+    for item in _iter_items(_get_structure(section)):
+        if item.get("xperm"):
+            user_perms.add(item["xperm"])
+        gperm = item.get("gperm")
+        if gperm:
+            user_perms.update([gperm] if isinstance(gperm, str) else gperm)
+        if item.get("perm"):
+            store_perms.add(item["perm"])
+    return tuple(sorted(user_perms)), tuple(sorted(store_perms))
+
+
+def _get_permission_signature(section: typing.Optional[str], usp, user) -> typing.Tuple:
+    """Get the values of all permissions that affect the visibility of a menu or sidebar."""
+    user_perms, store_perms = _get_permission_names(section)
+    return (
+        tuple(bool(getattr(user, p)) for p in user_perms),
+        tuple(bool(getattr(usp, p)) for p in store_perms) if usp else None,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(section: typing.Optional[str], signature: typing.Tuple):
+    """Build a menu or sidebar with visibility set for a permission signature."""
+    user_perms, store_perms = _get_permission_names(section)
+    user_values, store_values = signature
+    user = types.SimpleNamespace(**dict(zip(user_perms, user_values)))
+    usp = types.SimpleNamespace(**dict(zip(store_perms, store_values))) if store_values is not None else None
+    structure = copy.deepcopy(_get_structure(section))
+    for item in _iter_items(structure):
+        _set_visibility(item, usp, user)
+    return structure
+
+
+@receiver(setting_changed)
+def _clear_compiled(setting, **kwargs):
+    """Clear compiled menus and sidebars when their settings change (in tests)."""
+    if setting in ("MOBISHOPPER_MENU", "MOBISHOPPER_SIDEBAR"):
+        _get_permission_names.cache_clear()
+        _compile.cache_clear()
+
+
+def get_compiled(section: typing.Optional[str], usp, user):
+    """Get the menu (if section is None) or a sidebar, precompiled for the permissions of a user.
+
+    The result is shared between requests and must not be modified.
+    """
+    return _compile(section, _get_permission_signature(section, usp, user))
+
+
 @register.inclusion_tag("mobishopper/extras/menu.html", takes_context=True)
 def render_menu(context):
     """Render the site menu."""
-    menu = settings.MOBISHOPPER_MENU.copy()
-    usp = context["ms_store_permission"]
-    user = context["user"]
-    for item in menu:
-        _set_visibility(item, usp, user)
-
+    menu = get_compiled(None, context["ms_store_permission"], context["user"])
     return {"menu": menu, "current_app": context.get("current_app", "")}
 
 
 @register.inclusion_tag("mobishopper/extras/sidebar.html", takes_context=True)
 def render_sidebar(context):
     """Render the sidebar."""
-    sidebar = copy.deepcopy(settings.MOBISHOPPER_SIDEBAR[context["current_sidebar"]])
-    usp = context["ms_store_permission"]
-    user = context["user"]
-    for group in sidebar["groups"]:
-        _set_visibility(group, usp, user)
-        for item in group["items"]:
-            _set_visibility(item, usp, user)
+    sidebar = get_compiled(context["current_sidebar"], context["ms_store_permission"], context["user"])
     return {"sidebar": sidebar, "current_view": context.get("current_view", "")}
 
 
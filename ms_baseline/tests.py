@@ -1,15 +1,39 @@
 """Tests for ms_baseline."""
 import datetime
+import gzip
+import hashlib
+import json
+import tempfile
 import types
 from decimal import Decimal
 
+import attr
 import django.utils.timezone
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
-from ms_baseline.models import Store
+from ms_baseline import cache, constants, snapshots
+from ms_baseline.api_utils import KeysetOrPageNumberPagination
+from ms_baseline.conditional import conditional_on, get_resolved_store_id
+from ms_baseline.models import MsUser, Store, UserStorePermission
 from ms_baseline.permission_helpers import editable_in_store_context
-from ms_baseline.utils import format_decimal, format_money
-from ms_products.models import Category, Product, Subcategory, Vendor
+from ms_baseline.query_planner import plan_queryset, plan_serializer
+from ms_baseline.query_stats import QueryBudgetExceeded, registry
+from ms_baseline.renderers import dumps
+from ms_baseline.templatetags.ms_extras import get_compiled
+from ms_baseline.utils import filter_in_effect, filter_in_effect_after, format_decimal, format_money
+from ms_baseline.vue_models import ModalItem, ModalItemContainer
+from ms_deals.models import Coupon, CouponSet, Deal
+from ms_deals.serializers import CouponSetSerializer, DealSerializer
+from ms_products.models import Category, LocalProductOverride, Product, Subcategory, Vendor
 
 
 class TestFormatters(TestCase):
@@ -40,6 +64,38 @@ class TestFormatters(TestCase):
         self.assertEqual(format_decimal(Decimal("1.0123")), "1,0123")
 
 
+class TestRenderers(TestCase):
+    """Test the fast JSON renderer."""
+
+    def test_dumps(self):
+        """Test serializing attrs classes, Decimals and dates."""
+        container = ModalItemContainer(
+            items=[ModalItem(id=1, name="Mleko\u2028", details_url="/p/1/")], page=1, num_pages=2
+        )
+        data = {
+            "container": container,
+            "price": Decimal("1.50"),
+            "date": datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc),
+        }
+        self.assertEqual(
+            json.loads(dumps(data)),
+            {
+                "container": attr.asdict(container),
+                "price": "1.50",
+                "date": "2020-01-02T00:00:00Z",
+            },
+        )
+        self.assertIn(b"\\u2028", dumps(container))
+        self.assertRaises(TypeError, dumps, object())
+
+    def test_django_dates(self):
+        """Test that dates can be formatted like in JsonResponse."""
+        data = {"date": datetime.datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc)}
+        self.assertEqual(json.loads(dumps(data)), {"date": "2020-01-02T03:04:05.678901Z"})
+        self.assertEqual(json.loads(dumps(data, django_dates=True)), {"date": "2020-01-02T03:04:05.678Z"})
+        self.assertEqual(json.loads(dumps(data, django_dates=True)), json.loads(JsonResponse(data).content))
+
+
 class TestMigrations(TestCase):
     """Test automated migrations for DateRangedTrackedModels."""
 
@@ -117,6 +173,189 @@ class TestMigrations(TestCase):
         self.assertLessEqual(product3.date_started, end_time + EPSILON)
         self.assertEqual(product3.date_ended, END_DATE)
 
+    def _replace_vendor_with_products(self, product_count: int, store: Store):
+        """Replace a vendor that has products with overrides and deals. Return the number of queries used."""
+        category = Category(name="test category")
+        category.save()
+        subcategory = Subcategory(name="test subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="test vendor")
+        vendor.save()
+        for i in range(product_count):
+            product = Product(
+                name=f"test product {i}", price=1, amount=1, amount_unit="pc", subcategory=subcategory, vendor=vendor
+            )
+            product.save()
+            LocalProductOverride(product=product, store=store, price=2).save()
+            deal = Deal(name=f"test deal {i}", product=product, price=1)
+            deal.save()
+            deal.stores.add(store)
+
+        new_vendor = Vendor(name="test vendor 2", date_started=django.utils.timezone.now())
+        new_vendor.save()
+        with CaptureQueriesContext(connection) as queries:
+            new_vendor.migrate_with_revision(None, vendor)
+        return len(queries)
+
+    def _snapshot(self):
+        """Describe the current revisions of products, overrides and deals."""
+        return {
+            "products": sorted(Product.objects.filter(filter_in_effect()).values_list("name", "vendor__name")),
+            "old_products": sorted(Product.objects.exclude(replaced_by=None).values_list("name", "replaced_by__name")),
+            "overrides": sorted(LocalProductOverride.objects.filter(filter_in_effect()).values_list("product__name")),
+            "deals": sorted(Deal.objects.filter(filter_in_effect()).values_list("product__name", "stores__name")),
+            "all_deals": Deal.objects.count(),
+        }
+
+    def test_bulk_migration(self):
+        """Test that bulk migrations use a bounded number of queries and match per-row migrations."""
+        store = Store(name="test store")
+        store.save()
+        with transaction.atomic():
+            queries_small = self._replace_vendor_with_products(2, store)
+            transaction.set_rollback(True)
+        queries_large = self._replace_vendor_with_products(6, store)
+        self.assertEqual(queries_small, queries_large)
+        bulk_snapshot = self._snapshot()
+        self.assertEqual(len(bulk_snapshot["products"]), 6)
+        self.assertEqual({vendor_name for _name, vendor_name in bulk_snapshot["products"]}, {"test vendor 2"})
+        self.assertEqual(len(bulk_snapshot["deals"]), 6)
+        self.assertEqual({store_name for _name, store_name in bulk_snapshot["deals"]}, {"test store"})
+
+        for model in (Deal, LocalProductOverride, Product, Vendor):
+            model.objects.all().delete()
+        with override_settings(MOBISHOPPER_BULK_REVISION_MIGRATIONS=False):
+            self._replace_vendor_with_products(6, store)
+        per_row_snapshot = self._snapshot()
+        # Per-row migrations do not copy many-to-many relations.
+        self.assertEqual({store_name for _name, store_name in per_row_snapshot["deals"]}, {None})
+        for key in ("products", "old_products", "overrides", "all_deals"):
+            self.assertEqual(bulk_snapshot[key], per_row_snapshot[key])
+
+
+class TestCache(TestCase):
+    """Test the versioned application cache."""
+
+    def test_invalidation(self):
+        """Test that saving an object invalidates cached values in its namespace and scope only."""
+        store = Store(name="test store", address="", city="", region_code="")
+        store.save()
+        other_store = Store(name="other store", address="", city="", region_code="")
+        other_store.save()
+        calls = []
+
+        def get(scope):
+            return cache.get_or_set([(cache.CATALOG, scope)], ["test"], lambda: calls.append(scope) or len(calls))
+
+        self.assertEqual(get(store.id), 1)
+        self.assertEqual(get(other_store.id), 2)
+        self.assertEqual(get(store.id), 1)
+
+        Vendor(name="local vendor", store=store).save()
+        self.assertEqual(get(store.id), 3)
+        self.assertEqual(get(other_store.id), 2)
+
+        Vendor(name="global vendor").save()
+        self.assertEqual(get(store.id), 4)
+        self.assertEqual(get(other_store.id), 5)
+
+        Category(name="category").save()
+        self.assertEqual(get(store.id), 4)
+        cache.invalidate_all()
+        self.assertEqual(get(store.id), 6)
+
+    def test_queryset_key_parts(self):
+        """Test that queryset keys do not depend on the seconds of the current time."""
+        when = django.utils.timezone.now().replace(second=10)
+        keys = [
+            cache.queryset_key_parts(Vendor.objects.filter(filter_in_effect(when + datetime.timedelta(seconds=s))))
+            for s in (0, 30)
+        ]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(
+            keys[0],
+            cache.queryset_key_parts(
+                Vendor.objects.filter(filter_in_effect(when.replace(minute=(when.minute + 1) % 60)))
+            ),
+        )
+
+
+class TestConditionalGet(TestCase):
+    """Test conditional GET responses."""
+
+    def test_vary(self):
+        """Test that responses vary on the user if the store can come from the user."""
+        store = Store(name="test store")
+        store.save()
+        view = conditional_on(Store, store_id_func=get_resolved_store_id)(lambda request: HttpResponse("ok"))
+        factory = RequestFactory()
+
+        request = factory.get("/", HTTP_X_MS_STORE=str(store.id))
+        request.user = AnonymousUser()
+        self.assertEqual(view(request)["Vary"], "X-MS-Store")
+        request = factory.get("/")
+        request.user = AnonymousUser()
+        self.assertEqual(view(request)["Vary"], "X-MS-Store, Cookie, Authorization")
+
+
+class TestKeysetPagination(TestCase):
+    """Test keyset (cursor) pagination."""
+
+    def test_pages(self):
+        """Test that walking through all pages returns every object once, in order."""
+        now = django.utils.timezone.now()
+        for i in range(7):
+            date_started = None if i % 3 == 0 else now - datetime.timedelta(days=i % 2)
+            Vendor(name=f"vendor {i % 4}", date_started=date_started).save()
+        queryset = Vendor.objects.order_by(*constants.ORDER_NEWEST_FIRST)
+        expected = list(queryset.order_by(*constants.ORDER_NEWEST_FIRST, "pk"))
+
+        results = []
+        cursor = ""
+        while cursor is not None:
+            paginator = KeysetOrPageNumberPagination()
+            paginator.page_size = 3
+            request = self._request(cursor=cursor, count=1)
+            results += paginator.paginate_queryset(queryset, request)
+            self.assertEqual(paginator.count, 7)
+            next_link = paginator.get_paginated_response([]).data["next"]
+            cursor = QueryDict(next_link.split("?")[1])["cursor"] if next_link else None
+        self.assertEqual(results, expected)
+
+        paginator = KeysetOrPageNumberPagination()
+        self.assertRaises(NotFound, paginator.paginate_queryset, queryset, self._request(cursor="invalid"))
+
+    def _request(self, **params):
+        """Create a request with query parameters."""
+        return Request(APIRequestFactory().get("/", params))
+
+
+class TestValidityBounds(TestCase):
+    """Test storing open validity bounds as sentinels."""
+
+    def test_open_bounds(self):
+        """Test that open bounds are None in Python and are matched by range and isnull lookups."""
+        now = django.utils.timezone.now()
+        vendor_open = Vendor(name="open vendor")
+        vendor_open.save()
+        vendor_ended = Vendor(name="ended vendor", date_ended=now - datetime.timedelta(days=1))
+        vendor_ended.save()
+        vendor_upcoming = Vendor(name="upcoming vendor", date_started=now + datetime.timedelta(days=1))
+        vendor_upcoming.save()
+
+        vendor_open.refresh_from_db()
+        self.assertIsNone(vendor_open.date_started)
+        self.assertIsNone(vendor_open.date_ended)
+        self.assertEqual(Vendor.objects.filter(date_ended=None).count(), 2)
+        self.assertEqual(Vendor.objects.filter(date_started__isnull=False).count(), 1)
+        self.assertEqual(Vendor.objects.values_list("date_ended", flat=True).get(id=vendor_open.id), None)
+
+        in_effect = Vendor.objects.filter(filter_in_effect(now))
+        self.assertEqual(list(in_effect), [vendor_open])
+        self.assertNotIn(" OR ", str(in_effect.query))
+        self.assertNotIn("IS NULL", str(in_effect.query))
+        self.assertEqual(set(Vendor.objects.filter(filter_in_effect_after(now))), {vendor_open, vendor_upcoming})
+
 
 class TestPermissions(TestCase):
     """Test permission-related functions."""
@@ -146,3 +385,246 @@ class TestPermissions(TestCase):
         self.assertFalse(editable_in_store_context(types.SimpleNamespace(ms_store=store2), vendor0))
         self.assertFalse(editable_in_store_context(types.SimpleNamespace(ms_store=store2), vendor1))
         self.assertTrue(editable_in_store_context(types.SimpleNamespace(ms_store=store2), vendor2))
+
+    def test_compiled_menus(self):
+        """Test that menus and sidebars are precompiled per permission signature."""
+
+        def visible_titles(structure):
+            return [item["title"] for item in structure if item["visible"]]
+
+        manager = MsUser(email="manager@example.com", is_manager=True)
+        other_manager = MsUser(email="other@example.com", is_manager=True)
+        usp = UserStorePermission(can_view_statistics=True)
+
+        menu = get_compiled(None, usp, manager)
+        self.assertEqual(visible_titles(menu), ["Strona główna", "Produkty", "Mapy i lokalizacje", "Statystyki"])
+        self.assertIs(get_compiled(None, usp, other_manager), menu)
+        self.assertEqual(visible_titles(get_compiled(None, None, manager)), ["Strona główna", "Produkty"])
+        self.assertNotIn("visible", settings.MOBISHOPPER_MENU[0])
+
+        sidebar = get_compiled("ms_products", usp, manager)
+        self.assertTrue(all(item["visible"] for item in sidebar["groups"][0]["items"]))
+        self.assertFalse(get_compiled("ms_products", None, manager)["groups"][0]["items"][1]["visible"])
+
+
+class TestQueryPlanner(TestCase):
+    """Test planning queries based on serializers."""
+
+    def test_plan_nested_serializers(self):
+        """Test that nested serializers are turned into select_related and prefetch_related lookups."""
+        plan = plan_serializer(DealSerializer, DealSerializer.Meta.model)
+        self.assertEqual(
+            set(plan.select_related),
+            {"product", "product__vendor", "product__subcategory", "product__subcategory__parent"},
+        )
+        self.assertEqual(plan.prefetch_related, ())
+
+        plan = plan_serializer(CouponSetSerializer, CouponSet)
+        self.assertEqual(plan.select_related, ())
+        self.assertEqual([lookup for lookup, _model, _plan in plan.prefetch_related], ["coupons"])
+        self.assertIn("product__subcategory__parent", plan.prefetch_related[0][2].select_related)
+
+    def test_planned_query_count(self):
+        """Test that the number of queries does not depend on the number of serialized objects."""
+        category = Category(name="test category")
+        category.save()
+        subcategory = Subcategory(name="test subcategory", parent=category)
+        subcategory.save()
+        for i in range(3):
+            vendor = Vendor(name=f"test vendor {i}")
+            vendor.save()
+            coupon_set = CouponSet(name=f"test set {i}", is_global=True)
+            coupon_set.save()
+            for j in range(3):
+                product = Product(
+                    name=f"test product {i}/{j}",
+                    price=1,
+                    amount=1,
+                    amount_unit="1",
+                    subcategory=subcategory,
+                    vendor=vendor,
+                )
+                product.save()
+                coupon = Coupon(name=f"test coupon {i}/{j}", product=product, price=1, is_global=True)
+                coupon.save()
+                coupon_set.coupons.add(coupon)
+
+        queryset = plan_queryset(CouponSet.objects.order_by("id"), CouponSetSerializer)
+        # Coupon sets, and coupons with products, vendors and subcategories
+        with self.assertNumQueries(2):
+            data = CouponSetSerializer(queryset, many=True, context={"store_id": None}).data
+        self.assertEqual(len(data), 3)
+        self.assertEqual({c["product"]["vendor"]["name"] for c in data[1]["coupons"]}, {"test vendor 1"})
+
+    def test_deals_all_list(self):
+        """Test that all kinds of deals are merged into one list, ordered by kind and name."""
+        category = Category(name="test category")
+        category.save()
+        subcategory = Subcategory(name="test subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="test vendor")
+        vendor.save()
+        product = Product(
+            name="test product", price=1, amount=1, amount_unit="1", subcategory=subcategory, vendor=vendor
+        )
+        product.save()
+        for name in ("b set", "a set"):
+            CouponSet(name=name, is_global=True).save()
+        for name in ("b coupon", "a coupon"):
+            Coupon(name=name, product=product, price=1, is_global=True).save()
+        Deal(name="a deal", product=product, price=1, is_global=True).save()
+
+        response = self.client.get(reverse("ms_deals_api:deals_all"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 5)
+        self.assertEqual(
+            [d["name"] for d in response.json()["results"]], ["a set", "b set", "a coupon", "b coupon", "a deal"]
+        )
+
+
+class TestQueryStats(TestCase):
+    """Test query statistics and budgets."""
+
+    def setUp(self):
+        """Clear statistics of other tests."""
+        registry.reset()
+
+    def test_stats_recorded(self):
+        """Test that queries of a view are recorded."""
+        self.client.get("/api/products/")
+        self.client.get("/api/products/")
+        stats = {s.view_name: s for s in registry.get_all()}
+        self.assertIn("ms_products_api:products", stats)
+        products_stats = stats["ms_products_api:products"]
+        self.assertEqual(products_stats.requests, 2)
+        self.assertGreater(products_stats.queries, 0)
+        self.assertEqual(products_stats.budget_exceeded, 0)
+
+    @override_settings(
+        MOBISHOPPER_QUERY_BUDGETS={"ms_products_api:products": 0}, MOBISHOPPER_QUERY_BUDGET_ACTION="raise"
+    )
+    def test_budget_exceeded(self):
+        """Test that a view exceeding its budget fails if configured to."""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get("/api/products/")
+        stats = {s.view_name: s for s in registry.get_all()}
+        self.assertEqual(stats["ms_products_api:products"].budget_exceeded, 1)
+
+
+@override_settings(MOBISHOPPER_SYNC_OVERLAP=0)
+class TestSync(TestCase):
+    """Test the delta sync API."""
+
+    def setUp(self):
+        """Create a product with overrides in two stores, and a deal."""
+        self.store = Store(name="test store", address="", city="", region_code="")
+        self.store.save()
+        other_store = Store(name="other store", address="", city="", region_code="")
+        other_store.save()
+        category = Category(name="category")
+        category.save()
+        subcategory = Subcategory(name="subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="vendor")
+        vendor.save()
+        self.product = Product(
+            name="product", price=2, amount=1, amount_unit="1", subcategory=subcategory, vendor=vendor
+        )
+        self.product.save()
+        self.override = LocalProductOverride(product=self.product, store=self.store, price=1)
+        self.override.save()
+        LocalProductOverride(product=self.product, store=other_store, price=3).save()
+        self.deal = Deal(name="deal", product=self.product, price=1, is_global=True)
+        self.deal.save()
+
+    def _sync(self, token=None):
+        """Sync the data of the store."""
+        params = {"token": token} if token else {}
+        return self.client.get(reverse("ms_baseline_api:api_sync"), params, HTTP_X_MS_STORE=str(self.store.id)).json()
+
+    def test_sync(self):
+        """Test that a sync returns rows changed since the token, and deletions."""
+        data = self._sync()
+        self.assertTrue(data["reset"])
+        self.assertEqual([p["id"] for p in data["changes"]["products"]], [self.product.id])
+        self.assertEqual([o["id"] for o in data["changes"]["product_overrides"]], [self.override.id])
+        self.assertEqual(len(data["changes"]["deals"]), 1)
+
+        data = self._sync(data["token"])
+        self.assertFalse(data["reset"])
+        self.assertFalse(any(data["changes"].values()) or any(data["deleted"].values()))
+
+        self.product.price = 3
+        self.product.save()
+        override_id = self.override.id
+        self.override.delete()
+        self.deal.is_global = False
+        self.deal.save()
+        data = self._sync(data["token"])
+        self.assertEqual([p["price"] for p in data["changes"]["products"]], ["3.00"])
+        self.assertEqual(data["deleted"]["product_overrides"], [override_id])
+        self.assertEqual(data["deleted"]["deals"], [self.deal.id])
+
+        self.deal.stores.add(self.store)
+        data = self._sync(data["token"])
+        self.assertEqual([d["id"] for d in data["changes"]["deals"]], [self.deal.id])
+
+    @override_settings(MOBISHOPPER_SYNC_PAGE_SIZE=1)
+    def test_pages(self):
+        """Test that large change sets are split into pages."""
+        first = self._sync()
+        self.assertTrue(first["more"])
+        second = self._sync(first["token"])
+        self.assertFalse(second["more"])
+        self.assertEqual(len(first["changes"]["product_overrides"] + second["changes"]["product_overrides"]), 1)
+        self.assertTrue(self._sync("invalid")["reset"])
+
+
+class TestSnapshots(TestCase):
+    """Test catalog snapshots."""
+
+    def setUp(self):
+        """Create a product with an override, and a media directory for the snapshots."""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.store = Store(name="test store", address="", city="", region_code="")
+        self.store.save()
+        category = Category(name="category")
+        category.save()
+        subcategory = Subcategory(name="subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="vendor")
+        vendor.save()
+        self.product = Product(
+            name="product", price=2, amount=1, amount_unit="1", subcategory=subcategory, vendor=vendor
+        )
+        self.product.save()
+        LocalProductOverride(product=self.product, store=self.store, price=1).save()
+
+    def test_snapshots(self):
+        """Test that snapshots contain the catalog of the store, and are only rebuilt if it changed."""
+        snapshot = snapshots.update_snapshot(self.store)
+        with snapshot.file.open("rb") as f:
+            content = gzip.decompress(f.read())
+        self.assertEqual(hashlib.sha256(content).hexdigest(), snapshot.content_hash)
+        data = json.loads(content)
+        self.assertEqual([(p["id"], p["price"]) for p in data["products"]], [(self.product.id, "1.00")])
+        self.assertEqual(len(data["vendors"]), 1)
+        self.assertIsNone(data["map"]["map"])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(snapshots.update_snapshot(self.store).id, snapshot.id)
+
+        self.product.name = "renamed product"
+        self.product.save()
+        new_snapshot = snapshots.update_snapshot(self.store)
+        self.assertNotEqual(new_snapshot.content_hash, snapshot.content_hash)
+        self.assertEqual(snapshots.get_latest(self.store.id), new_snapshot)
+
+        response = self.client.get(reverse("ms_baseline_api:api_snapshot"), HTTP_X_MS_STORE=str(self.store.id))
+        self.assertEqual(response.json()["version"], new_snapshot.content_hash)
+        self.assertTrue(response.json()["url"].endswith(f"{new_snapshot.content_hash}.json.gz"))
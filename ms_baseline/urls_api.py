@@ -14,4 +14,6 @@ urlpatterns = [
     path("stores/", api_views.list_stores, name="api_list_stores"),
     path("stores/default/", api_views.set_default_store, name="api_default_store"),
     path("whoami/", api_views.whoami, name="api_whoami"),
+    path("sync/", api_views.sync_changes, name="api_sync"),
+    path("snapshot/", api_views.catalog_snapshot, name="api_snapshot"),
 ]
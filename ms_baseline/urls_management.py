@@ -10,6 +10,7 @@ urlpatterns = [
     path("", views.management_home, name="management_home"),
     path("change-store/<int:sid>/", views.change_store, name="change_store"),
     path("my-permissions/", views.my_permissions, name="my_permissions"),
+    path("query-stats/", views.query_stats, name="query_stats"),
     path("users/", user_management_views.users_list, name="users_list"),
     path("users/add/", user_management_views.users_add, name="users_add"),
     path("users/<int:id>/", user_management_views.users_edit, name="users_edit"),
@@ -1,4 +1,5 @@
 """Utils for ms_baseline."""
+import datetime
 import decimal
 import functools
 import typing
@@ -9,7 +10,7 @@ import django.shortcuts
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
-from django.db.models import Q
+from django.db.models import Min, Q
 from django.shortcuts import redirect
 from django.utils import timezone
 from django.utils.translation import gettext as _
@@ -153,31 +154,42 @@ def employee_required(function):
     return user_passes_test(lambda u: u.is_authenticated and u.is_employee)(function)
 
 
+def staff_required(function):
+    """Mark a view as requiring a staff member."""
+    return user_passes_test(lambda u: u.is_authenticated and u.is_staff)(function)
+
+
 def _render_no_access(request):
     """Render a 403 page."""
     return render(request, "mobishopper/deny_perm.html", _("Insufficient permissions"), {}, status=403)
 
 
 def filter_in_effect(when=None, prefix=""):
-    """Filter DateTrackedModels that are currently in effect."""
+    """Filter DateTrackedModels that are currently in effect.
+
+    Open bounds are stored as sentinel dates (see ValidityBoundField), so this is a plain range check.
+    """
     if not when:
         when = timezone.now()
-    if prefix:
-        return (Q(**{prefix + "date_started": None}) | Q(**{prefix + "date_started__lte": when})) & (
-            Q(**{prefix + "date_ended": None}) | Q(**{prefix + "date_ended__gt": when})
-        )
-    else:
-        return (Q(date_started=None) | Q(date_started__lte=when)) & (Q(date_ended=None) | Q(date_ended__gt=when))
+    return Q(**{prefix + "date_started__lte": when, prefix + "date_ended__gt": when})
 
 
 def filter_in_effect_after(when=None, prefix=""):
     """Filter DateTrackedModels that are currently in effect or will be in effect in the future."""
     if not when:
         when = timezone.now()
-    if prefix:
-        return Q(**{prefix + "date_ended": None}) | Q(**{prefix + "date_ended__gt": when})
-    else:
-        return Q(date_ended=None) | Q(date_ended__gt=when)
+    return Q(**{prefix + "date_ended__gt": when})
+
+
+def get_next_validity_change(queryset, when=None) -> typing.Optional[datetime.datetime]:
+    """Get the next date when an object in the queryset goes in or out of effect."""
+    if not when:
+        when = timezone.now()
+    changes = queryset.order_by().aggregate(
+        started=Min("date_started", filter=Q(date_started__gt=when)),
+        ended=Min("date_ended", filter=Q(date_ended__gt=when)),
+    )
+    return min(filter(None, changes.values()), default=None)
 
 
 def filter_given_store(store, prefix=""):
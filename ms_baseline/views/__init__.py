@@ -8,6 +8,7 @@ from django.utils.translation import gettext as _
 
 from ms_baseline import constants
 from ms_baseline.models import MsUser, Store, UserStorePermission
+from ms_baseline.query_stats import get_query_budget, registry
 from ms_baseline.utils import (
     employee_required,
     filter_in_effect,
@@ -15,6 +16,7 @@ from ms_baseline.utils import (
     filter_in_effect_this_store_m2m,
     filter_this_store,
     render,
+    staff_required,
 )
 from ms_deals.models import Coupon, Deal
 from ms_maps.models import ProductLocation
@@ -96,3 +98,19 @@ def my_permissions(request):
         _("My permissions"),
         {"local_permissions_short_titles": constants.LOCAL_PERMISSIONS_SHORT_TITLES},
     )
+
+
+@staff_required
+def query_stats(request):
+    """Show query statistics of views."""
+    if request.method == "POST":
+        registry.reset()
+        return HttpResponseRedirect(request.path)
+
+    stats = [(s, get_query_budget(s.view_name)) for s in registry.get_all()]
+    return render(
+        request,
+        "mobishopper/query_stats.html",
+        _("Query statistics"),
+        {"stats": stats, "enabled": getattr(settings, "MOBISHOPPER_QUERY_STATS", True)},
+    )
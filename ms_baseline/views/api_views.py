@@ -8,11 +8,14 @@ from django.db import DatabaseError
 from django.utils.crypto import constant_time_compare
 from django.utils.translation import gettext as _
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from ms_baseline import snapshots, sync
 from ms_baseline.api_extra_models import GenericResponse, UserProfileEditRequest, UserRegisterRequest
-from ms_baseline.api_utils import asdict_drf_response, asdict_json_response
+from ms_baseline.api_utils import asdict_drf_response, asdict_json_response, drf_data
 from ms_baseline.models import MsUser, Store
+from ms_baseline.utils import get_resolved_store, get_visited_store_id
 
 logger = logging.getLogger("ms_baseline.views.api_views")
 
@@ -48,6 +51,29 @@ def whoami(request):
     return Response(obj)
 
 
+@api_view()
+def sync_changes(request):
+    """Get the changes of catalog data in the visited store since a sync token (see ms_baseline.sync)."""
+    store_id = get_visited_store_id(request)
+    try:
+        store_id = int(store_id) if store_id else None
+    except ValueError:
+        raise ValidationError({"store": _("Invalid store.")})
+    return Response(drf_data(sync.get_changes(store_id, request.query_params.get("token"))))
+
+
+@api_view()
+def catalog_snapshot(request):
+    """Get the catalog snapshot of the resolved store, built within the request if it is out of date.
+
+    See ms_baseline.snapshots (the buildsnapshots command keeps the builds off the request path).
+    """
+    store = get_resolved_store(request)
+    if store is None:
+        return Response({"error": _("No store provided")}, 400)
+    return Response(drf_data(snapshots.SnapshotInfo.from_db(snapshots.get_snapshot(store), request)))
+
+
 @api_view(["POST"])
 def register(request):
     """Register a new user account."""
@@ -92,8 +92,9 @@ class StandardMetaField:
         if subcategory is None:
             is_required = is_recommended = False
         else:
-            is_required = s.subcategories_required.filter(id=subcategory).exists()
-            is_recommended = s.subcategories_recommended.filter(id=subcategory).exists()
+            # Prefetched relations are used if available.
+            is_required = any(sc.id == subcategory for sc in s.subcategories_required.all())
+            is_recommended = any(sc.id == subcategory for sc in s.subcategories_recommended.all())
         return cls(
             slug=s.slug,
             name=s.name,
@@ -0,0 +1,82 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import ms_baseline.models
+
+
+MODELS = ['coupon', 'couponset', 'deal']
+
+
+def fill_sentinels(apps, schema_editor):
+    """Replace NULL validity bounds with sentinels."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_deals", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name + "__isnull": True}).update(**{field_name: sentinel})
+
+
+def clear_sentinels(apps, schema_editor):
+    """Replace validity bound sentinels with NULLs."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_deals", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name: sentinel}).update(**{field_name: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_deals', '0002_couponset_one_use_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_sentinels, clear_sentinels),
+        migrations.AlterField(
+            model_name='coupon',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='coupon',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='couponset',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='couponset',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='deal',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='deal',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['date_ended', 'date_started'], name='ms_deals_co_date_en_c04892_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['product', 'date_ended'], name='ms_deals_co_product_1c1510_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['date_ended', 'date_started'], name='ms_deals_de_date_en_60ee25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['product', 'date_ended'], name='ms_deals_de_product_250568_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_deals', '0003_validity_bounds'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_deals_co_date_mo_ca73b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='couponset',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_deals_co_date_mo_cad817_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_deals_de_date_mo_cc932e_idx'),
+        ),
+    ]
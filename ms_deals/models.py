@@ -6,9 +6,11 @@ from uuid import uuid4
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Index
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from ms_baseline import cache, sync
 from ms_baseline.models import DateRangedTrackedModel, PriceField, Store
 from ms_products.models import Product
 from ms_products.utils import get_price_per_amount_str
@@ -41,6 +43,13 @@ class Deal(DateRangedTrackedModel):
         """Return price per amount as string."""
         return get_price_per_amount_str(self.price, self.product.amount, self.product.amount_unit)
 
+    class Meta:
+        indexes = [
+            Index(fields=["date_ended", "date_started"]),
+            Index(fields=["product", "date_ended"]),
+            Index(fields=["date_modified", "id"]),
+        ]
+
     def get_absolute_url(self):
         """Get absolute URL of a deal."""
         return reverse("ms_deals:deals_show_edit", args=(self.id,))
@@ -90,6 +99,13 @@ class Coupon(DateRangedTrackedModel):
         """Return price per amount as string."""
         return get_price_per_amount_str(self.price, self.product.amount, self.product.amount_unit)
 
+    class Meta:
+        indexes = [
+            Index(fields=["date_ended", "date_started"]),
+            Index(fields=["product", "date_ended"]),
+            Index(fields=["date_modified", "id"]),
+        ]
+
     def get_absolute_url(self):
         """Get absolute URL of a coupon."""
         return reverse("ms_deals:coupons_show_edit", args=(self.id,))
@@ -110,6 +126,9 @@ class CouponSet(DateRangedTrackedModel):
     is_global = models.BooleanField(_("is global"), default=False)
     stores = models.ManyToManyField(Store, verbose_name=_("stores"), blank=True)
 
+    class Meta:
+        indexes = [Index(fields=["date_modified", "id"])]
+
     def applies_in(self, store):
         """Check if a coupon set applies in a given store."""
         return applies_in(self, store)
@@ -174,3 +193,22 @@ def is_coupon_usable(
             return False, "one_use"
 
     return True, None
+
+
+# Deals apply to many stores, so they use the global scope.
+cache.invalidate_on_change(cache.CATALOG, Deal, Coupon, CouponSet)
+
+sync.track("deals", Deal, ["name", "product", "is_global", "price", "date_started", "date_ended"], store_field="stores")
+sync.track(
+    "coupons",
+    Coupon,
+    ["uuid", "name", "product", "is_global", "price", "one_use", "require_account", "date_started", "date_ended"],
+    store_field="stores",
+)
+sync.track(
+    "coupon_sets",
+    CouponSet,
+    ["uuid", "name", "is_global", "one_use", "require_account", "date_started", "date_ended"],
+    store_field="stores",
+    m2m_fields=["coupons"],
+)
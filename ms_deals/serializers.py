@@ -3,9 +3,10 @@ from rest_framework import serializers
 
 import ms_products.serializers
 from ms_deals import models
+from ms_products.serializers import OverridePrefetchListSerializer, OverridePrefetchMixin
 
 
-class DealSerializer(serializers.ModelSerializer):
+class DealSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for Deals."""
 
     type = serializers.SerializerMethodField(source="get_type")
@@ -20,12 +21,17 @@ class DealSerializer(serializers.ModelSerializer):
         """Get price per amount for the deal."""
         return deal.price_per_amount_str
 
+    def get_override_products(self, instance: models.Deal):
+        """Get the products that will be displayed when serializing the deal."""
+        return [instance.product]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.Deal
         fields = ["id", "name", "product", "price", "price_per_amount", "type", "date_started", "date_ended"]
 
 
-class CouponSerializer(serializers.ModelSerializer):
+class CouponSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for Coupons."""
 
     type = serializers.SerializerMethodField(source="get_type")
@@ -40,7 +46,12 @@ class CouponSerializer(serializers.ModelSerializer):
         """Get price per amount for the coupon."""
         return coupon.price_per_amount_str
 
+    def get_override_products(self, instance: models.Coupon):
+        """Get the products that will be displayed when serializing the coupon."""
+        return [instance.product]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.Coupon
         fields = [
             "id",
@@ -57,7 +68,7 @@ class CouponSerializer(serializers.ModelSerializer):
         ]
 
 
-class CouponSetSerializer(serializers.ModelSerializer):
+class CouponSetSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for Coupon Sets."""
 
     type = serializers.SerializerMethodField(source="get_type")
@@ -67,6 +78,11 @@ class CouponSetSerializer(serializers.ModelSerializer):
         """Get type of the deal."""
         return "COUPON_SET"
 
+    def get_override_products(self, instance: models.CouponSet):
+        """Get the products that will be displayed when serializing the coupon set."""
+        return [c.product for c in instance.coupons.all()]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.CouponSet
         fields = ["id", "uuid", "name", "coupons", "one_use", "require_account", "type", "date_started", "date_ended"]
@@ -1,13 +1,12 @@
 """API responses for ms_deals."""
 
-import attr
 from django.conf import settings
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import JsonResponse
 from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from ms_baseline.api_utils import asdict_json_response
 from ms_baseline.permission_helpers import permissions_required_deals
 from ms_baseline.utils import filter_in_effect_after, filter_this_store_m2m, format_money
 from ms_baseline.vue_models import ModalItem, ModalItemContainer
@@ -35,6 +34,4 @@ def list_coupons_modal(request):
         )
         for c in page.object_list
     ]
-    return JsonResponse(
-        attr.asdict(ModalItemContainer(items=list(data), page=page.number, num_pages=paginator.num_pages))
-    )
+    return asdict_json_response(ModalItemContainer(items=list(data), page=page.number, num_pages=paginator.num_pages))
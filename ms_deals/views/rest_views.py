@@ -4,7 +4,9 @@ import typing
 
 import django.utils.timezone
 import rest_framework.exceptions
+from django.db.models import IntegerField, Value
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 from rest_framework import generics, mixins
 from rest_framework.decorators import api_view
 from rest_framework.pagination import BasePagination
@@ -12,30 +14,51 @@ from rest_framework.response import Response
 from rest_framework.settings import api_settings as _drf_api_settings
 
 from ms_baseline import constants
+from ms_baseline.api_utils import KeysetOrPageNumberPagination
+from ms_baseline.conditional import conditional_on
+from ms_baseline.query_planner import plan_queryset
 from ms_baseline.serializers import SerializerContextMixin, get_serializer_context
 from ms_baseline.utils import filter_in_effect_visited_store_deals, get_visited_store
 from ms_deals.models import Coupon, CouponSet, Deal
 from ms_deals.serializers import CouponSerializer, CouponSetSerializer, DealSerializer
+from ms_products.models import PRODUCT_SERIALIZER_MODELS
 from ms_userdata.models import CouponSetUse, CouponUse
 
+# The sources of deals_all_list, in the order they are listed in
+DEALS_ALL_SOURCES = ((CouponSet, CouponSetSerializer), (Coupon, CouponSerializer), (Deal, DealSerializer))
+
 
 @api_view()
+@conditional_on(Deal, Coupon, CouponSet, *PRODUCT_SERIALIZER_MODELS)
 def deals_all_list(request):
-    """Get a list of all deals."""
-    deals = Deal.objects.filter(filter_in_effect_visited_store_deals(request)).order_by("name")
-    coupons = Coupon.objects.filter(filter_in_effect_visited_store_deals(request)).order_by("name")
-    coupon_sets = CouponSet.objects.filter(filter_in_effect_visited_store_deals(request)).order_by("name")
+    """Get a list of all deals.
+
+    The sources are merged and paginated in the database (with a UNION of their IDs and names), and only the objects
+    on the requested page are fetched and serialized.
+    """
+    filters = filter_in_effect_visited_store_deals(request)
+    id_querysets = [
+        model.objects.filter(filters)
+        .annotate(kind=Value(kind, output_field=IntegerField()))
+        .values_list("kind", "id", "name")
+        for kind, (model, _serializer_class) in enumerate(DEALS_ALL_SOURCES)
+    ]
+    merged = id_querysets[0].union(*id_querysets[1:]).order_by("kind", "name", "id")
 
-    context = get_serializer_context(request=request)
+    paginator: BasePagination = _drf_api_settings.DEFAULT_PAGINATION_CLASS()
+    page = paginator.paginate_queryset(merged, request)
 
-    out = []
-    out += [CouponSetSerializer(cs, context=context).data for cs in coupon_sets]
-    out += [CouponSerializer(c, context=context).data for c in coupons]
-    out += [DealSerializer(d, context=context).data for d in deals]
+    context = get_serializer_context(request=request)
+    serialized = {}
+    for kind, (model, serializer_class) in enumerate(DEALS_ALL_SOURCES):
+        ids = [object_id for object_kind, object_id, _name in page if object_kind == kind]
+        if not ids:
+            continue
+        objects = plan_queryset(model.objects.filter(id__in=ids).order_by("id"), serializer_class)
+        for data in serializer_class(objects, many=True, context=context).data:
+            serialized[kind, data["id"]] = data
 
-    paginator: BasePagination = _drf_api_settings.DEFAULT_PAGINATION_CLASS()
-    paginated = paginator.paginate_queryset(out, request)
-    return paginator.get_paginated_response(paginated)
+    return paginator.get_paginated_response([serialized[kind, object_id] for kind, object_id, _name in page])
 
 
 @api_view()
@@ -50,10 +73,12 @@ def coupon_sets_usable(request, pk):
     return _get_coupons_usable(request, CouponSet, pk)
 
 
+@method_decorator(conditional_on(Deal, *PRODUCT_SERIALIZER_MODELS), name="get")
 class DealsList(SerializerContextMixin, generics.ListAPIView):
     """Get the deals list for a store."""
 
     serializer_class = DealSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
@@ -74,6 +99,7 @@ class CouponsList(SerializerContextMixin, generics.ListAPIView):
     """Get the coupons list for a store."""
 
     serializer_class = CouponSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
@@ -98,6 +124,7 @@ class CouponSetsList(SerializerContextMixin, generics.ListAPIView):
     """Get the coupon sets list for a store."""
 
     serializer_class = CouponSetSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
@@ -141,8 +168,9 @@ def _generate_coupon_coupon_set_qr(
     elif not usable:
         raise rest_framework.exceptions.PermissionDenied(reason)
 
+    coupon_field = "coupon_set" if use_class is CouponSetUse else "coupon"
     use: typing.Union[CouponUse, CouponSetUse, None] = (
-        use_class.objects.filter(user=request.user, coupon=coupon).order_by("valid_until").last()
+        use_class.objects.filter(user=request.user, **{coupon_field: coupon}).order_by("valid_until").last()
     )
 
     if use is not None and not use.is_still_valid(now):
@@ -150,6 +178,8 @@ def _generate_coupon_coupon_set_qr(
     elif not use:
         coupon_user = request.user if request.user.is_authenticated else None
         valid_until = now + datetime.timedelta(minutes=constants.COUPON_USE_VALIDITY_MINUTES)
-        use = use_class(user=coupon_user, coupon=coupon, store=get_visited_store(request), valid_until=valid_until)
+        use = use_class(
+            user=coupon_user, store=get_visited_store(request), valid_until=valid_until, **{coupon_field: coupon}
+        )
         use.save()
     return Response({"data": coupon.generate_coupon_qr_data(use), "valid_until": use.valid_until})
@@ -7,8 +7,9 @@ import attr
 import cattr
 
 import ms_products.models
+from ms_baseline import cache
 from ms_maps import models
-from ms_maps.utils import build_aisles_structure
+from ms_maps.utils import query_aisles_structure
 from ms_products.api_models import CategoryStructureEntry
 
 cattr.register_structure_hook(typing.Union[str, datetime.datetime], lambda d, _t: d)
@@ -110,7 +111,8 @@ class Subaisle:
             description=db_sa.description,
             visible=db_sa.visible,
             parent=Aisle.from_db(db_sa.parent),
-            subcategories=[Subcategory.from_db(sc) for sc in db_sa.subcategories.filter(visible=True)],
+            # Prefetched subcategories are used if available.
+            subcategories=[Subcategory.from_db(sc) for sc in db_sa.subcategories.all() if sc.visible],
         )
 
 
@@ -319,9 +321,18 @@ class MapSaveResponse:
     tiles: typing.List[MapTileDTO] = attr.ib(factory=list)
 
 
-def build_vue_aisles_structure(store):
+def _build_vue_aisles_structure(store):
     """Build a Vue-friendly aisles structure."""
-    db_struct = build_aisles_structure(store, visible_only=True, include_counts=False)
+    db_struct = query_aisles_structure(store, visible_only=True, include_counts=False, prefetch_subcategories=True)
     return [
         AisleStructureEntry.from_db(aisle, [Subaisle.from_db(sa) for sa in subaisles]) for aisle, subaisles in db_struct
     ]
+
+
+def build_vue_aisles_structure(store):
+    """Get a Vue-friendly aisles structure, from the cache."""
+    return cache.get_or_set(
+        [(cache.MAP, getattr(store, "id", store)), (cache.REFERENCE, None)],
+        ["vue_aisles_structure"],
+        lambda: _build_vue_aisles_structure(store),
+    )
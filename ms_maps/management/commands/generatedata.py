@@ -0,0 +1,37 @@
+"""Generate a large synthetic dataset, for benchmarks and capacity planning."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ms_baseline.synthetic_data import BASE_SIZES, UNSCALED_SIZES, SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    """Generate a large synthetic dataset."""
+
+    help = "Generates a large synthetic dataset (stores, products, deals, maps, shopping lists…) with bulk inserts"
+
+    def add_arguments(self, parser):
+        """Add arguments for the scale factor and the random seed."""
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="Scale factor (default: 1, which generates ~{} products in {} stores)".format(
+                BASE_SIZES["products"], BASE_SIZES["stores"]
+            ),
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+    def handle(self, *args, **options):
+        """Run the generator."""
+        if options["scale"] <= 0:
+            raise CommandError("The scale factor must be positive.")
+
+        generator = SyntheticDataGenerator(options["scale"], options["seed"], log=self.stdout.write)
+        scaled = ", ".join(f"{k}={v}" for k, v in generator.sizes.items() if k not in UNSCALED_SIZES)
+        self.stdout.write(self.style.HTTP_INFO(f"Generating dataset: {scaled}"))
+        start = time.perf_counter()
+        counts = generator.generate()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Created {sum(counts.values())} objects in {elapsed:.1f} s."))
@@ -0,0 +1,64 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import ms_baseline.models
+
+
+MODELS = ['map', 'productlocation']
+
+
+def fill_sentinels(apps, schema_editor):
+    """Replace NULL validity bounds with sentinels."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_maps", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name + "__isnull": True}).update(**{field_name: sentinel})
+
+
+def clear_sentinels(apps, schema_editor):
+    """Replace validity bound sentinels with NULLs."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_maps", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name: sentinel}).update(**{field_name: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_maps', '0011_maptile_no_cascade_subaisle'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_sentinels, clear_sentinels),
+        migrations.AlterField(
+            model_name='map',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='map',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='productlocation',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='productlocation',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AddIndex(
+            model_name='map',
+            index=models.Index(fields=['store', 'date_ended', 'date_started'], name='ms_maps_map_store_i_cc4e46_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlocation',
+            index=models.Index(fields=['store', 'date_ended', 'date_started'], name='ms_maps_pro_store_i_6cd33e_idx'),
+        ),
+    ]
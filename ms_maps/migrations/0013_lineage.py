@@ -0,0 +1,45 @@
+from django.db import migrations, models
+import uuid
+
+MODELS = ['map']
+
+
+def assign_lineages(apps, schema_editor):
+    """Assign a lineage to every chain of revisions (linked with replaced_by)."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_maps", model_name)
+        replaced_by = dict(model.objects.values_list("id", "replaced_by_id"))
+        replaces = {new_id: old_id for old_id, new_id in replaced_by.items() if new_id is not None}
+        lineages = {}
+        for first_id in replaced_by:
+            if first_id in replaces:
+                continue
+            lineage = uuid.uuid4()
+            current_id = first_id
+            while current_id is not None and current_id not in lineages:
+                lineages[current_id] = lineage
+                current_id = replaced_by.get(current_id)
+        # Objects in replaced_by cycles (which should not exist) get their own lineages.
+        objects = [model(id=id, lineage=lineages.get(id) or uuid.uuid4()) for id in replaced_by]
+        model.objects.bulk_update(objects, ["lineage"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_maps', '0012_validity_bounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='map',
+            name='lineage',
+            field=models.UUIDField(editable=False, null=True, verbose_name='lineage'),
+        ),
+        migrations.RunPython(assign_lineages, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='map',
+            name='lineage',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, verbose_name='lineage'),
+        ),
+    ]
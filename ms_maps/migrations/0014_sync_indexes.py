@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_maps', '0013_lineage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productlocation',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_maps_pro_date_mo_394d43_idx'),
+        ),
+    ]
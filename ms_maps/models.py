@@ -10,7 +10,8 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
 from mobishopper import settings
-from ms_baseline.models import DateRangedTrackedModel, DateTrackedModel, Store
+from ms_baseline import cache, sync
+from ms_baseline.models import DateRangedTrackedModel, DateTrackedModel, RevisionedModel, Store
 from ms_baseline.utils import filter_in_effect
 from ms_products.models import GenericSubaisle, Product, Subcategory
 
@@ -105,7 +106,7 @@ class Subaisle(DateTrackedModel):
         return self.name
 
 
-class Map(DateRangedTrackedModel):
+class Map(RevisionedModel):
     """A store map."""
 
     store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name=_("store"))
@@ -118,6 +119,9 @@ class Map(DateRangedTrackedModel):
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, verbose_name=_("user")
     )
 
+    class Meta:
+        indexes = [Index(fields=["store", "date_ended", "date_started"])]
+
     def get_absolute_url(self):
         """Get absolute URL of the map."""
         return reverse("ms_maps:maps_show", args=(self.id,))
@@ -166,7 +170,11 @@ class ProductLocation(DateRangedTrackedModel):
             raise ValidationError("Tile is not connected to subaisle.")
 
     class Meta:
-        indexes = [Index(fields=["product", "store"])]
+        indexes = [
+            Index(fields=["product", "store"]),
+            Index(fields=["store", "date_ended", "date_started"]),
+            Index(fields=["date_modified", "id"]),
+        ]
 
     def __str__(self):
         """Return the name of the product and store."""
@@ -233,3 +241,15 @@ def delete_subaisles_before_aisles(instance: Aisle, **kwargs):
     """Delete subaisles before aisles so that they are removed from map tiles."""
     for subaisle in instance.subaisle_set.all():
         subaisle.delete()
+
+
+cache.invalidate_on_change(cache.MAP, Map, Aisle, Subaisle, ProductLocation, scope=lambda instance: instance.store_id)
+# Tiles created in bulk do not send signals, but they are always saved with their map.
+cache.invalidate_on_change(cache.MAP, MapTile, scope=lambda instance: instance.map.store_id)
+
+sync.track(
+    "product_locations",
+    ProductLocation,
+    ["product", "store", "tile", "subaisle", "date_started", "date_ended"],
+    store_field="store",
+)
@@ -2,7 +2,12 @@
 from rest_framework import serializers
 
 from ms_maps import models
-from ms_products.serializers import ProductBasicSerializer, SubcategorySerializer
+from ms_products.serializers import (
+    OverridePrefetchListSerializer,
+    OverridePrefetchMixin,
+    ProductBasicSerializer,
+    SubcategorySerializer,
+)
 
 
 class AisleSerializer(serializers.ModelSerializer):
@@ -46,13 +51,18 @@ class MapSerializer(serializers.ModelSerializer):
         fields = ["id", "store", "width", "height", "tiles"]
 
 
-class ProductLocationSerializer(serializers.ModelSerializer):
+class ProductLocationSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for ProductLocations."""
 
     product = ProductBasicSerializer()
     tile = MapTileSerializer()
     subaisle = SubaisleSerializer()
 
+    def get_override_products(self, instance: models.ProductLocation):
+        """Get the products that will be displayed when serializing the location."""
+        return [instance.product]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.ProductLocation
         fields = ["product", "tile", "subaisle"]
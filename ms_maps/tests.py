@@ -4,6 +4,7 @@ from django.test import TestCase
 from ms_baseline.models import Store
 from ms_maps import auto_assign
 from ms_maps.models import Aisle, ProductLocation, Subaisle
+from ms_maps.utils import build_aisles_structure
 from ms_products.models import Category, Product, Subcategory, Vendor
 
 
@@ -67,6 +68,20 @@ class TestAutoAssign(TestCase):
         self.assertFalse(location.compute_auto_location(force=True))
         subaisle3.delete()
 
+    def test_aisles_structure_cache(self):
+        """Test that cached subaisle product counts are updated when product locations change."""
+
+        def get_counts():
+            return [sa.size for _aisle, subaisles in build_aisles_structure(self.store) for sa in subaisles]
+
+        self.assertEqual(get_counts(), [0, 0])
+        with self.assertNumQueries(0):
+            get_counts()
+        location = ProductLocation.create_auto_location(self.product, self.store)
+        self.assertEqual(get_counts(), [1, 0])
+        location.delete()
+        self.assertEqual(get_counts(), [0, 0])
+
     def _test_bulk_assign(self, expected):
         """Test auto-assignment by the bulk asisgnment command."""
         logger = auto_assign.AutoAssignHtmlLogWriter()
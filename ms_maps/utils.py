@@ -3,17 +3,41 @@ import collections
 import logging
 
 import django.utils.timezone
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q
 
+from ms_baseline import cache
 from ms_baseline.models import Store
-from ms_baseline.utils import filter_given_store, filter_in_effect_given_store, filter_in_effect_resolved_store
+from ms_baseline.utils import (
+    filter_given_store,
+    filter_in_effect_given_store,
+    filter_in_effect_resolved_store,
+    get_next_validity_change,
+)
 from ms_maps.models import Aisle, Map, ProductLocation, Subaisle
-from ms_products.models import Product
+from ms_products.models import Product, Subcategory
 
 logger = logging.getLogger("ms_maps_utils")
 
 
 def build_aisles_structure(store: Store, visible_only=True, include_counts=True):
+    """Get a structure of aisles, from the cache.
+
+    Product counts change when product locations go in or out of effect.
+    """
+    store_id = getattr(store, "id", store)
+    return cache.get_or_set(
+        [(cache.MAP, store_id), (cache.REFERENCE, None)],
+        ["aisles_structure", visible_only, include_counts],
+        lambda: query_aisles_structure(store, visible_only, include_counts),
+        valid_until=(
+            (lambda: get_next_validity_change(ProductLocation.objects.filter(filter_given_store(store))))
+            if include_counts
+            else None
+        ),
+    )
+
+
+def query_aisles_structure(store: Store, visible_only=True, include_counts=True, prefetch_subcategories=False):
     """Build a structure of aisles."""
     f = filter_given_store(store)
     if visible_only:
@@ -21,6 +45,10 @@ def build_aisles_structure(store: Store, visible_only=True, include_counts=True)
 
     aisles = Aisle.objects.filter(f).order_by("name")
     subaisles = Subaisle.objects.filter(f).select_related("parent").order_by("name")
+    if prefetch_subcategories:
+        subaisles = subaisles.prefetch_related(
+            Prefetch("subcategories", queryset=Subcategory.objects.select_related("parent"))
+        )
     if include_counts:
         subaisles = subaisles.annotate(
             size=Count("productlocation", filter=filter_in_effect_given_store(store, prefix="productlocation__"))
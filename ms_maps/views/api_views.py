@@ -4,7 +4,6 @@ import json
 import logging
 import typing
 
-import attr
 import cattr
 import django.utils.dateparse
 import django.utils.timezone
@@ -13,6 +12,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import transaction
+from django.db.models import Prefetch
 from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
@@ -22,8 +22,11 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 import ms_products.api_models
-from ms_baseline.api_utils import asdict_json_response
+from ms_baseline.api_utils import asdict_json_response, drf_data
+from ms_baseline.bulk import bulk_create_with_pks, can_bulk_create_with_pks
+from ms_baseline.conditional import conditional_on, get_resolved_store_id
 from ms_baseline.permission_helpers import permissions_required_maps
+from ms_baseline.query_planner import prefetch_for_serializer
 from ms_baseline.serializers import SerializerContextMixin
 from ms_baseline.utils import (
     filter_in_effect,
@@ -40,7 +43,8 @@ from ms_maps.models import Aisle, Map, MapTile, ProductLocation, Subaisle
 from ms_maps.serializers import MapSerializer, ProductLocationSerializer
 from ms_maps.utils import get_map_in_effect
 from ms_maps.views.aisle_dual_forms import FormType, GenericFormStatus, InstanceType, generic_add, generic_edit
-from ms_products.models import Product
+from ms_products import search
+from ms_products.models import Product, Subcategory
 
 logger = logging.getLogger("ms_maps.api_views")
 
@@ -55,6 +59,7 @@ class MapsCurrent(SerializerContextMixin, generics.RetrieveAPIView):
         map_in_effect = get_map_in_effect(self.request)
         if not map_in_effect:
             raise rest_framework.exceptions.NotFound()
+        prefetch_for_serializer([map_in_effect], self.get_serializer_class())
         return map_in_effect
 
 
@@ -67,7 +72,7 @@ class ProductLocationsDetail(SerializerContextMixin, generics.RetrieveAPIView):
     def get_object(self):
         """Get a product location."""
         return get_object_or_404(
-            ProductLocation.objects.select_related("product", "tile", "subaisle"),
+            self.filter_queryset(ProductLocation.objects.all()),
             filter_resolved_store(self.request),
             product=self.kwargs["product_id"],
         )
@@ -183,10 +188,10 @@ def _get_product_locations_data(
     filters_dict = {}
 
     if query and query.strip():
-        filters_dict["name__icontains"] = query.strip()
+        filters_list.append(search.search_filter(Product, query, fields=("name",)))
 
     if vendor and vendor.strip():
-        filters_dict["vendor__name__icontains"] = vendor.strip()
+        filters_list.append(search.search_filter(Product, vendor, fields=("vendor",)))
 
     if subcategory:
         try:
@@ -324,7 +329,11 @@ def product_locations_groups(request):
         map_dto = None
         map_tiles = []
 
-    db_subaisles = Subaisle.objects.filter(visible=True, store=request.ms_store).select_related("parent")
+    db_subaisles = (
+        Subaisle.objects.filter(visible=True, store=request.ms_store)
+        .select_related("parent")
+        .prefetch_related(Prefetch("subcategories", queryset=Subcategory.objects.select_related("parent")))
+    )
     groups = api_models.ProductGroupsGetResponse(
         map=map_dto,
         tiles=[api_models.MapTileDTO.from_db(t) for t in map_tiles],
@@ -343,10 +352,11 @@ def aisles_structure(request):
         aisles = []
     else:
         aisles = api_models.build_vue_aisles_structure(store)
-    return Response([attr.asdict(a) for a in aisles])
+    return Response(drf_data(aisles))
 
 
 @api_view()
+@conditional_on(Map, MapTile, Subaisle, Aisle, store_id_func=get_resolved_store_id)
 def get_map(request):
     """Get the map for a given store."""
     store = get_resolved_store(request)
@@ -358,8 +368,8 @@ def get_map(request):
     except Map.DoesNotExist:
         return Response({"error": _("Not found")}, 404)
     map_dto = api_models.MapDTO.from_db(store_map)
-    tiles_dtos = [api_models.MapTileDTO.from_db(t) for t in store_map.maptile_set.all()]
-    return Response({"map": attr.asdict(map_dto), "tiles": [attr.asdict(t) for t in tiles_dtos]})
+    tiles_dtos = [api_models.MapTileDTO.from_db(t) for t in store_map.tiles.all()]
+    return Response(drf_data({"map": map_dto, "tiles": tiles_dtos}))
 
 
 def _messages_as_map_save_error(request):
@@ -431,8 +441,13 @@ def maps_save(request):
                 if not success:
                     raise ValueError("Save failed")
 
-            for tile in tiles:
-                tile.save()
+            if can_bulk_create_with_pks(MapTile):
+                for tile in tiles:
+                    tile.map = store_map  # the map was not saved when the tiles were created
+                bulk_create_with_pks(MapTile, tiles)
+            else:
+                for tile in tiles:
+                    tile.save()
 
     except Exception as e:
         logger.exception("Failed to save map")
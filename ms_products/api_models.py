@@ -3,8 +3,11 @@
 import typing
 
 import attr
+from django.db.models import Q
 
 import ms_products.models
+from ms_baseline import cache
+from ms_baseline import vue_models as vm
 from ms_products.views.utils import build_categories_structure
 
 
@@ -44,3 +47,29 @@ def build_vue_categories_structure():
         CategoryStructureEntry.from_db(cat, [SubcategoryStructureEntry.from_db(sc) for sc in subcats])
         for cat, subcats in db_struct
     ]
+
+
+def _build_standard_meta_fields(subcategory: typing.Optional[int]) -> vm.StandardMetaFieldContainer:
+    """Build a list of standard meta fields for a given subcategory (or for all subcategories)."""
+    if subcategory:
+        fields = (
+            ms_products.models.StandardMetaField.objects.filter(
+                Q(subcategories_required=subcategory) | Q(subcategories_recommended=subcategory)
+            )
+            .distinct()
+            .prefetch_related("subcategories_required", "subcategories_recommended")
+        )
+    else:
+        fields = ms_products.models.StandardMetaField.objects.all()
+
+    vue_fields = [vm.StandardMetaField.from_db(s, subcategory) for s in fields]
+    return vm.StandardMetaFieldContainer(items=vue_fields, subcategory=subcategory)
+
+
+def build_standard_meta_fields(subcategory: typing.Optional[int] = None) -> vm.StandardMetaFieldContainer:
+    """Get a list of standard meta fields for a given subcategory (or for all subcategories), from the cache."""
+    return cache.get_or_set(
+        [(cache.REFERENCE, None)],
+        ["standard_meta_fields", subcategory],
+        lambda: _build_standard_meta_fields(subcategory),
+    )
@@ -1,8 +1,22 @@
 """Constants for ms_products."""
+from decimal import Decimal
+
 from django.utils.translation import gettext_lazy as _
 
 UNIT_CHOICES = (("1", _("pc")), ("kg", _("kg")), ("dag", _("dag")), ("g", _("g")), ("L", _("L")), ("mL", _("mL")))
 
+# Unit prices are normalized to one of these units.
+UNIT_PRICE_UNIT_CHOICES = (("1", _("pc")), ("kg", _("kg")), ("L", _("L")))
+# Amount units: (normalized unit, size of the amount unit in the normalized unit)
+UNIT_PRICE_CONVERSIONS = {
+    "1": ("1", Decimal(1)),
+    "kg": ("kg", Decimal(1)),
+    "dag": ("kg", Decimal("0.01")),
+    "g": ("kg", Decimal("0.001")),
+    "L": ("L", Decimal(1)),
+    "mL": ("L", Decimal("0.001")),
+}
+
 META_UNITS_CHOICES = (
     ("_number", _("number")),
     ("_str", _("text")),
@@ -30,5 +44,17 @@ UNIT_GROUPS = {
     "energy": ["kJ", "kcal"],
 }
 
+# Property units: unit group -> (base unit, {unit: size of the unit in the base unit})
+META_UNIT_CONVERSIONS = {
+    "weight": ("kg", {"kg": Decimal(1), "dag": Decimal("0.01"), "g": Decimal("0.001")}),
+    "volume": (
+        "L",
+        {"m³": Decimal(1000), "dm³": Decimal(1), "cm³": Decimal("0.001"), "L": Decimal(1), "mL": Decimal("0.001")},
+    ),
+    "area": ("m²", {"m²": Decimal(1), "dm²": Decimal("0.01"), "cm²": Decimal("0.0001")}),
+    "size": ("m", {"m": Decimal(1), "dm": Decimal("0.1"), "cm": Decimal("0.01"), "mm": Decimal("0.001")}),
+    "energy": ("kJ", {"kJ": Decimal(1), "kcal": Decimal("4.184")}),
+}
+
 PREFETCH_PRODUCT_BASIC = ("vendor", "subcategory", "subcategory__parent", "replaced_by")
 PREFETCH_SHOPPING_LIST = ["entries", "entries__product"] + ["entries__product__" + i for i in PREFETCH_PRODUCT_BASIC]
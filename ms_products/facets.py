@@ -0,0 +1,126 @@
+"""Facet counts of filtered product and product group lists (the number of results per subcategory, vendor, etc.).
+
+All facets are counted in one grouped query over the filtered results, and cached until the catalog of the store
+changes (or an object goes in or out of effect).
+"""
+import collections
+import decimal
+import typing
+
+import attr
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, QuerySet, Value, When
+from django.utils.translation import gettext as _
+
+from ms_baseline import cache
+from ms_baseline.utils import get_next_validity_change
+from ms_products.models import LocalProductOverride, Product
+from ms_products.overrides import annotate_effective_available, annotate_effective_price
+
+# Request facets with this query parameter (facets=1).
+FACETS_QUERY_PARAM = "facets"
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class FacetValue:
+    """A value of a facet, with the number of results that have it."""
+
+    id: typing.Any
+    name: str
+    count: int
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class PriceBandFacetValue:
+    """A price band (min inclusive, max exclusive), with the number of results in it."""
+
+    min: typing.Optional[decimal.Decimal]
+    max: typing.Optional[decimal.Decimal]
+    count: int
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class Facets:
+    """Facet counts of a list. Availability and price bands are only counted for products."""
+
+    subcategories: typing.List[FacetValue]
+    vendors: typing.List[FacetValue]
+    available: typing.Optional[typing.List[FacetValue]] = None
+    price_bands: typing.Optional[typing.List[PriceBandFacetValue]] = None
+
+
+def wants_facets(request) -> bool:
+    """Check if facets were requested."""
+    return request.query_params.get(FACETS_QUERY_PARAM) in ("1", "true")
+
+
+def get_price_bands() -> typing.List[decimal.Decimal]:
+    """Get the bounds of price bands."""
+    return [decimal.Decimal(str(bound)) for bound in getattr(settings, "MOBISHOPPER_PRICE_BANDS", [5, 10, 20, 50])]
+
+
+def _count_rows(queryset: QuerySet, store_id: typing.Optional[int]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Count the results of a queryset for every combination of facet values (in one query)."""
+    objects = queryset.model.objects.filter(pk__in=queryset.order_by().values("pk"))
+    dimensions = ["subcategory_id", "subcategory__name", "vendor_id", "vendor__name"]
+    if queryset.model is Product:
+        objects = annotate_effective_available(annotate_effective_price(objects, store_id), store_id)
+        bands = [When(effective_price__lt=bound, then=Value(i)) for i, bound in enumerate(get_price_bands())]
+        objects = objects.annotate(
+            price_band=Case(*bands, default=Value(len(bands)), output_field=IntegerField()),
+        )
+        dimensions += ["effective_available", "price_band"]
+    return list(objects.values(*dimensions).annotate(count=Count("pk")).order_by())
+
+
+def _build_facets(rows: typing.List[typing.Dict[str, typing.Any]], is_product: bool) -> Facets:
+    """Sum up the counts of combinations of facet values into facets."""
+    counters = collections.defaultdict(collections.Counter)
+    names = {}
+    for row in rows:
+        for dimension, name_field in (("subcategory", "subcategory__name"), ("vendor", "vendor__name")):
+            counters[dimension][row[dimension + "_id"]] += row["count"]
+            names[dimension, row[dimension + "_id"]] = row[name_field]
+        if is_product:
+            counters["available"][row["effective_available"]] += row["count"]
+            counters["price_band"][row["price_band"]] += row["count"]
+
+    def _values(dimension: str) -> typing.List[FacetValue]:
+        return [
+            FacetValue(id=value_id, name=names[dimension, value_id], count=count)
+            for value_id, count in sorted(counters[dimension].items(), key=lambda i: (-i[1], names[dimension, i[0]]))
+        ]
+
+    facets = Facets(subcategories=_values("subcategory"), vendors=_values("vendor"))
+    if is_product:
+        facets.available = [
+            FacetValue(id=value, name=name, count=counters["available"][value])
+            for value, name in ((True, _("available")), (False, _("unavailable")))
+            if counters["available"][value]
+        ]
+        bounds = [None] + get_price_bands() + [None]
+        facets.price_bands = [
+            PriceBandFacetValue(min=bounds[i], max=bounds[i + 1], count=counters["price_band"][i])
+            for i in range(len(bounds) - 1)
+            if counters["price_band"][i]
+        ]
+    return facets
+
+
+def build_facets(queryset: QuerySet, store_id: typing.Optional[int]) -> Facets:
+    """Count the results of a filtered queryset of products or product groups per facet value."""
+    is_product = queryset.model is Product
+
+    def valid_until():
+        changes = [get_next_validity_change(queryset.model.objects.all())]
+        if is_product and store_id:
+            changes.append(get_next_validity_change(LocalProductOverride.objects.filter(store=store_id)))
+        return min(filter(None, changes), default=None)
+
+    rows = cache.get_or_set(
+        [(cache.CATALOG, store_id), (cache.REFERENCE, None)],
+        ["facets", store_id, *cache.queryset_key_parts(queryset.order_by())],
+        lambda: _count_rows(queryset, store_id),
+        valid_until=valid_until,
+    )
+    return _build_facets(rows, is_product)
@@ -47,6 +47,13 @@ class ProductFilterForm(ProductGenericFilterForm):
 
     extra_metadata_raw = forms.CharField(label=_("Properties"), required=False)  # Takes JSON from ExtraMetadataEditor
     is_group = forms.BooleanField(label=_("Is in group"), required=False)
+    unit_price_unit = forms.ChoiceField(
+        label=_("Unit of price per unit"),
+        required=False,
+        choices=(("", "---------"),) + ms_products.constants.UNIT_PRICE_UNIT_CHOICES,
+    )
+    unit_price_min = forms.DecimalField(label=_("Minimum price per unit"), required=False, min_value=0)
+    unit_price_max = forms.DecimalField(label=_("Maximum price per unit"), required=False, min_value=0)
 
     class Media:
         css = SELECT2_MEDIA_CSS
@@ -0,0 +1,84 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import ms_baseline.models
+
+
+MODELS = ['localproductoverride', 'product', 'productgroup', 'vendor']
+
+
+def fill_sentinels(apps, schema_editor):
+    """Replace NULL validity bounds with sentinels."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_products", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name + "__isnull": True}).update(**{field_name: sentinel})
+
+
+def clear_sentinels(apps, schema_editor):
+    """Replace validity bound sentinels with NULLs."""
+    for model_name in MODELS:
+        model = apps.get_model("ms_products", model_name)
+        for field_name, bound in (("date_started", "start"), ("date_ended", "end")):
+            sentinel = ms_baseline.models.ValidityBoundField(bound=bound).sentinel
+            model.objects.filter(**{field_name: sentinel}).update(**{field_name: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0025_expected_units_energy'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_sentinels, clear_sentinels),
+        migrations.AlterField(
+            model_name='localproductoverride',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='localproductoverride',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='productgroup',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='productgroup',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='date_ended',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='end', null=True, verbose_name='valid until'),
+        ),
+        migrations.AlterField(
+            model_name='vendor',
+            name='date_started',
+            field=ms_baseline.models.ValidityBoundField(blank=True, bound='start', null=True, verbose_name='valid from'),
+        ),
+        migrations.AddIndex(
+            model_name='localproductoverride',
+            index=models.Index(fields=['product', 'store', 'date_ended'], name='ms_products_product_fc577f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'date_ended', 'date_started'], name='ms_products_store_i_a6b395_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:01
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Amount units: (normalized unit, size of the amount unit in the normalized unit)
+CONVERSIONS = {
+    "1": ("1", Decimal(1)),
+    "kg": ("kg", Decimal(1)),
+    "dag": ("kg", Decimal("0.01")),
+    "g": ("kg", Decimal("0.001")),
+    "L": ("L", Decimal(1)),
+    "mL": ("L", Decimal("0.001")),
+}
+QUANTUM = Decimal("0.0001")
+
+
+def get_unit_price(price, amount, amount_unit):
+    """Get the normalized unit and the price per normalized unit."""
+    unit, size = CONVERSIONS.get(amount_unit, (amount_unit, Decimal(1)))
+    if price is None or not amount:
+        return unit, None
+    return unit, (price / (amount * size)).quantize(QUANTUM)
+
+
+def fill_unit_prices(apps, schema_editor):
+    """Compute unit prices of all products and local overrides."""
+    Product = apps.get_model("ms_products", "Product")
+    LocalProductOverride = apps.get_model("ms_products", "LocalProductOverride")
+    amounts = {}
+    products = list(Product.objects.only("id", "price", "amount", "amount_unit"))
+    for product in products:
+        amounts[product.id] = (product.amount, product.amount_unit)
+        product.unit_price_unit, product.unit_price = get_unit_price(product.price, product.amount, product.amount_unit)
+    Product.objects.bulk_update(products, ["unit_price", "unit_price_unit"], batch_size=500)
+    overrides = list(LocalProductOverride.objects.filter(price__isnull=False).only("id", "product_id", "price"))
+    for override in overrides:
+        _unit, override.unit_price = get_unit_price(override.price, *amounts[override.product_id])
+    LocalProductOverride.objects.bulk_update(overrides, ["unit_price"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0027_lineage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='localproductoverride',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=16, null=True, verbose_name='price per unit'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=16, null=True, verbose_name='price per unit'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='unit_price_unit',
+            field=models.CharField(blank=True, choices=[('1', 'pc'), ('kg', 'kg'), ('L', 'L')], editable=False, max_length=3, verbose_name='unit of price per unit'),
+        ),
+        migrations.RunPython(fill_unit_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'unit_price_unit', 'unit_price'], name='ms_products_subcate_f5817a_idx'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+TABLE = "ms_products_searchdocument"
+FTS_TABLE = TABLE + "_fts"
+COLUMNS = "name, vendor, categories, description"
+
+SQLITE_CREATE = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({COLUMNS}, content='{TABLE}', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, new.name, new.vendor, new.categories, new.description); "
+    f"END",
+    f"CREATE TRIGGER {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.vendor, old.categories, old.description); "
+    f"END",
+    f"CREATE TRIGGER {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.vendor, old.categories, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, new.name, new.vendor, new.categories, new.description); "
+    f"END",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+# Must match ms_products.search.POSTGRESQL_VECTOR (without the table alias).
+POSTGRESQL_VECTOR = (
+    "setweight(to_tsvector('simple'::regconfig, name), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, vendor), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, categories), 'C') || "
+    "setweight(to_tsvector('simple'::regconfig, description), 'D')"
+)
+POSTGRESQL_CREATE = [f"CREATE INDEX {FTS_TABLE} ON {TABLE} USING GIN (({POSTGRESQL_VECTOR}))"]
+POSTGRESQL_DROP = [f"DROP INDEX IF EXISTS {FTS_TABLE}"]
+
+
+def _execute(schema_editor, statements):
+    """Execute SQL statements."""
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full-text index (if supported by the database)."""
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        _execute(schema_editor, POSTGRESQL_CREATE)
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if cursor.fetchone()[0]:
+                _execute(schema_editor, SQLITE_CREATE)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the full-text index."""
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        _execute(schema_editor, POSTGRESQL_DROP)
+    elif connection.vendor == "sqlite":
+        _execute(schema_editor, SQLITE_DROP)
+
+
+def build_search_documents(apps, schema_editor):
+    """Build the search documents of all products and groups."""
+    SearchDocument = apps.get_model("ms_products", "SearchDocument")
+    for kind, model_name in (("product", "Product"), ("group", "ProductGroup")):
+        model = apps.get_model("ms_products", model_name)
+        documents = [
+            SearchDocument(
+                kind=kind,
+                object_id=obj.id,
+                name=obj.name,
+                vendor=obj.vendor.name,
+                categories=f"{obj.subcategory.name} {obj.subcategory.parent.name}",
+                description=obj.description,
+            )
+            for obj in model.objects.select_related("vendor", "subcategory__parent").iterator()
+        ]
+        SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ms_products", "0028_unit_price"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(max_length=20, verbose_name="kind")),
+                ("object_id", models.IntegerField(verbose_name="object ID")),
+                ("name", models.TextField(blank=True, verbose_name="name")),
+                ("vendor", models.TextField(blank=True, verbose_name="vendor")),
+                ("categories", models.TextField(blank=True, verbose_name="categories")),
+                ("description", models.TextField(blank=True, verbose_name="description")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="searchdocument",
+            constraint=models.UniqueConstraint(fields=("kind", "object_id"), name="unique_search_document"),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:40
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Must match ms_products.constants.META_UNIT_CONVERSIONS (sizes of units in the base unit).
+UNIT_SIZES = {
+    "weight": {"kg": Decimal(1), "dag": Decimal("0.01"), "g": Decimal("0.001")},
+    "volume": {"m³": Decimal(1000), "dm³": Decimal(1), "cm³": Decimal("0.001"), "L": Decimal(1), "mL": Decimal("0.001")},
+    "area": {"m²": Decimal(1), "dm²": Decimal("0.01"), "cm²": Decimal("0.0001")},
+    "size": {"m": Decimal(1), "dm": Decimal("0.1"), "cm": Decimal("0.01"), "mm": Decimal("0.001")},
+    "energy": {"kJ": Decimal(1), "kcal": Decimal("4.184")},
+}
+
+
+def parse_number(value, units, expected_units):
+    """Parse a numeric property value, converted to the base unit of the property."""
+    if expected_units == "_bool":
+        return Decimal(1 if str(value) == "1" else 0)
+    try:
+        number = Decimal(str(value).strip().replace(",", "."))
+    except InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    if expected_units in UNIT_SIZES:
+        size = UNIT_SIZES[expected_units].get(units)
+        return None if size is None else number * size
+    return number if expected_units == "_number" else None
+
+
+def fill_product_properties(apps, schema_editor):
+    """Project the standard metadata of all products into typed properties."""
+    Product = apps.get_model("ms_products", "Product")
+    ProductProperty = apps.get_model("ms_products", "ProductProperty")
+    StandardMetaField = apps.get_model("ms_products", "StandardMetaField")
+    fields = {f.id: f for f in StandardMetaField.objects.only("id", "expected_units")}
+    product_properties = []
+    for product in Product.objects.only("id", "extra_metadata_raw").iterator():
+        for item in product.extra_metadata_raw or []:
+            try:
+                field = fields.get(int((item.get("slug") or "").rsplit("-", 1)[-1]))
+            except ValueError:
+                field = None
+            if field is None:
+                continue
+            value = item.get("value", "")
+            product_properties.append(
+                ProductProperty(
+                    product_id=product.id,
+                    field_id=field.id,
+                    value=str(value).strip().casefold()[:100],
+                    number=parse_number(value, item.get("units", ""), field.expected_units),
+                    text=item.get("text", ""),
+                )
+            )
+    ProductProperty.objects.bulk_create(product_properties, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0029_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductProperty',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='value')),
+                ('number', models.DecimalField(blank=True, decimal_places=6, max_digits=20, null=True, verbose_name='number')),
+                ('text', models.TextField(blank=True, verbose_name='text')),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ms_products.standardmetafield', verbose_name='property')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='properties', to='ms_products.product', verbose_name='product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productproperty',
+            index=models.Index(fields=['field', 'value'], name='ms_products_field_i_667107_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productproperty',
+            index=models.Index(fields=['field', 'number'], name='ms_products_field_i_d8436e_idx'),
+        ),
+        migrations.RunPython(fill_product_properties, migrations.RunPython.noop),
+    ]
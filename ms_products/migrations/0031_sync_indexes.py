@@ -0,0 +1,25 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0030_product_property'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='localproductoverride',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_products_date_mo_8b96f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_products_date_mo_570b49_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=models.Index(fields=['date_modified', 'id'], name='ms_products_date_mo_c1075e_idx'),
+        ),
+    ]
@@ -1,20 +1,31 @@
 """Models for product management."""
+import datetime
+import typing
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Index
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ngettext
 
-from ms_baseline import constants
-from ms_baseline.models import DateRangedTrackedModel, DateTrackedModel, PriceField, Store
-from ms_baseline.utils import filter_in_effect, format_decimal
-from ms_products.constants import META_UNITS_CHOICES, META_UNITS_CHOICES_DICT, UNIT_CHOICES, UNIT_GROUPS
-from ms_products.utils import get_price_per_amount_str
+from ms_baseline import cache, constants, sync
+from ms_baseline.bulk import BATCH_SIZE
+from ms_baseline.models import DateRangedTrackedModel, DateTrackedModel, PriceField, RevisionedModel, Store
+from ms_baseline.utils import filter_in_effect, filter_in_effect_after, format_decimal
+from ms_products.constants import (
+    META_UNITS_CHOICES,
+    META_UNITS_CHOICES_DICT,
+    UNIT_CHOICES,
+    UNIT_GROUPS,
+    UNIT_PRICE_UNIT_CHOICES,
+)
+from ms_products.utils import get_price_per_amount_str, get_unit_price
 
 
 class Category(DateTrackedModel):
@@ -41,6 +52,9 @@ class Subcategory(DateTrackedModel):
     visible = models.BooleanField(_("visible"), default=True)
     parent = models.ForeignKey(Category, on_delete=models.PROTECT, verbose_name=_("parent"))
 
+    class Meta:
+        indexes = [Index(fields=["date_modified", "id"])]
+
     def __str__(self):
         """Return name of the subcategory."""
         return self.name
@@ -70,7 +84,7 @@ class GenericSubaisle(DateTrackedModel):
         return reverse("ms_products:subaisles_show", args=(self.id,))
 
 
-class Vendor(DateRangedTrackedModel):
+class Vendor(RevisionedModel):
     """A vendor of products."""
 
     name = models.CharField(_("name"), max_length=100)
@@ -89,6 +103,14 @@ class Vendor(DateRangedTrackedModel):
         """Return name of the vendor."""
         return self.name
 
+    def migrate_with_revision(self, request, old_obj):
+        """Migrate objects to this revision, and update the search documents and properties of migrated products."""
+        from ms_products import properties, search
+
+        super().migrate_with_revision(request, old_obj)
+        search.update_index(Product.objects.filter(vendor=self))
+        properties.update_properties(Product.objects.filter(vendor=self))
+
     def get_absolute_url(self):
         """Get absolute URL to the vendor."""
         return reverse("ms_products:vendors_show", args=(self.id,))
@@ -99,7 +121,7 @@ class Vendor(DateRangedTrackedModel):
         return self.store is not None
 
 
-class ProductGroup(DateRangedTrackedModel):
+class ProductGroup(RevisionedModel):
     """A group of products.
 
     Products can be in a group, if they are variants of each other.
@@ -123,6 +145,14 @@ class ProductGroup(DateRangedTrackedModel):
         """Return name of the group."""
         return self.name
 
+    def migrate_with_revision(self, request, old_obj):
+        """Migrate objects to this revision, and update the search documents and properties of migrated products."""
+        from ms_products import properties, search
+
+        super().migrate_with_revision(request, old_obj)
+        search.update_index(Product.objects.filter(group=self))
+        properties.update_properties(Product.objects.filter(group=self))
+
     def get_absolute_url(self):
         """Get absolute URL to the group."""
         return reverse("ms_products:groups_show", args=(self.id,))
@@ -174,7 +204,7 @@ class StandardMetaField(DateTrackedModel):
         return reverse("ms_products:properties_edit", args=(self.id,))
 
 
-class Product(DateRangedTrackedModel):
+class Product(RevisionedModel):
     """A product."""
 
     name = models.CharField(_("name"), max_length=100)
@@ -186,6 +216,13 @@ class Product(DateRangedTrackedModel):
     amount = models.DecimalField(_("amount"), decimal_places=3, max_digits=10)
     amount_unit = models.CharField(_("amount unit"), choices=UNIT_CHOICES, max_length=3)
     any_amount = models.BooleanField(_("any amount possible"), default=False)
+    # Price per normalized unit (1 kg, 1 L or 1 pc), for sorting and filtering (updated on save)
+    unit_price = models.DecimalField(
+        _("price per unit"), decimal_places=4, max_digits=16, blank=True, null=True, editable=False
+    )
+    unit_price_unit = models.CharField(
+        _("unit of price per unit"), choices=UNIT_PRICE_UNIT_CHOICES, max_length=3, blank=True, editable=False
+    )
     store = models.ForeignKey(Store, on_delete=models.CASCADE, blank=True, null=True, verbose_name=_("store"))
     # Stores slug and unit data (name, text, slug, value, unit)
     extra_metadata_raw = models.JSONField(default=list, blank=True, verbose_name=_("properties"))
@@ -219,6 +256,36 @@ class Product(DateRangedTrackedModel):
         """Return price per amount as string."""
         return get_price_per_amount_str(self.price, self.amount, self.amount_unit)
 
+    def unit_price_str(self):
+        """Return price per normalized unit as string."""
+        if self.unit_price is None:
+            return ""
+        return get_price_per_amount_str(self.unit_price, 1, self.unit_price_unit)
+
+    def update_unit_price(self):
+        """Update the price per normalized unit."""
+        self.unit_price_unit, self.unit_price = get_unit_price(self.price, self.amount, self.amount_unit)
+
+    def update_override_unit_prices(self):
+        """Update the prices per normalized unit of local overrides of this product."""
+        overrides = list(self.localproductoverride_set.only("id", "price", "unit_price"))
+        changed = []
+        for override in overrides:
+            old_unit_price = override.unit_price
+            override.update_unit_price(self)
+            if override.unit_price != old_unit_price:
+                changed.append(override)
+        if changed:
+            now = timezone.now()
+            for override in changed:
+                override.date_modified = now
+            LocalProductOverride.objects.bulk_update(changed, ["unit_price", "date_modified"], batch_size=BATCH_SIZE)
+
+    def migrate_with_revision(self, request, old_obj):
+        """Migrate objects to this revision, and update the unit prices of migrated local overrides."""
+        super().migrate_with_revision(request, old_obj)
+        self.update_override_unit_prices()
+
     def build_extra_metadata_dict(self):
         """Build a dict of extra metadata."""
         if self.extra_metadata_raw:
@@ -227,13 +294,51 @@ class Product(DateRangedTrackedModel):
             return {}
 
     def get_price(self, store=None, now=None):
-        """Get the price of this product in a given store at a given time."""
+        """Get the price of this product in a given store at a given time (see LocalProductOverride)."""
         if store is None:
             return self.price
         override: LocalProductOverride = (
-            self.localproductoverride_set.filter(filter_in_effect(now), store=store).order_by("price").first()
+            self.localproductoverride_set.filter(filter_in_effect(now), store=store).order_by("-id").first()
         )
-        return override.price if override else self.price
+        return override.price if override and override.price is not None else self.price
+
+    @staticmethod
+    def get_prices(products: typing.Iterable["Product"], store=None, now=None) -> typing.Dict[int, typing.Any]:
+        """Get the prices of products in a given store at a given time (as in get_price), with at most one query."""
+        return Product.get_prices_and_changes(products, store, now)[0]
+
+    @staticmethod
+    def get_prices_and_changes(
+        products: typing.Iterable["Product"], store=None, now=None
+    ) -> typing.Tuple[typing.Dict[int, typing.Any], typing.Dict[int, datetime.datetime]]:
+        """Get the prices of products in a given store at a given time (as in get_price), with at most one query.
+
+        Also get the next dates when the prices may change, as a local override goes in or out of effect (products
+        without a planned change are left out).
+        """
+        if now is None:
+            now = timezone.now()
+        base_prices = {p.id: p.price for p in products}
+        prices = dict(base_prices)
+        changes: typing.Dict[int, datetime.datetime] = {}
+        if store is None or not prices:
+            return prices, changes
+        overrides = (
+            LocalProductOverride.objects.filter(filter_in_effect_after(now), store=store, product__in=list(prices))
+            .only("product_id", "price", "date_started", "date_ended")
+            .order_by("id")
+        )
+        for override in overrides:
+            if override.in_effect(now):
+                # Overrides are ordered by ID, so the newest one in effect is applied last.
+                prices[override.product_id] = (
+                    override.price if override.price is not None else base_prices[override.product_id]
+                )
+            for date in (override.date_started, override.date_ended):
+                if date is not None and date > now:
+                    change = changes.get(override.product_id)
+                    changes[override.product_id] = date if change is None else min(change, date)
+        return prices, changes
 
     @staticmethod
     def build_extra_metadata_dict_from_raw(extra_metadata_raw):
@@ -262,18 +367,33 @@ class Product(DateRangedTrackedModel):
         """Check if the product is store-specific."""
         return self.store is not None
 
+    class Meta:
+        indexes = [
+            Index(fields=["store", "date_ended", "date_started"]),
+            Index(fields=["subcategory", "unit_price_unit", "unit_price"]),
+            Index(fields=["date_modified", "id"]),
+        ]
+
     def __str__(self):
         """Return name of the product."""
         return self.name
 
 
 class LocalProductOverride(DateRangedTrackedModel):
-    """A store-specific product override."""
+    """A store-specific product override.
+
+    If several overrides of a product are in effect in a store, the newest one (with the highest ID) applies. An override
+    without a price keeps the price of the product.
+    """
 
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name=_("product"))
     store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name=_("store"))
     available = models.BooleanField(_("is available"), default=True)
     price = PriceField(_("price"), blank=True, null=True)
+    # Price per normalized unit of the product (see Product.unit_price)
+    unit_price = models.DecimalField(
+        _("price per unit"), decimal_places=4, max_digits=16, blank=True, null=True, editable=False
+    )
     note = models.TextField(_("note"), blank=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, verbose_name=_("user")
@@ -285,6 +405,47 @@ class LocalProductOverride(DateRangedTrackedModel):
         if self.price <= 0:
             raise ValidationError(_("The price must be greater than 0."))
 
+    def update_unit_price(self, product: typing.Optional[Product] = None):
+        """Update the price per normalized unit, based on the amount of the product."""
+        if product is None:
+            if self.product_id is None:
+                return
+            product = self.product
+        _unit, self.unit_price = get_unit_price(self.price, product.amount, product.amount_unit)
+
+    class Meta:
+        indexes = [Index(fields=["product", "store", "date_ended"]), Index(fields=["date_modified", "id"])]
+
+
+class ProductProperty(models.Model):
+    """A typed value of a standard property of a product, projected from extra_metadata_raw (see ms_products.properties).
+
+    The number is the value in the base unit of the property (e.g. kilograms for weights), if it is numeric.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="properties", verbose_name=_("product"))
+    field = models.ForeignKey(StandardMetaField, on_delete=models.CASCADE, verbose_name=_("property"))
+    value = models.CharField(_("value"), max_length=100)
+    number = models.DecimalField(_("number"), max_digits=20, decimal_places=6, blank=True, null=True)
+    text = models.TextField(_("text"), blank=True)
+
+    class Meta:
+        indexes = [Index(fields=["field", "value"]), Index(fields=["field", "number"])]
+
+
+class SearchDocument(models.Model):
+    """The searchable text of a product or a product group (see ms_products.search)."""
+
+    kind = models.CharField(_("kind"), max_length=20)
+    object_id = models.IntegerField(_("object ID"))
+    name = models.TextField(_("name"), blank=True)
+    vendor = models.TextField(_("vendor"), blank=True)
+    categories = models.TextField(_("categories"), blank=True)
+    description = models.TextField(_("description"), blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["kind", "object_id"], name="unique_search_document")]
+
 
 @receiver(models.signals.pre_save, sender=Product)
 def update_extra_metadata_dict(instance: Product, **kwargs):
@@ -292,6 +453,74 @@ def update_extra_metadata_dict(instance: Product, **kwargs):
     instance.extra_metadata_dict = instance.build_extra_metadata_dict()
 
 
+@receiver(models.signals.pre_save, sender=Product)
+def update_product_unit_price(instance: Product, **kwargs):
+    """Update the price per normalized unit on Product objects."""
+    instance.update_unit_price()
+
+
+@receiver(models.signals.post_save, sender=Product)
+def update_product_override_unit_prices(instance: Product, created: bool, **kwargs):
+    """Update the prices per normalized unit of local overrides when a product changes."""
+    if not created:
+        instance.update_override_unit_prices()
+
+
+@receiver(models.signals.pre_save, sender=LocalProductOverride)
+def update_override_unit_price(instance: LocalProductOverride, **kwargs):
+    """Update the price per normalized unit on LocalProductOverride objects."""
+    instance.update_unit_price()
+
+
+@receiver(models.signals.post_save, sender=Product)
+@receiver(models.signals.post_save, sender=ProductGroup)
+def update_search_document(sender, instance, **kwargs):
+    """Update the search document of a product or a group."""
+    from ms_products import search
+
+    search.update_index(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(models.signals.post_save, sender=Product)
+def update_product_properties(instance: Product, **kwargs):
+    """Update the typed property values of a product."""
+    from ms_products import properties
+
+    properties.update_properties(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(models.signals.post_save, sender=StandardMetaField)
+def update_field_properties(instance: StandardMetaField, created: bool, **kwargs):
+    """Update the typed property values of products when the units of a property change."""
+    from ms_products import properties
+
+    if not created:
+        properties.update_properties(Product.objects.filter(properties__field=instance).distinct())
+
+
+@receiver(models.signals.post_delete, sender=Product)
+@receiver(models.signals.post_delete, sender=ProductGroup)
+def remove_search_document(sender, instance, **kwargs):
+    """Remove the search document of a deleted product or group."""
+    from ms_products import search
+
+    search.remove_from_index(sender, instance.pk)
+
+
+@receiver(models.signals.post_save, sender=Vendor)
+@receiver(models.signals.post_save, sender=Subcategory)
+@receiver(models.signals.post_save, sender=Category)
+def update_related_search_documents(sender, instance, created: bool, **kwargs):
+    """Update the search documents of products and groups when the name of a vendor or category changes."""
+    from ms_products import search
+
+    if created:
+        return
+    lookup = {Vendor: "vendor", Subcategory: "subcategory", Category: "subcategory__parent"}[sender]
+    for model in (Product, ProductGroup):
+        search.update_index(model.objects.filter(**{lookup: instance}))
+
+
 @receiver(models.signals.post_save, sender=GenericSubaisle)
 def propagate_generic_subaisle(instance: GenericSubaisle, **kwargs):
     """Propagate changes from a generic subaisle to subaisles in stores."""
@@ -316,3 +545,43 @@ Product.REVISION_MIGRATIONS = [
 ]
 ProductGroup.REVISION_MIGRATIONS = [(Product, "group")]
 Vendor.REVISION_MIGRATIONS = [(Product, "vendor")]
+
+# Tables read by product serializers (used for ETags of API responses)
+PRODUCT_SERIALIZER_MODELS = (Product, LocalProductOverride, Vendor, Subcategory, Category)
+
+cache.invalidate_on_change(
+    cache.CATALOG, Product, LocalProductOverride, Vendor, ProductGroup, scope=lambda instance: instance.store_id
+)
+cache.invalidate_on_change(cache.REFERENCE, Category, Subcategory, GenericSubaisle, StandardMetaField)
+
+sync.track("subcategories", Subcategory, ["name", "description", "visible", "parent"])
+sync.track(
+    "products",
+    Product,
+    [
+        "name",
+        "description",
+        "vendor",
+        "subcategory",
+        "group",
+        "photo",
+        "price",
+        "amount",
+        "amount_unit",
+        "any_amount",
+        "unit_price",
+        "unit_price_unit",
+        "extra_metadata_dict",
+        "replaced_by",
+        "store",
+        "date_started",
+        "date_ended",
+    ],
+    store_field="store",
+)
+sync.track(
+    "product_overrides",
+    LocalProductOverride,
+    ["product", "store", "available", "price", "unit_price", "note", "date_started", "date_ended"],
+    store_field="store",
+)
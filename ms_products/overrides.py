@@ -0,0 +1,96 @@
+"""Store-aware resolution of local product overrides."""
+import typing
+
+import django.utils.timezone
+from django.db.models import BooleanField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ms_baseline.utils import filter_in_effect
+from ms_products.models import LocalProductOverride, Product
+
+
+class OverrideResolver:
+    """Resolve the LocalProductOverrides in effect in a store, fetching them for many products at once."""
+
+    def __init__(self, store_id, now=None):
+        """Initialize the resolver for a store (or None, in which case no overrides apply)."""
+        self.store_id = store_id
+        self.now = now if now is not None else django.utils.timezone.now()
+        self._overrides: typing.Dict[int, typing.Optional[LocalProductOverride]] = {}
+
+    def prefetch(self, products: typing.Iterable[typing.Union[Product, int, None]]):
+        """Fetch the overrides in effect for all products that were not resolved yet, in one query."""
+        product_ids = set()
+        for product in products:
+            product_id = product.id if isinstance(product, Product) else product
+            if product_id is not None and product_id not in self._overrides:
+                product_ids.add(product_id)
+        if not product_ids:
+            return
+
+        for product_id in product_ids:
+            self._overrides[product_id] = None
+        if not self.store_id:
+            return
+
+        overrides = LocalProductOverride.objects.filter(
+            filter_in_effect(self.now), store=self.store_id, product__in=product_ids
+        ).order_by("id")
+        for override in overrides:
+            # The newest override in effect applies (see LocalProductOverride).
+            self._overrides[override.product_id] = override
+
+    def get(self, product: Product) -> typing.Optional[LocalProductOverride]:
+        """Get the override in effect for a product."""
+        if product.id not in self._overrides:
+            self.prefetch([product.id])
+        return self._overrides[product.id]
+
+
+def get_override_resolver(context: typing.MutableMapping[str, typing.Any]) -> OverrideResolver:
+    """Get the override resolver for a serializer context, creating it if necessary."""
+    resolver = context.get("override_resolver")
+    if resolver is None:
+        resolver = OverrideResolver(context.get("store_id"))
+        context["override_resolver"] = resolver
+    return resolver
+
+
+def _overrides_in_effect_subquery(store_id, now=None):
+    """Get a subquery of the overrides in effect for the outer product in a store (the newest one first)."""
+    return LocalProductOverride.objects.filter(filter_in_effect(now), store=store_id, product=OuterRef("pk")).order_by(
+        "-id"
+    )
+
+
+def annotate_effective_price(queryset, store_id, now=None):
+    """Annotate products with their price in a store (effective_price)."""
+    if not store_id:
+        return queryset.annotate(effective_price=F("price"))
+    overrides = _overrides_in_effect_subquery(store_id, now)
+    return queryset.annotate(effective_price=Coalesce(Subquery(overrides.values("price")[:1]), F("price")))
+
+
+def annotate_effective_unit_price(queryset, store_id, now=None):
+    """Annotate products with their price per normalized unit in a store (effective_unit_price).
+
+    The newest override in effect applies (see LocalProductOverride).
+    """
+    if not store_id:
+        return queryset.annotate(effective_unit_price=F("unit_price"))
+    overrides = _overrides_in_effect_subquery(store_id, now)
+    return queryset.annotate(
+        effective_unit_price=Coalesce(Subquery(overrides.values("unit_price")[:1]), F("unit_price"))
+    )
+
+
+def annotate_effective_available(queryset, store_id, now=None):
+    """Annotate products with their availability in a store (effective_available)."""
+    if not store_id:
+        return queryset.annotate(effective_available=Value(True, output_field=BooleanField()))
+    overrides = _overrides_in_effect_subquery(store_id, now)
+    return queryset.annotate(
+        effective_available=Coalesce(
+            Subquery(overrides.values("available")[:1]), Value(True), output_field=BooleanField()
+        )
+    )
@@ -0,0 +1,190 @@
+"""Typed product properties, projected from extra_metadata_raw into ProductProperty for filtering and facet counts.
+
+Only standard properties (identified by the slugs of StandardMetaField objects) are projected. Values are matched after
+normalization (stripped and case-folded). Numbers (including yes/no values, as 1 and 0) are stored in the base unit of
+the property, so ranges can be compared across units.
+"""
+import decimal
+import re
+import typing
+
+import attr
+import rest_framework.exceptions
+from django.db import transaction
+from django.db.models import Count, Min, Q, QuerySet
+from django.utils.translation import gettext as _
+
+from ms_baseline.bulk import BATCH_SIZE
+from ms_products.constants import META_UNIT_CONVERSIONS
+from ms_products.models import Product, ProductProperty, StandardMetaField
+
+# Query parameters: prop.<slug> (exact value), prop.<slug>.min and prop.<slug>.max (numeric range, with optional units)
+PARAM_PREFIX = "prop."
+VALUE_MAX_LENGTH = ProductProperty._meta.get_field("value").max_length
+NUMBER_RE = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?)\s*(\S*)\s*$")
+
+
+def get_field_id(slug: str) -> typing.Optional[int]:
+    """Get the ID of a standard property from its slug."""
+    try:
+        return int(slug.rsplit("-", 1)[-1])
+    except ValueError:
+        return None
+
+
+def normalize_value(value) -> str:
+    """Normalize a property value for exact matching."""
+    return str(value).strip().casefold()[:VALUE_MAX_LENGTH]
+
+
+def parse_number(value, units: str, expected_units: str) -> typing.Optional[decimal.Decimal]:
+    """Parse a numeric property value, converted to the base unit of the property."""
+    if expected_units == "_bool":
+        return decimal.Decimal(1 if str(value) == "1" else 0)
+    try:
+        number = decimal.Decimal(str(value).strip().replace(",", "."))
+    except decimal.InvalidOperation:
+        return None
+    if not number.is_finite():
+        return None
+    if expected_units in META_UNIT_CONVERSIONS:
+        _base_unit, sizes = META_UNIT_CONVERSIONS[expected_units]
+        if units not in sizes:
+            return None
+        number *= sizes[units]
+    elif expected_units != "_number":
+        return None
+    return number
+
+
+def build_properties(product: Product, fields: typing.Mapping[int, StandardMetaField]) -> typing.List[ProductProperty]:
+    """Build the typed property values of a product."""
+    product_properties = []
+    for item in product.extra_metadata_raw or []:
+        field = fields.get(get_field_id(item.get("slug") or ""))
+        if field is None:
+            continue
+        value = item.get("value", "")
+        product_properties.append(
+            ProductProperty(
+                product_id=product.id,
+                field_id=field.id,
+                value=normalize_value(value),
+                number=parse_number(value, item.get("units", ""), field.expected_units),
+                text=item.get("text", ""),
+            )
+        )
+    return product_properties
+
+
+def update_properties(queryset: QuerySet):
+    """Update the typed property values of the products in a queryset."""
+    with transaction.atomic(using=queryset.db):
+        ProductProperty.objects.filter(product__in=queryset.values("id")).delete()
+        fields = {f.id: f for f in StandardMetaField.objects.only("id", "expected_units")}
+        products = queryset.only("id", "extra_metadata_raw").order_by().iterator(chunk_size=BATCH_SIZE)
+        ProductProperty.objects.bulk_create(
+            (p for product in products for p in build_properties(product, fields)), batch_size=BATCH_SIZE
+        )
+
+
+def rebuild_properties():
+    """Rebuild the typed property values of all products (e.g. after creating products in bulk)."""
+    update_properties(Product.objects.all())
+
+
+def _parse_range_param(value: str, field: StandardMetaField, param: str) -> decimal.Decimal:
+    """Parse a numeric range parameter (a number with optional units, e.g. 500 g)."""
+    match = NUMBER_RE.match(value)
+    if not match:
+        raise rest_framework.exceptions.ValidationError({param: _("Enter a number.")})
+    number, units = match.groups()
+    if not units and field.expected_units in META_UNIT_CONVERSIONS:
+        units = META_UNIT_CONVERSIONS[field.expected_units][0]
+    parsed = parse_number(number, units, field.expected_units)
+    if parsed is None:
+        raise rest_framework.exceptions.ValidationError({param: _("Unknown units.")})
+    return parsed
+
+
+def property_filters(query_params: typing.Mapping[str, str]) -> typing.List[Q]:
+    """Build filters of products from property query parameters (prop.<slug>, prop.<slug>.min, prop.<slug>.max)."""
+    conditions: typing.Dict[int, typing.Dict[str, typing.Any]] = {}
+    for param in query_params:
+        if not param.startswith(PARAM_PREFIX) or not query_params[param]:
+            continue
+        slug, _sep, bound = param[len(PARAM_PREFIX) :].partition(".")
+        field_id = get_field_id(slug)
+        if field_id is None or bound not in ("", "min", "max"):
+            raise rest_framework.exceptions.ValidationError({param: _("Unknown property.")})
+        lookup = {"": "value", "min": "number__gte", "max": "number__lte"}[bound]
+        conditions.setdefault(field_id, {})[lookup] = (param, query_params[param])
+
+    if not conditions:
+        return []
+    fields = StandardMetaField.objects.in_bulk(list(conditions))
+    filters = []
+    for field_id, lookups in conditions.items():
+        field = fields.get(field_id)
+        if field is None:
+            raise rest_framework.exceptions.ValidationError({lookups[next(iter(lookups))][0]: _("Unknown property.")})
+        property_filter = {"field": field_id}
+        for lookup, (param, value) in lookups.items():
+            if lookup == "value":
+                property_filter[lookup] = normalize_value(value)
+            else:
+                property_filter[lookup] = _parse_range_param(value, field, param)
+        filters.append(Q(pk__in=ProductProperty.objects.filter(**property_filter).values("product_id")))
+    return filters
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class PropertyFacetValue:
+    """A value of a property, with the number of products that have it."""
+
+    value: str
+    text: str
+    count: int
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class PropertyFacet:
+    """The values of a property among a set of products."""
+
+    slug: str
+    name: str
+    expected_units: str
+    base_unit: typing.Optional[str]
+    min: typing.Optional[decimal.Decimal]
+    max: typing.Optional[decimal.Decimal]
+    values: typing.List[PropertyFacetValue]
+
+
+def build_facets(products: QuerySet) -> typing.List[PropertyFacet]:
+    """Count the products with each value of each property (in one query)."""
+    rows = (
+        ProductProperty.objects.filter(product__in=products.values("pk"))
+        .values("field_id", "field__name", "field__expected_units", "value")
+        .annotate(count=Count("product_id", distinct=True), text=Min("text"), number=Min("number"))
+        .order_by("field__name", "field_id", "value")
+    )
+    facets: typing.Dict[int, PropertyFacet] = {}
+    for row in rows:
+        facet = facets.get(row["field_id"])
+        if facet is None:
+            expected_units = row["field__expected_units"]
+            facet = facets[row["field_id"]] = PropertyFacet(
+                slug=StandardMetaField(id=row["field_id"], name=row["field__name"]).slug,
+                name=row["field__name"],
+                expected_units=expected_units,
+                base_unit=META_UNIT_CONVERSIONS[expected_units][0] if expected_units in META_UNIT_CONVERSIONS else None,
+                min=None,
+                max=None,
+                values=[],
+            )
+        facet.values.append(PropertyFacetValue(value=row["value"], text=row["text"], count=row["count"]))
+        number = row["number"]
+        if number is not None:
+            facet.min = number if facet.min is None else min(facet.min, number)
+            facet.max = number if facet.max is None else max(facet.max, number)
+    return list(facets.values())
@@ -0,0 +1,191 @@
+"""Full-text search of products and product groups, based on a search index that is updated when objects change.
+
+The searchable text of every product and group is stored in SearchDocument (name, vendor, categories, description).
+The documents are indexed with FTS5 on SQLite, and with a GIN index over a weighted tsvector on PostgreSQL (both
+created in migration 0029_search_document). Other databases, and SQLite builds without FTS5, search the documents with
+icontains. Query terms match word prefixes, and matches in the name rank higher than in the vendor, categories and
+description (in that order).
+"""
+import functools
+import operator
+import re
+import typing
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import FloatField, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+
+from ms_baseline.bulk import BATCH_SIZE
+from ms_products.models import Product, ProductGroup, SearchDocument
+
+FIELDS = ("name", "vendor", "categories", "description")
+MAX_TERMS = 10
+
+DOCUMENT_TABLE = SearchDocument._meta.db_table
+# Must match migration 0029_search_document.
+SQLITE_FTS_TABLE = DOCUMENT_TABLE + "_fts"
+SQLITE_FTS_WEIGHTS = "10.0, 5.0, 3.0, 1.0"
+POSTGRESQL_WEIGHTS = dict(zip(FIELDS, "ABCD"))
+POSTGRESQL_VECTOR = " || ".join(
+    f"setweight(to_tsvector('simple'::regconfig, d.{field}), '{weight}')"
+    for field, weight in POSTGRESQL_WEIGHTS.items()
+)
+
+SEARCHABLE_MODELS: typing.Dict[str, typing.Type[models.Model]] = {"product": Product, "group": ProductGroup}
+
+
+def get_kind(model: typing.Type[models.Model]) -> str:
+    """Get the kind of search documents of a model."""
+    for kind, searchable_model in SEARCHABLE_MODELS.items():
+        if model is searchable_model:
+            return kind
+    raise ValueError(f"{model} is not searchable")
+
+
+def get_terms(query: str) -> typing.List[str]:
+    """Split a search query into terms."""
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """A search backend that finds documents with icontains (used if no full-text index is available)."""
+
+    def match(self, kind: str, terms: typing.Sequence[str], fields: typing.Sequence[str]):
+        """Get a subquery of the IDs of objects whose documents contain all terms in any of the fields."""
+        documents = SearchDocument.objects.filter(kind=kind)
+        for term in terms:
+            documents = documents.filter(
+                functools.reduce(operator.or_, [Q(**{f + "__icontains": term}) for f in fields])
+            )
+        return documents.values("object_id")
+
+    def rank(self, kind: str, terms: typing.Sequence[str], outer_pk: str):
+        """Get an expression with the relevance of the outer object (higher is better)."""
+        return Value(0.0, output_field=FloatField())
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """A search backend based on SQLite FTS5, ranked with BM25."""
+
+    def _fts_query(self, terms: typing.Sequence[str], fields: typing.Sequence[str]) -> str:
+        """Build an FTS5 query with prefix matching of all terms, restricted to the fields."""
+        expression = " AND ".join(f'"{term}"*' for term in terms)
+        return f"{{{' '.join(fields)}}} : ({expression})"
+
+    def match(self, kind: str, terms: typing.Sequence[str], fields: typing.Sequence[str]):
+        """Get a subquery of the IDs of objects whose documents contain all terms in any of the fields."""
+        return RawSQL(
+            f"SELECT d.object_id FROM {DOCUMENT_TABLE} d WHERE d.kind = %s AND d.id IN "
+            f"(SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s)",
+            (kind, self._fts_query(terms, fields)),
+        )
+
+    def rank(self, kind: str, terms: typing.Sequence[str], outer_pk: str):
+        """Get an expression with the relevance of the outer object (higher is better)."""
+        return RawSQL(
+            f"SELECT -bm25({SQLITE_FTS_TABLE}, {SQLITE_FTS_WEIGHTS}) FROM {SQLITE_FTS_TABLE} "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND rowid = "
+            f"(SELECT d.id FROM {DOCUMENT_TABLE} d WHERE d.kind = %s AND d.object_id = {outer_pk})",
+            (self._fts_query(terms, FIELDS), kind),
+            output_field=FloatField(),
+        )
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """A search backend based on PostgreSQL full-text search, ranked with ts_rank."""
+
+    def _tsquery(self, terms: typing.Sequence[str], fields: typing.Sequence[str]) -> str:
+        """Build a tsquery with prefix matching of all terms, restricted to the weights of the fields."""
+        weights = "".join(POSTGRESQL_WEIGHTS[field] for field in fields)
+        return " & ".join(f"{term}:*{weights}" for term in terms)
+
+    def match(self, kind: str, terms: typing.Sequence[str], fields: typing.Sequence[str]):
+        """Get a subquery of the IDs of objects whose documents contain all terms in any of the fields."""
+        return RawSQL(
+            f"SELECT d.object_id FROM {DOCUMENT_TABLE} d "
+            f"WHERE d.kind = %s AND ({POSTGRESQL_VECTOR}) @@ to_tsquery('simple'::regconfig, %s)",
+            (kind, self._tsquery(terms, fields)),
+        )
+
+    def rank(self, kind: str, terms: typing.Sequence[str], outer_pk: str):
+        """Get an expression with the relevance of the outer object (higher is better)."""
+        return RawSQL(
+            f"SELECT ts_rank({POSTGRESQL_VECTOR}, to_tsquery('simple'::regconfig, %s)) FROM {DOCUMENT_TABLE} d "
+            f"WHERE d.kind = %s AND d.object_id = {outer_pk}",
+            (self._tsquery(terms, FIELDS), kind),
+            output_field=FloatField(),
+        )
+
+
+def get_backend(using: str = "default") -> SearchBackend:
+    """Get the search backend for a database."""
+    connection = connections[using]
+    backend = getattr(connection, "ms_search_backend", None)
+    if backend is None:
+        if not getattr(settings, "MOBISHOPPER_FULL_TEXT_SEARCH", True):
+            backend = SearchBackend()
+        elif connection.vendor == "postgresql":
+            backend = PostgreSQLSearchBackend()
+        elif connection.vendor == "sqlite" and SQLITE_FTS_TABLE in connection.introspection.table_names():
+            backend = SQLiteSearchBackend()
+        else:
+            backend = SearchBackend()
+        connection.ms_search_backend = backend
+    return backend
+
+
+def search_filter(
+    model: typing.Type[models.Model],
+    query: str,
+    fields: typing.Sequence[str] = FIELDS,
+    using: str = "default",
+) -> Q:
+    """Filter objects of a model that match a search query (all terms, in any of the fields)."""
+    terms = get_terms(query)
+    if not terms:
+        return Q(name__icontains=query.strip()) if query.strip() else Q()
+    return Q(pk__in=get_backend(using).match(get_kind(model), terms, fields))
+
+
+def annotate_rank(queryset: QuerySet, query: str) -> QuerySet:
+    """Annotate the relevance of objects to a search query as search_rank (higher is better)."""
+    model = queryset.model
+    terms = get_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    connection = connections[queryset.db]
+    outer_pk = f"{connection.ops.quote_name(model._meta.db_table)}.{connection.ops.quote_name(model._meta.pk.column)}"
+    return queryset.annotate(search_rank=get_backend(queryset.db).rank(get_kind(model), terms, outer_pk))
+
+
+def build_document(kind: str, obj) -> SearchDocument:
+    """Build the search document of a product or a group."""
+    return SearchDocument(
+        kind=kind,
+        object_id=obj.id,
+        name=obj.name,
+        vendor=obj.vendor.name,
+        categories=f"{obj.subcategory.name} {obj.subcategory.parent.name}",
+        description=obj.description,
+    )
+
+
+def update_index(queryset: QuerySet):
+    """Update the search documents of the objects in a queryset of products or groups."""
+    kind = get_kind(queryset.model)
+    with transaction.atomic(using=queryset.db):
+        SearchDocument.objects.filter(kind=kind, object_id__in=queryset.values("id")).delete()
+        objects = queryset.select_related("vendor", "subcategory__parent").order_by().iterator(chunk_size=BATCH_SIZE)
+        SearchDocument.objects.bulk_create((build_document(kind, obj) for obj in objects), batch_size=BATCH_SIZE)
+
+
+def remove_from_index(model: typing.Type[models.Model], object_id: int):
+    """Remove the search document of an object."""
+    SearchDocument.objects.filter(kind=get_kind(model), object_id=object_id).delete()
+
+
+def rebuild_index():
+    """Rebuild the search documents of all products and groups (e.g. after creating objects in bulk)."""
+    for model in SEARCHABLE_MODELS.values():
+        update_index(model.objects.all())
@@ -1,8 +1,14 @@
 """REST serializers for ms_products."""
+import typing
+
+import django.utils.timezone
+from django.db.models import Manager
 from rest_framework import serializers
 
-from ms_baseline.utils import filter_in_effect, filter_in_effect_visited_store
+from ms_baseline.query_planner import is_prefetched
+from ms_baseline.utils import filter_in_effect_visited_store
 from ms_products import models
+from ms_products.overrides import get_override_resolver
 from ms_products.utils import get_price_per_amount_str
 
 
@@ -32,7 +38,27 @@ class VendorSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "logo", "description", "website"]
 
 
-class ProductBaseSerializer(serializers.ModelSerializer):
+class OverridePrefetchListSerializer(serializers.ListSerializer):
+    """Serialize a list, resolving the product overrides for all items in one query beforehand."""
+
+    def to_representation(self, data):
+        """Convert a list or QuerySet to its representation."""
+        iterable = data.all() if isinstance(data, Manager) else data
+        items = list(iterable)
+        resolver = get_override_resolver(self.context)
+        resolver.prefetch(p for item in items for p in self.child.get_override_products(item))
+        return [self.child.to_representation(item) for item in items]
+
+
+class OverridePrefetchMixin:
+    """A mixin for serializers that (possibly indirectly) show products with overrides."""
+
+    def get_override_products(self, instance) -> typing.Iterable[models.Product]:
+        """Get the products that will be displayed when serializing the instance."""
+        return []
+
+
+class ProductBaseSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """The base class for Product serializers."""
 
     vendor = VendorSerializer()
@@ -41,9 +67,13 @@ class ProductBaseSerializer(serializers.ModelSerializer):
     available = serializers.SerializerMethodField()
     price_per_amount = serializers.SerializerMethodField()
 
+    def get_override_products(self, instance):
+        """Get the products that will be displayed when serializing the instance."""
+        return [instance]
+
     def get_override(self, product):
         """Get the product override in effect."""
-        return product.localproductoverride_set.filter(filter_in_effect(), store=self.context["store_id"]).last()
+        return get_override_resolver(self.context).get(product)
 
     def get_available(self, product):
         """Get the product availability status."""
@@ -55,14 +85,14 @@ class ProductBaseSerializer(serializers.ModelSerializer):
     def get_price(self, product):
         """Get the product price."""
         override = self.get_override(product)
-        if override:
+        if override and override.price is not None:
             return str(override.price)
         return str(product.price)
 
     def get_price_per_amount(self, product):
         """Get the price-per-amount for the product."""
         override = self.get_override(product)
-        if override:
+        if override and override.price is not None:
             price = override.price
         else:
             price = product.price
@@ -73,6 +103,7 @@ class ProductBasicSerializer(ProductBaseSerializer):
     """A basic serializer for Products."""
 
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.Product
         fields = [
             "id",
@@ -126,16 +157,24 @@ class ProductSerializer(ProductBaseSerializer):
         return None
 
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.Product
         fields = PRODUCT_SERIALIZER_FIELDS
 
 
-class CurrentListSerializer(serializers.ListSerializer):
+class CurrentListSerializer(OverridePrefetchListSerializer):
     """Serialize a QuerySet, filtering it to products in effects only."""
 
     def to_representation(self, data):
         """Convert a QuerySet to its representation."""
-        data = data.filter(filter_in_effect_visited_store(self.context["request"]))
+        if is_prefetched(data):
+            now = django.utils.timezone.now()
+            store_id = self.context.get("store_id")
+            data = [
+                p for p in data.all() if p.in_effect(now) and (p.store_id is None or str(p.store_id) == str(store_id))
+            ]
+        else:
+            data = data.filter(filter_in_effect_visited_store(self.context["request"]))
         return super().to_representation(data)
 
 
@@ -148,13 +187,18 @@ class ProductCurrentSerializer(ProductSerializer):
         fields = PRODUCT_SERIALIZER_FIELDS
 
 
-class ProductGroupSerializer(serializers.ModelSerializer):
+class ProductGroupSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for ProductGroups."""
 
     vendor = VendorSerializer()
     subcategory = SubcategorySerializer()
     products = ProductCurrentSerializer(many=True, read_only=True)
 
+    def get_override_products(self, instance: models.ProductGroup):
+        """Get the products that will be displayed when serializing the group (if they were prefetched)."""
+        return instance.products.all() if is_prefetched(instance.products) else []
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.ProductGroup
         fields = ["id", "name", "description", "photo", "vendor", "subcategory", "products"]
@@ -1,10 +1,26 @@
 """Tests for ms_products."""
 from decimal import Decimal
 
+import rest_framework.exceptions
 from django.test import TestCase
+from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from ms_baseline.models import Store
 from ms_baseline.utils import format_money
+from ms_products import properties, search
+from ms_products.constants import PREFETCH_PRODUCT_BASIC
+from ms_products.models import (
+    Category,
+    LocalProductOverride,
+    Product,
+    ProductProperty,
+    StandardMetaField,
+    Subcategory,
+    Vendor,
+)
+from ms_products.overrides import annotate_effective_price
+from ms_products.serializers import ProductBasicSerializer, ProductSerializer
 from ms_products.utils import get_price_per_amount_str, prepare_per_amount
 
 
@@ -75,3 +91,351 @@ class TestPricePerAmount(TestCase):
             get_price_per_amount_str(Decimal("1.2"), Decimal("40"), "dag"),
             ("{0} / 100 g").format(format_money(Decimal("0.3"))),
         )
+
+
+class TestOverrideResolution(TestCase):
+    """Test resolving local product overrides in serializers."""
+
+    def setUp(self):
+        """Create products and overrides."""
+        self.category = Category(name="test category")
+        self.category.save()
+        self.subcategory = Subcategory(name="test subcategory", parent=self.category)
+        self.subcategory.save()
+        self.vendor = Vendor(name="test vendor")
+        self.vendor.save()
+        self.store = Store(name="test store")
+        self.store.save()
+        self.other_store = Store(name="other store")
+        self.other_store.save()
+        self.products = []
+        for i in range(5):
+            product = Product(
+                name=f"test product {i}",
+                price=2,
+                amount=1,
+                amount_unit="1",
+                subcategory=self.subcategory,
+                vendor=self.vendor,
+            )
+            product.save()
+            self.products.append(product)
+        LocalProductOverride(
+            product=self.products[0], store=self.store, price=Decimal("1.5"), available=False, note="note"
+        ).save()
+        LocalProductOverride(product=self.products[1], store=self.other_store, price=Decimal("3")).save()
+
+    def test_list_single_query(self):
+        """Test that a list of products resolves all overrides in one query."""
+        products = list(Product.objects.prefetch_related(*PREFETCH_PRODUCT_BASIC).order_by("id"))
+        with self.assertNumQueries(1):
+            data = ProductBasicSerializer(products, many=True, context={"store_id": self.store.id}).data
+
+        self.assertEqual([p["price"] for p in data], ["1.50", "2.00", "2.00", "2.00", "2.00"])
+        self.assertEqual([p["available"] for p in data], [False, True, True, True, True])
+
+    def test_no_store(self):
+        """Test that no overrides are applied (or queried) without a store."""
+        products = list(Product.objects.prefetch_related(*PREFETCH_PRODUCT_BASIC).order_by("id"))
+        with self.assertNumQueries(0):
+            data = ProductBasicSerializer(products, many=True, context={"store_id": None}).data
+        self.assertEqual({p["price"] for p in data}, {"2.00"})
+
+    def test_detail(self):
+        """Test that a single product uses one override query for all fields."""
+        product = Product.objects.select_related("vendor", "subcategory__parent").get(id=self.products[0].id)
+        with self.assertNumQueries(1):
+            data = ProductSerializer(product, context={"store_id": self.store.id}).data
+        self.assertEqual(data["price"], "1.50")
+        self.assertEqual(data["override_note"], "note")
+        self.assertFalse(data["available"])
+
+    def test_overlapping_overrides(self):
+        """Test that the newest override in effect applies everywhere, even if an older one is cheaper."""
+        LocalProductOverride(product=self.products[0], store=self.store, price=Decimal("1.75")).save()
+        LocalProductOverride(product=self.products[2], store=self.store, price=None, available=False).save()
+        products = list(Product.objects.filter(id__in=[self.products[0].id, self.products[2].id]).order_by("id"))
+
+        data = ProductBasicSerializer(products, many=True, context={"store_id": self.store.id}).data
+        self.assertEqual([p["price"] for p in data], ["1.75", "2.00"])
+        self.assertEqual([p.get_price(self.store) for p in products], [Decimal("1.75"), 2])
+        self.assertEqual(Product.get_prices(products, self.store), {products[0].id: Decimal("1.75"), products[1].id: 2})
+        annotated = annotate_effective_price(Product.objects.filter(id__in=[p.id for p in products]), self.store.id)
+        self.assertEqual(
+            {p.id: p.effective_price for p in annotated}, {products[0].id: Decimal("1.75"), products[1].id: 2}
+        )
+
+
+class TestConditionalGet(TestCase):
+    """Test conditional GET requests to the products API."""
+
+    def test_not_modified(self):
+        """Test that unchanged data is answered with 304 Not Modified, and changes are detected."""
+        category = Category(name="test category")
+        category.save()
+        subcategory = Subcategory(name="test subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="test vendor")
+        vendor.save()
+        store = Store(name="test store")
+        store.save()
+        product = Product(
+            name="test product", price=2, amount=1, amount_unit="1", subcategory=subcategory, vendor=vendor
+        )
+        product.save()
+        url = reverse("ms_products_api:products")
+
+        response = self.client.get(url, HTTP_X_MS_STORE=str(store.id))
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(2):  # store, ETag
+            response = self.client.get(url, HTTP_X_MS_STORE=str(store.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        LocalProductOverride(product=product, store=store, price=Decimal("1.5")).save()
+        response = self.client.get(url, HTTP_X_MS_STORE=str(store.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["price"], "1.50")
+
+
+class TestUnitPrice(TestCase):
+    """Test the price per normalized unit."""
+
+    def setUp(self):
+        """Create products in different units."""
+        category = Category(name="test category")
+        category.save()
+        self.subcategory = Subcategory(name="test subcategory", parent=category)
+        self.subcategory.save()
+        vendor = Vendor(name="test vendor")
+        vendor.save()
+        self.store = Store(name="test store")
+        self.store.save()
+        self.products = {}
+        for name, price, amount, amount_unit in [
+            ("500 g", "5", "500", "g"),
+            ("2 kg", "16", "2", "kg"),
+            ("250 mL", "1", "250", "mL"),
+            ("20 dag", "1.20", "20", "dag"),
+        ]:
+            product = Product(
+                name=name,
+                price=Decimal(price),
+                amount=Decimal(amount),
+                amount_unit=amount_unit,
+                subcategory=self.subcategory,
+                vendor=vendor,
+            )
+            product.save()
+            self.products[name] = product
+
+    def test_unit_price(self):
+        """Test that unit prices are normalized and updated on overrides when a product changes."""
+        self.assertEqual(self.products["500 g"].unit_price, Decimal("10"))
+        self.assertEqual(self.products["500 g"].unit_price_unit, "kg")
+        self.assertEqual(self.products["250 mL"].unit_price, Decimal("4"))
+        self.assertEqual(self.products["250 mL"].unit_price_unit, "L")
+
+        override = LocalProductOverride(product=self.products["2 kg"], store=self.store, price=Decimal("10"))
+        override.save()
+        self.assertEqual(override.unit_price, Decimal("5"))
+        product = self.products["2 kg"]
+        product.amount = Decimal("4")
+        product.save()
+        override.refresh_from_db()
+        self.assertEqual(override.unit_price, Decimal("2.5"))
+
+    def test_sort_and_filter(self):
+        """Test sorting and filtering the product list by the unit price in a store."""
+        LocalProductOverride(product=self.products["2 kg"], store=self.store, price=Decimal("4")).save()
+        url = reverse("ms_products_api:products")
+
+        response = self.client.get(url, {"unit": "kg", "order": "unit_price"}, HTTP_X_MS_STORE=str(self.store.id))
+        self.assertEqual([p["name"] for p in response.json()["results"]], ["2 kg", "20 dag", "500 g"])
+        response = self.client.get(url, {"unit": "kg", "order": "unit_price"})
+        self.assertEqual([p["name"] for p in response.json()["results"]], ["20 dag", "2 kg", "500 g"])
+        response = self.client.get(
+            url, {"unit_price_min": "3", "unit_price_max": "8"}, HTTP_X_MS_STORE=str(self.store.id)
+        )
+        self.assertEqual({p["name"] for p in response.json()["results"]}, {"20 dag", "250 mL"})
+        self.assertEqual(self.client.get(url, {"unit_price_min": "x"}).status_code, 400)
+
+        url = reverse("ms_products_api:subcategories_best_value", args=(self.subcategory.id,))
+        response = self.client.get(url, HTTP_X_MS_STORE=str(self.store.id))
+        self.assertEqual([p["name"] for p in response.json()["results"]], ["2 kg", "20 dag", "500 g"])
+
+
+class TestSearch(TestCase):
+    """Test the full-text product search."""
+
+    def setUp(self):
+        """Create products with different names, descriptions and vendors."""
+        category = Category(name="Nabiał")
+        category.save()
+        subcategory = Subcategory(name="Sery", parent=category)
+        subcategory.save()
+        self.vendor = Vendor(name="Spółdzielnia Mleczarska")
+        self.vendor.save()
+        self.products = {}
+        for name, description in [
+            ("Ser żółty", "Ser z mleka krowiego"),
+            ("Mleko UHT", ""),
+            ("Masło", "Masło z mleka"),
+        ]:
+            product = Product(
+                name=name,
+                description=description,
+                price=1,
+                amount=1,
+                amount_unit="1",
+                subcategory=subcategory,
+                vendor=self.vendor,
+            )
+            product.save()
+            self.products[name] = product
+
+    def _search(self, query, **kwargs):
+        """Get the names of products matching a query, most relevant first."""
+        products = search.annotate_rank(Product.objects.filter(search.search_filter(Product, query, **kwargs)), query)
+        return [p.name for p in products.order_by("-search_rank", "name")]
+
+    def test_search(self):
+        """Test that terms match word prefixes in all fields, and that matches in names rank first."""
+        self.assertEqual(self._search("mlek"), ["Mleko UHT", "Masło", "Ser żółty"])
+        self.assertEqual(self._search("żółty mleka"), ["Ser żółty"])
+        self.assertEqual(self._search("mlek", fields=("name",)), ["Mleko UHT"])
+        self.assertCountEqual(self._search("nabiał sery", fields=("categories",)), self.products)
+        self.assertEqual(self._search("jogurt"), [])
+
+    def test_index_updates(self):
+        """Test that the index is updated when products and vendors change."""
+        product = self.products["Masło"]
+        product.name = "Masło ekstra"
+        product.save()
+        self.assertEqual(self._search("ekstra"), ["Masło ekstra"])
+        self.vendor.name = "Okręgowa Spółdzielnia"
+        self.vendor.save()
+        self.assertEqual(len(self._search("okręgowa", fields=("vendor",))), 3)
+        product.delete()
+        self.assertEqual(self._search("ekstra"), [])
+
+    def test_api(self):
+        """Test searching with the product list API."""
+        response = self.client.get(reverse("ms_products_api:products"), {"q": "mlek"})
+        self.assertEqual([p["name"] for p in response.json()["results"]], ["Mleko UHT", "Masło", "Ser żółty"])
+
+
+class TestProperties(TestCase):
+    """Test filtering products by properties, and counting property values."""
+
+    def setUp(self):
+        """Create products with weights and colours."""
+        category = Category(name="Pieczywo")
+        category.save()
+        self.subcategory = Subcategory(name="Chleb", parent=category)
+        self.subcategory.save()
+        vendor = Vendor(name="Piekarnia")
+        vendor.save()
+        self.weight = StandardMetaField(name="Weight", expected_units="weight")
+        self.weight.save()
+        self.colour = StandardMetaField(name="Colour", expected_units="_str")
+        self.colour.save()
+        for name, weight, units, colour in [
+            ("Chleb mały", "250", "g", "Jasny"),
+            ("Chleb duży", "1", "kg", "jasny "),
+            ("Chleb razowy", "0,5", "kg", "Ciemny"),
+        ]:
+            extra_metadata_raw = [
+                {"slug": self.weight.slug, "name": "Weight", "value": weight, "units": units, "text": weight + units},
+                {"slug": self.colour.slug, "name": "Colour", "value": colour, "units": "", "text": colour},
+                {"slug": "", "name": "Custom", "value": "x", "units": "", "text": "x"},
+            ]
+            Product(
+                name=name,
+                price=1,
+                amount=1,
+                amount_unit="1",
+                subcategory=self.subcategory,
+                vendor=vendor,
+                extra_metadata_raw=extra_metadata_raw,
+            ).save()
+
+    def _filter(self, **params):
+        """Get the names of products matching property filters."""
+        products = Product.objects.filter(*properties.property_filters(params))
+        return sorted(products.values_list("name", flat=True))
+
+    def test_filters(self):
+        """Test exact and unit-aware range filters."""
+        self.assertEqual(ProductProperty.objects.count(), 6)
+        self.assertEqual(self._filter(**{f"prop.{self.colour.slug}": "JASNY"}), ["Chleb duży", "Chleb mały"])
+        self.assertEqual(self._filter(**{f"prop.{self.weight.slug}.min": "500 g"}), ["Chleb duży", "Chleb razowy"])
+        self.assertEqual(
+            self._filter(**{f"prop.{self.weight.slug}.max": "0.5", f"prop.{self.colour.slug}": "jasny"}), ["Chleb mały"]
+        )
+        for params in ({f"prop.{self.weight.slug}.min": "5 lb"}, {"prop.unknown": "1"}):
+            with self.assertRaises(rest_framework.exceptions.ValidationError):
+                self._filter(**params)
+
+    def test_facets(self):
+        """Test counting property values in a subcategory."""
+        response = self.client.get(reverse("ms_products_api:subcategories_properties", args=(self.subcategory.id,)))
+        facets = {f["slug"]: f for f in response.json()}
+        self.assertEqual(
+            [(v["value"], v["count"]) for v in facets[self.colour.slug]["values"]], [("ciemny", 1), ("jasny", 2)]
+        )
+        self.assertEqual(Decimal(facets[self.weight.slug]["min"]), Decimal("0.25"))
+        self.assertEqual(Decimal(facets[self.weight.slug]["max"]), Decimal(1))
+        response = self.client.get(
+            reverse("ms_products_api:subcategories_properties", args=(self.subcategory.id,)),
+            {f"prop.{self.colour.slug}": "ciemny"},
+        )
+        self.assertEqual([v["count"] for f in response.json() for v in f["values"]], [1, 1])
+
+
+class TestFacets(TestCase):
+    """Test facet counts of product lists."""
+
+    def setUp(self):
+        """Create products in two subcategories, with an override in a store."""
+        category = Category(name="Napoje")
+        category.save()
+        self.juices = Subcategory(name="Soki", parent=category)
+        self.juices.save()
+        self.water = Subcategory(name="Woda", parent=category)
+        self.water.save()
+        self.vendor = Vendor(name="Tłocznia")
+        self.vendor.save()
+        self.store = Store(name="Sklep")
+        self.store.save()
+        self.products = []
+        for name, price, subcategory in [("Sok jabłkowy", 4, self.juices), ("Sok z marchwi", 12, self.juices)]:
+            product = Product(
+                name=name, price=price, amount=1, amount_unit="L", subcategory=subcategory, vendor=self.vendor
+            )
+            product.save()
+            self.products.append(product)
+        Product(name="Woda", price=2, amount=1, amount_unit="L", subcategory=self.water, vendor=self.vendor).save()
+        LocalProductOverride(product=self.products[1], store=self.store, price=8, available=False).save()
+
+    def test_facets(self):
+        """Test that facets count the filtered results, with store overrides."""
+        response = self.client.get(
+            reverse("ms_products_api:products"),
+            {"facets": "1", "subcategories": str(self.juices.id)},
+            HTTP_X_MS_STORE=str(self.store.id),
+        )
+        facets = response.json()["facets"]
+        self.assertEqual([(f["name"], f["count"]) for f in facets["subcategories"]], [("Soki", 2)])
+        self.assertEqual([(f["id"], f["count"]) for f in facets["available"]], [(True, 1), (False, 1)])
+        self.assertEqual(
+            [(b["min"], b["max"], b["count"]) for b in facets["price_bands"]], [(None, "5", 1), ("5", "10", 1)]
+        )
+
+        response = self.client.get(reverse("ms_products_api:products"))
+        self.assertNotIn("facets", response.json())
+        response = self.client.get(reverse("ms_products_api:productgroups_list"), {"facets": "1"})
+        self.assertEqual(response.json()["facets"]["vendors"], [])
@@ -18,6 +18,16 @@ urlpatterns = [
     path("<int:pk>/", rest_views.ProductsDetail.as_view(), name="products_details"),
     path("categories/", api_views.categories_structure, name="categories_structure"),
     path("subcategories/", rest_views.SubcategoriesList.as_view(), name="subcategories_list"),
+    path(
+        "subcategories/<int:pk>/best-value/",
+        rest_views.SubcategoryBestValueList.as_view(),
+        name="subcategories_best_value",
+    ),
+    path(
+        "subcategories/<int:pk>/properties/",
+        rest_views.subcategory_properties,
+        name="subcategories_properties",
+    ),
     path("vendors/", rest_views.VendorsList.as_view(), name="vendors_list"),
     path("vendors/<int:pk>/", rest_views.VendorsDetail.as_view(), name="vendors_details"),
     path("vendors/<int:pk>/products/", rest_views.VendorsProductsList.as_view(), name="vendors_products_list"),
@@ -1,9 +1,13 @@
 """Utilities for ms_products."""
 import decimal
+import typing
 
 from django.utils.translation import gettext as _
 
 from ms_baseline.utils import format_money
+from ms_products.constants import UNIT_PRICE_CONVERSIONS
+
+UNIT_PRICE_QUANTUM = decimal.Decimal("0.0001")
 
 
 def prepare_per_amount(price: decimal.Decimal, amount: decimal.Decimal, amount_unit: str) -> (str, decimal.Decimal):
@@ -54,3 +58,21 @@ def get_price_per_amount_str(price: decimal.Decimal, amount: decimal.Decimal, am
         return _("{0} / pc").format(format_money(price_divided))
 
     return "{0} / {1}".format(format_money(price_divided), unit_display)
+
+
+def get_unit_price_divisor(amount: decimal.Decimal, amount_unit: str) -> (str, typing.Optional[decimal.Decimal]):
+    """Get the normalized unit (1 kg, 1 L or 1 pc) of a product, and the amount expressed in that unit."""
+    unit, size = UNIT_PRICE_CONVERSIONS.get(amount_unit, (amount_unit, decimal.Decimal(1)))
+    if not amount:
+        return unit, None
+    return unit, amount * size
+
+
+def get_unit_price(
+    price: typing.Optional[decimal.Decimal], amount: decimal.Decimal, amount_unit: str
+) -> (str, typing.Optional[decimal.Decimal]):
+    """Get the price per normalized unit (1 kg, 1 L or 1 pc), used for sorting and filtering products."""
+    unit, divisor = get_unit_price_divisor(amount, amount_unit)
+    if price is None or divisor is None:
+        return unit, None
+    return unit, (price / divisor).quantize(UNIT_PRICE_QUANTUM)
@@ -1,22 +1,22 @@
 """API responses for ms_products."""
 import typing
 
-import attr
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import F
 from django.urls import reverse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from ms_baseline import vue_models as vm
-from ms_baseline.api_utils import asdict_drf_response
+from ms_baseline.api_utils import asdict_drf_response, asdict_json_response, drf_data
+from ms_baseline.conditional import conditional_on
 from ms_baseline.permission_helpers import permissions_required_products, permissions_required_products_readonly
 from ms_baseline.utils import filter_in_effect, filter_in_effect_after, filter_this_store, format_money
 from ms_baseline.vue_models import ModalItem, ModalItemContainer
 from ms_products import models as m
-from ms_products.api_models import build_vue_categories_structure
+from ms_products import search
+from ms_products.api_models import build_standard_meta_fields, build_vue_categories_structure
 from ms_products.models import Product, ProductGroup, Vendor
 
 T = typing.TypeVar("T")
@@ -40,15 +40,17 @@ def _generate_modal(
     if filter_items_in_effect_after:
         queryset = queryset.filter(filter_in_effect_after())
     query = request.GET.get("q", "").strip()
-    if query:
+    if query and cls in search.SEARCHABLE_MODELS.values():
+        queryset = search.annotate_rank(queryset.filter(search.search_filter(cls, query)), query).order_by(
+            F("search_rank").desc(nulls_last=True), name_attr
+        )
+    elif query:
         queryset = queryset.filter(**{name_attr + "__icontains": query})
 
     paginator = Paginator(queryset, settings.MOBISHOPPER_MODAL_PAGE_SIZE)
     page = paginator.get_page(request.GET.get("page", 1))
     data = map(converter, page.object_list)
-    return JsonResponse(
-        attr.asdict(ModalItemContainer(items=list(data), page=page.number, num_pages=paginator.num_pages))
-    )
+    return asdict_json_response(ModalItemContainer(items=list(data), page=page.number, num_pages=paginator.num_pages))
 
 
 @permissions_required_products_readonly
@@ -105,19 +107,12 @@ def list_groups_modal(request):
 @api_view()
 def get_standard_meta_fields(request, subcategory: typing.Optional[int] = None):
     """Return a list of standard meta fields for a given subcategory (or for all subcategories)."""
-    if subcategory:
-        fields = m.StandardMetaField.objects.filter(
-            Q(subcategories_required=subcategory) | Q(subcategories_recommended=subcategory)
-        )
-    else:
-        fields = m.StandardMetaField.objects.all()
-
-    vue_fields = [vm.StandardMetaField.from_db(s, subcategory) for s in fields]
-    return asdict_drf_response(vm.StandardMetaFieldContainer(items=vue_fields, subcategory=subcategory))
+    return asdict_drf_response(build_standard_meta_fields(subcategory))
 
 
 @api_view()
+@conditional_on(m.Category, m.Subcategory)
 def categories_structure(request):
     """Get the categories structure."""
     categories = build_vue_categories_structure()
-    return Response([attr.asdict(c) for c in categories])
+    return Response(drf_data(categories))
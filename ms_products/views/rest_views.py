@@ -2,15 +2,21 @@
 import datetime
 
 import django.utils.timezone
+from django.db.models import Count
+from django.utils.decorators import method_decorator
 from rest_framework import generics
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from ms_baseline import constants
+from ms_baseline.api_utils import KeysetOrPageNumberPagination, drf_data
+from ms_baseline.conditional import conditional_on
 from ms_baseline.serializers import SerializerContextMixin, get_serializer_context
-from ms_baseline.utils import filter_in_effect_visited_store, filter_visited_store
+from ms_baseline.utils import filter_in_effect_visited_store, filter_visited_store, get_visited_store_id
+from ms_products import facets, properties
 from ms_products.constants import PREFETCH_PRODUCT_BASIC
-from ms_products.models import Product, ProductGroup, Subcategory, Vendor
+from ms_products.models import PRODUCT_SERIALIZER_MODELS, Product, ProductGroup, StandardMetaField, Subcategory, Vendor
+from ms_products.overrides import annotate_effective_available, annotate_effective_unit_price
 from ms_products.serializers import (
     ProductBasicSerializer,
     ProductGroupSerializer,
@@ -18,24 +24,48 @@ from ms_products.serializers import (
     SubcategorySerializer,
     VendorSerializer,
 )
-from ms_products.views.utils import parse_advanced_api_filters
+from ms_products.views.utils import apply_search_ranking, apply_unit_price_params, parse_advanced_api_filters
 
 
-class ProductsList(SerializerContextMixin, generics.ListAPIView):
-    """Get the product list for a store."""
+class FacetsMixin:
+    """Include facet counts of the filtered results in list responses, if requested with facets=1."""
+
+    def paginate_queryset(self, queryset):
+        """Paginate a queryset, remembering the filtered queryset for facets."""
+        self.filtered_queryset = queryset
+        return super().paginate_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        """List objects, with facets if requested."""
+        response = super().list(request, *args, **kwargs)
+        if facets.wants_facets(request):
+            response.data["facets"] = drf_data(
+                facets.build_facets(self.filtered_queryset, get_visited_store_id(request))
+            )
+        return response
+
+
+@method_decorator(conditional_on(*PRODUCT_SERIALIZER_MODELS), name="get")
+class ProductsList(FacetsMixin, SerializerContextMixin, generics.ListAPIView):
+    """Get the product list for a store (with facet counts if requested with facets=1)."""
 
     serializer_class = ProductBasicSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
         filters_list, filters_dict = parse_advanced_api_filters(self.request.query_params)
-        return (
-            Product.objects.prefetch_related(*PREFETCH_PRODUCT_BASIC)
-            .filter(filter_visited_store(self.request), *filters_list, **filters_dict)
-            .order_by(*constants.ORDER_NEWEST_FIRST)
+        queryset, default_order = apply_search_ranking(
+            Product.objects.filter(filter_visited_store(self.request), *filters_list, **filters_dict),
+            self.request.query_params,
+            constants.ORDER_NEWEST_FIRST,
+        )
+        return apply_unit_price_params(
+            queryset, self.request.query_params, get_visited_store_id(self.request), default_order=default_order
         )
 
 
+@method_decorator(conditional_on(*PRODUCT_SERIALIZER_MODELS), name="get")
 class ProductsDetail(SerializerContextMixin, generics.RetrieveAPIView):
     """Get the details of a product."""
 
@@ -53,6 +83,51 @@ class SubcategoriesList(SerializerContextMixin, generics.ListAPIView):
     queryset = Subcategory.objects.filter(visible=True)
 
 
+@method_decorator(conditional_on(*PRODUCT_SERIALIZER_MODELS), name="get")
+class SubcategoryBestValueList(SerializerContextMixin, generics.ListAPIView):
+    """Get the products with the lowest price per unit in a subcategory, among products available in a store.
+
+    Products are compared in one unit (the unit query parameter, or the most common unit in the subcategory).
+    """
+
+    serializer_class = ProductBasicSerializer
+
+    def get_queryset(self):
+        """Get the queryset for a best value list."""
+        store_id = get_visited_store_id(self.request)
+        products = Product.objects.filter(
+            filter_in_effect_visited_store(self.request), subcategory=self.kwargs["pk"], unit_price__isnull=False
+        )
+        unit = self.request.query_params.get("unit")
+        if not unit:
+            unit = (
+                products.values("unit_price_unit")
+                .annotate(count=Count("id"))
+                .order_by("-count", "unit_price_unit")
+                .values_list("unit_price_unit", flat=True)
+                .first()
+            )
+        products = annotate_effective_available(products.filter(unit_price_unit=unit), store_id)
+        return (
+            annotate_effective_unit_price(products, store_id)
+            .filter(effective_available=True)
+            .order_by("effective_unit_price", "id")
+        )
+
+
+@api_view()
+@conditional_on(*PRODUCT_SERIALIZER_MODELS, StandardMetaField)
+def subcategory_properties(request, pk: int):
+    """Get the values of properties of products in a subcategory, with the number of products that have each value.
+
+    Property filters (prop.* query parameters) are applied to the products before counting.
+    """
+    products = Product.objects.filter(
+        filter_in_effect_visited_store(request), *properties.property_filters(request.query_params), subcategory=pk
+    )
+    return Response(drf_data(properties.build_facets(products)))
+
+
 class VendorsList(SerializerContextMixin, generics.ListAPIView):
     """Get a list of vendors."""
 
@@ -81,27 +156,33 @@ class VendorsProductsList(SerializerContextMixin, generics.ListAPIView):
     """Get a list of products by a vendor."""
 
     serializer_class = ProductBasicSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
-        return (
-            Product.objects.prefetch_related(*PREFETCH_PRODUCT_BASIC)
-            .filter(filter_in_effect_visited_store(self.request), vendor=self.kwargs["pk"])
-            .order_by("name")
+        return apply_unit_price_params(
+            Product.objects.filter(filter_in_effect_visited_store(self.request), vendor=self.kwargs["pk"]),
+            self.request.query_params,
+            get_visited_store_id(self.request),
+            default_order=["name"],
         )
 
 
-class ProductGroupsList(SerializerContextMixin, generics.ListAPIView):
+class ProductGroupsList(FacetsMixin, SerializerContextMixin, generics.ListAPIView):
     """Get a list of groups."""
 
     serializer_class = ProductGroupSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         """Get the queryset for a product list."""
         filters_list, filters_dict = parse_advanced_api_filters(self.request.query_params, is_product=False)
-        return ProductGroup.objects.filter(filter_visited_store(self.request), *filters_list, **filters_dict).order_by(
-            *constants.ORDER_NEWEST_FIRST
+        queryset, order = apply_search_ranking(
+            ProductGroup.objects.filter(filter_visited_store(self.request), *filters_list, **filters_dict),
+            self.request.query_params,
+            constants.ORDER_NEWEST_FIRST,
         )
+        return queryset.order_by(*order)
 
 
 class ProductGroupsDetail(SerializerContextMixin, generics.RetrieveAPIView):
@@ -120,13 +201,14 @@ def bulk_find_products(request):
     product_ids = request.query_params.getlist("product")
     products_requested = Product.objects.filter(id__in=product_ids).prefetch_related(*PREFETCH_PRODUCT_BASIC)
     now = django.utils.timezone.now()
+    current_revisions = Product.resolve_revisions(
+        products_requested, now, Product.objects.select_related(*PREFETCH_PRODUCT_BASIC)
+    )
     products = []
     new_ids = set()
     upgrades = []
     for p in products_requested:
-        current_p = p
-        while current_p.replaced_by and not current_p.in_effect(now):
-            current_p = current_p.replaced_by
+        current_p = current_revisions[p.id]
         if current_p.id not in new_ids:
             products.append(current_p)
             new_ids.add(current_p.id)
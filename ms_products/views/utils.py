@@ -1,18 +1,28 @@
 """Utilities for ms_products views."""
 import collections
 import datetime
+import decimal
 import json
 import typing
 
 import django.utils.timezone
-from django.db.models import Count, Q
+import rest_framework.exceptions
+from django.db.models import Count, F, Q
+from django.utils.translation import gettext as _
 
-from ms_baseline.utils import filter_in_effect, filter_this_store
-from ms_products import forms
-from ms_products.models import Category, Product, Subcategory
+from ms_baseline import cache
+from ms_baseline.utils import filter_in_effect, filter_in_effect_after, filter_this_store, get_next_validity_change
+from ms_products import forms, properties, search
+from ms_products.models import Category, Product, ProductGroup, Subcategory
+from ms_products.overrides import annotate_effective_unit_price
 
 T = typing.TypeVar("T")
 
+UNIT_PRICE_ORDERS = {
+    "unit_price": F("effective_unit_price").asc(nulls_last=True),
+    "-unit_price": F("effective_unit_price").desc(nulls_last=True),
+}
+
 
 def get_global_upcoming_recent(now=None):
     """Get global upcoming and recent products."""
@@ -55,6 +65,13 @@ def get_local_upcoming_recent(request, now=None):
 
 
 def build_subcat_menu(visible_only=True):
+    """Get a menu of subcategories, from the cache."""
+    return cache.get_or_set(
+        [(cache.REFERENCE, None)], ["subcat_menu", visible_only], lambda: _build_subcat_menu(visible_only)
+    )
+
+
+def _build_subcat_menu(visible_only):
     """Build a menu of subcategories."""
     if visible_only:
         filters = {"visible": True}
@@ -69,6 +86,25 @@ def build_subcat_menu(visible_only=True):
 
 
 def build_categories_structure(visible_only=True, include_counts=True):
+    """Get a structure of categories, from the cache.
+
+    Product counts include products from all stores, and they change when products go in or out of effect.
+    """
+    if not include_counts:
+        return cache.get_or_set(
+            [(cache.REFERENCE, None)],
+            ["categories_structure", visible_only],
+            lambda: _build_categories_structure(visible_only, include_counts=False),
+        )
+    return cache.get_or_set(
+        [(cache.REFERENCE, None), (cache.CATALOG, cache.ANY_SCOPE)],
+        ["categories_structure_counts", visible_only],
+        lambda: _build_categories_structure(visible_only, include_counts=True),
+        valid_until=lambda: get_next_validity_change(Product.objects.all()),
+    )
+
+
+def _build_categories_structure(visible_only, include_counts):
     """Build a structure of categories."""
     if visible_only:
         filters = {"visible": True}
@@ -90,18 +126,17 @@ def build_categories_structure(visible_only=True, include_counts=True):
 
 
 def parse_advanced_search_filters(
-    request, form_data: typing.Mapping[str, typing.Union[str, typing.List[str]]]
+    request,
+    form_data: typing.Mapping[str, typing.Union[str, typing.List[str]]],
+    model: typing.Type[typing.Union[Product, ProductGroup]] = Product,
 ) -> (typing.Dict[str, typing.Any], typing.List[typing.Any]):
     """Parse advanced search filters for a product or a product group."""
     filters = {}
     filters_list = []
 
-    if form_data.get("name"):
-        filters["name" + "__icontains"] = form_data.get("name")
-    if form_data.get("description"):
-        filters["description" + "__icontains"] = form_data.get("description")
-    if form_data.get("vendor"):
-        filters["vendor__name" + "__icontains"] = form_data.get("vendor")
+    for field in ("name", "description", "vendor"):
+        if form_data.get(field):
+            filters_list.append(search.search_filter(model, form_data[field], fields=(field,)))
 
     if form_data.get("subcategories"):
         filters["subcategory__in"] = [int(cat) for cat in form_data["subcategories"] if cat != "-1"]
@@ -119,6 +154,15 @@ def parse_advanced_search_filters(
         meta_dict = Product.build_extra_metadata_dict_from_raw(meta_raw)
         for k, v in meta_dict.items():
             filters[f"extra_metadata_dict__{k}__icontains"] = v
+    if is_product:
+        filters_list += properties.property_filters(form_data)
+
+    if form_data.get("unit_price_unit"):
+        filters["unit_price_unit"] = form_data["unit_price_unit"]
+    if form_data.get("unit_price_min") is not None:
+        filters["unit_price__gte"] = form_data["unit_price_min"]
+    if form_data.get("unit_price_max") is not None:
+        filters["unit_price__lte"] = form_data["unit_price_max"]
 
     if form_data["valid_at"]:
         filters_list.append(filter_in_effect(form_data["valid_at"]))
@@ -136,12 +180,12 @@ def parse_advanced_api_filters(
     filters = {}
     filters_list = []
 
-    if form_data.get("name"):
-        filters["name" + "__icontains"] = form_data.get("name")
-    if form_data.get("description"):
-        filters["description" + "__icontains"] = form_data.get("description")
-    if form_data.get("vendor") and not ignore_vendor:
-        filters["vendor__name" + "__icontains"] = form_data.get("vendor")
+    model = Product if is_product else ProductGroup
+    if form_data.get("q"):
+        filters_list.append(search.search_filter(model, form_data["q"]))
+    for field in ("name", "description", "vendor"):
+        if form_data.get(field) and not (field == "vendor" and ignore_vendor):
+            filters_list.append(search.search_filter(model, form_data[field], fields=(field,)))
 
     if form_data.get("subcategories"):
         filters["subcategory__in"] = [int(cat) for cat in form_data["subcategories"] if cat != "-1"]
@@ -151,6 +195,8 @@ def parse_advanced_api_filters(
         meta_dict = Product.build_extra_metadata_dict_from_raw(meta_raw)
         for k, v in meta_dict.items():
             filters[f"extra_metadata_dict__{k}__icontains"] = v
+    if is_product:
+        filters_list += properties.property_filters(form_data)
 
     if form_data.get("recent_upcoming", "").lower() in ("1", "true"):
         now = django.utils.timezone.now()
@@ -158,11 +204,11 @@ def parse_advanced_api_filters(
         now_plus_7 = now + datetime.timedelta(days=7)
         filters_list.append(
             (Q(date_started__gt=now_minus_3) | (Q(date_started=None) & Q(date_added__gt=now_minus_3)))
-            & (Q(date_ended=None) | Q(date_ended__gt=now))
+            & filter_in_effect_after(now)
         )
         filters_list.append(
             ((Q(date_started=None) & Q(date_added__lt=now_plus_7)) | Q(date_started__lt=now_plus_7))
-            & (Q(date_ended=None) | Q(date_ended__gt=now))
+            & filter_in_effect_after(now)
         )
     else:
         filters_list.append(filter_in_effect())
@@ -170,6 +216,56 @@ def parse_advanced_api_filters(
     return filters_list, filters
 
 
+def _parse_decimal_param(query_params: typing.Mapping[str, str], name: str) -> typing.Optional[decimal.Decimal]:
+    """Parse an optional decimal query parameter."""
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        raise rest_framework.exceptions.ValidationError({name: _("A valid number is required.")})
+
+
+def apply_search_ranking(
+    queryset, query_params: typing.Mapping[str, str], default_order: typing.Sequence
+) -> (typing.Any, typing.List):
+    """Rank the results of a search (the q or name query parameter) by relevance.
+
+    Return the queryset and the ordering to use (most relevant first, then the default ordering).
+    """
+    query = query_params.get("q") or query_params.get("name")
+    if not query:
+        return queryset, list(default_order)
+    return search.annotate_rank(queryset, query), [F("search_rank").desc(nulls_last=True), *default_order]
+
+
+def apply_unit_price_params(queryset, query_params: typing.Mapping[str, str], store_id, default_order=None):
+    """Filter and sort products by their price per normalized unit in a store, as requested in the query parameters.
+
+    Parameters: unit (1, kg or L), unit_price_min, unit_price_max, order (unit_price or -unit_price).
+    """
+    unit = query_params.get("unit")
+    unit_price_min = _parse_decimal_param(query_params, "unit_price_min")
+    unit_price_max = _parse_decimal_param(query_params, "unit_price_max")
+    order = query_params.get("order")
+    if order not in UNIT_PRICE_ORDERS:
+        order = None
+    if not (unit or unit_price_min is not None or unit_price_max is not None or order):
+        return queryset.order_by(*default_order) if default_order else queryset
+
+    queryset = annotate_effective_unit_price(queryset, store_id)
+    if unit:
+        queryset = queryset.filter(unit_price_unit=unit)
+    if unit_price_min is not None:
+        queryset = queryset.filter(effective_unit_price__gte=unit_price_min)
+    if unit_price_max is not None:
+        queryset = queryset.filter(effective_unit_price__lte=unit_price_max)
+    if order:
+        return queryset.order_by(UNIT_PRICE_ORDERS[order], "id")
+    return queryset.order_by(*default_order) if default_order else queryset
+
+
 def handle_product_filters(
     request,
     form_class: typing.Type[forms.ProductGenericFilterForm],
@@ -180,7 +276,7 @@ def handle_product_filters(
     form = form_class(request.GET)
     if form.is_valid():
         filtering_error = False
-        filters_list, filters = parse_advanced_search_filters(request, form.cleaned_data)
+        filters_list, filters = parse_advanced_search_filters(request, form.cleaned_data, model_class)
     else:
         filtering_error = True
         filters_list, filters = [filter_in_effect(), filter_this_store(request)], {}
@@ -0,0 +1,98 @@
+"""Batch changes of shopping list entries: many products added, changed, bought or removed in one request.
+
+The list is locked first, then operations are applied in order to its entries in memory, and saved with bulk queries in
+the same transaction. The totals of the list are recomputed once, instead of once per entry.
+"""
+import datetime
+import decimal
+import typing
+
+import attr
+import django.utils.timezone
+from django.db import transaction
+
+from ms_baseline.bulk import BATCH_SIZE
+from ms_baseline.models import MsUser
+from ms_products.models import Product
+from ms_userdata.models import ShoppingList, ShoppingListEntry, deferred_list_totals
+
+ADD = "add"
+UPDATE = "update"
+DELETE = "delete"
+BOUGHT = "bought"
+OPERATIONS = (ADD, UPDATE, DELETE, BOUGHT)
+
+
+@attr.s(auto_attribs=True, slots=True, kw_only=True)
+class EntryOperation:
+    """An operation on the entry of a product.
+
+    add creates the entry or changes its amount, update and bought change an existing entry, delete removes it.
+    """
+
+    op: str
+    product: Product
+    amount: typing.Optional[decimal.Decimal] = None
+    bought: typing.Optional[bool] = None
+
+
+def apply_entry_operations(
+    shopping_list: ShoppingList,
+    user: MsUser,
+    operations: typing.Sequence[EntryOperation],
+    now: typing.Optional[datetime.datetime] = None,
+):
+    """Apply operations to the entries of a shopping list, and save them and the list totals in bulk.
+
+    Raises ShoppingListEntry.DoesNotExist (with the index of the operation) if an operation changes a missing entry.
+    Nothing is saved in that case.
+    """
+    if now is None:
+        now = django.utils.timezone.now()
+    with transaction.atomic(), deferred_list_totals():
+        # Lock the list first, so that concurrent changes to its entries wait until this batch is saved.
+        locked = ShoppingList.objects.select_for_update().only("stale_since").get(pk=shopping_list.pk)
+        entries = {e.product_id: e for e in shopping_list.entries.select_related("product")}
+        modified: typing.Dict[int, ShoppingListEntry] = {}
+        deleted: typing.Dict[int, ShoppingListEntry] = {}
+
+        for index, operation in enumerate(operations):
+            entry = entries.get(operation.product.id)
+            if entry is None and operation.op != ADD:
+                raise ShoppingListEntry.DoesNotExist(index)
+            if operation.op == DELETE:
+                del entries[operation.product.id]
+                if entry.pk is not None:
+                    deleted[entry.pk] = entry
+                    modified.pop(entry.pk, None)
+                continue
+            if entry is None:
+                entry = ShoppingListEntry(list=shopping_list, product=operation.product, bought=False, amount=1)
+                entries[operation.product.id] = entry
+            if operation.op == ADD:
+                entry.amount = operation.amount if operation.amount is not None else 1
+            elif operation.amount is not None:
+                entry.amount = operation.amount
+            if operation.op == BOUGHT:
+                entry.bought = operation.bought if operation.bought is not None else True
+            elif operation.bought is not None:
+                entry.bought = operation.bought
+            entry.user = user
+            if entry.pk is not None:
+                entry.date_modified = now
+                modified[entry.pk] = entry
+
+        remaining = list(entries.values())
+        created = [e for e in remaining if e.pk is None]
+        replacement_dates = [e.product.get_replacement_date() for e in [*created, *modified.values()]]
+        stale_since = min(filter(None, [locked.stale_since, *replacement_dates]), default=None)
+
+        if deleted:
+            ShoppingListEntry.objects.filter(pk__in=list(deleted)).delete()
+        ShoppingList.update_lists_totals([shopping_list], remaining, now, save_lists=False)
+        ShoppingListEntry.objects.bulk_update(
+            list(modified.values()), ["amount", "bought", "user", "price_cached", "date_modified"]
+        )
+        ShoppingListEntry.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        shopping_list.stale_since = stale_since
+        shopping_list.save(update_fields=[*ShoppingList.TOTALS_FIELDS, "stale_since", "date_modified"])
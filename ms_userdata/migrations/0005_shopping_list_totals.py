@@ -0,0 +1,65 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:39
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def fill_shopping_list_totals(apps, schema_editor):
+    """Compute the prices of entries and the entry counts of all shopping lists."""
+    ShoppingList = apps.get_model("ms_userdata", "ShoppingList")
+    ShoppingListEntry = apps.get_model("ms_userdata", "ShoppingListEntry")
+    LocalProductOverride = apps.get_model("ms_products", "LocalProductOverride")
+    now = timezone.now()
+    for shopping_list in ShoppingList.objects.all():
+        entries = list(ShoppingListEntry.objects.filter(list=shopping_list).select_related("product"))
+        overrides = dict(
+            LocalProductOverride.objects.filter(
+                date_started__lte=now,
+                date_ended__gt=now,
+                store=shopping_list.store_id,
+                product__in=[e.product_id for e in entries],
+            )
+            .values("product")
+            .annotate(min_price=Min("price"))
+            .order_by()
+            .values_list("product", "min_price")
+        )
+        for entry in entries:
+            price = overrides.get(entry.product_id, entry.product.price)
+            entry.price_cached = (Decimal(entry.amount) * price).quantize(Decimal("0.01"))
+        ShoppingListEntry.objects.bulk_update(entries, ["price_cached"])
+        shopping_list.price_cached = sum(e.price_cached for e in entries)
+        shopping_list.entry_count = len(entries)
+        shopping_list.bought_count = sum(e.bought for e in entries)
+        shopping_list.completion = round(shopping_list.bought_count * 100 / len(entries)) if entries else 0
+        shopping_list.save(update_fields=["price_cached", "entry_count", "bought_count", "completion"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0031_sync_indexes'),
+        ('ms_userdata', '0004_register_coupon_use_at_checkout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='bought_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='entry_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistentry',
+            name='price_cached',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_shopping_list_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:42
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+
+def fill_stale_since(apps, schema_editor):
+    """Mark shopping lists with replaced products as stale since the earliest replacement."""
+    ShoppingList = apps.get_model("ms_userdata", "ShoppingList")
+    ShoppingListEntry = apps.get_model("ms_userdata", "ShoppingListEntry")
+    replaced = (
+        ShoppingListEntry.objects.filter(
+            list=OuterRef("pk"), product__replaced_by__isnull=False, product__date_ended__isnull=False
+        )
+        .values("list")
+        .annotate(stale_since=Min("product__date_ended"))
+        .values("stale_since")
+    )
+    ShoppingList.objects.update(stale_since=Subquery(replaced))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_userdata', '0005_shopping_list_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='stale_since',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_stale_since, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:28
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def fill_prices_valid_until(apps, schema_editor):
+    """Recompute the totals of shopping lists with local overrides in effect (now or later) on their next read."""
+    ShoppingList = apps.get_model("ms_userdata", "ShoppingList")
+    LocalProductOverride = apps.get_model("ms_products", "LocalProductOverride")
+    now = django.utils.timezone.now()
+    overrides = LocalProductOverride.objects.filter(
+        store=OuterRef("store"), product__shoppinglistentry__list=OuterRef("pk"), date_ended__gt=now
+    )
+    ShoppingList.objects.filter(Exists(overrides)).update(prices_valid_until=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ms_products', '0031_sync_indexes'),
+        ('ms_userdata', '0006_shopping_list_stale_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='prices_valid_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_prices_valid_until, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 """Models for user data."""
+import contextlib
+import contextvars
 import datetime
+import decimal
 import typing
 from uuid import uuid4
 
@@ -7,15 +10,34 @@ import django.utils.formats
 import django.utils.timezone
 from django.conf import settings
 from django.core.mail import send_mail
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.html import format_html
 
 from ms_baseline import constants
 from ms_baseline.models import CheckoutApiKey, DateTrackedModel, MsUser, PriceField, Store
+from ms_baseline.revisions import revisions_migrated
 from ms_deals.models import Coupon, CouponSet
-from ms_products.models import Product
+from ms_products.models import LocalProductOverride, Product
+
+PRICE_QUANTUM = decimal.Decimal("0.01")
+
+_deferred_list_totals: contextvars.ContextVar[bool] = contextvars.ContextVar("deferred_list_totals", default=False)
+
+
+@contextlib.contextmanager
+def deferred_list_totals():
+    """Skip the incremental maintenance of list totals for entry changes in this block.
+
+    The caller must recompute the totals of the affected lists afterwards.
+    """
+    token = _deferred_list_totals.set(True)
+    try:
+        yield
+    finally:
+        _deferred_list_totals.reset(token)
 
 
 class CouponUse(DateTrackedModel):
@@ -66,51 +88,236 @@ class ShoppingList(DateTrackedModel):
     sharing_uuid = models.UUIDField(default=None, null=True, blank=True, unique=True)
     shared_with = models.ManyToManyField(MsUser, related_name="shared_with", blank=True)
     completion = models.IntegerField(default=0)  # 0-100
+    # The number of entries and of bought entries, maintained with the price and completion
+    entry_count = models.IntegerField(default=0)
+    bought_count = models.IntegerField(default=0)
+    # The date since which the list may have entries with replaced products (None if there are none)
+    stale_since = models.DateTimeField(blank=True, null=True, db_index=True)
+    # The date when the price of an entry may change, as a local override goes in or out of effect (None if no change
+    # is planned); the totals are recomputed when it passes
+    prices_valid_until = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    # Maintained by entry changes under a lock of the list; other saves of the list must leave them out (update_fields)
+    TOTALS_FIELDS = ["price_cached", "completion", "entry_count", "bought_count", "prices_valid_until"]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Load a shopping list, remembering its store (the prices of entries depend on it)."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_store_id = instance.__dict__.get("store_id")
+        return instance
 
     def upgrade_products(self, allow_ignore=True):
         """Upgrade all products on a shopping list."""
         now = django.utils.timezone.now()
-        ignore_after = now - datetime.timedelta(minutes=constants.IGNORE_SHOPPING_LIST_MIGRATIONS_MINUTES)
-        if allow_ignore and self.date_modified >= ignore_after:
+        if allow_ignore and self.date_modified >= self.get_ignore_after(now):
             return False
-        entries: typing.List[ShoppingListEntry] = list(self.entries.all())
-        products_in_entries = {e.product.id: e for e in entries}
-        any_changes = False
+        return bool(ShoppingList._upgrade_loaded_lists({self.pk: self}, now))
+
+    @staticmethod
+    def get_ignore_after(now=None) -> datetime.datetime:
+        """Get the date after which modified lists are not upgraded (as the user may still be editing them)."""
+        if now is None:
+            now = django.utils.timezone.now()
+        return now - datetime.timedelta(minutes=constants.IGNORE_SHOPPING_LIST_MIGRATIONS_MINUTES)
+
+    @classmethod
+    def upgrade_lists(cls, queryset, allow_ignore=True, now=None) -> typing.List["ShoppingList"]:
+        """Upgrade the products on shopping lists, in a constant number of queries. Return the lists that changed.
+
+        Only lists marked as stale are loaded. If an entry is upgraded to a product that is on the list already, the
+        older entry is removed.
+        """
+        if now is None:
+            now = django.utils.timezone.now()
+        queryset = queryset.filter(stale_since__lte=now)
+        if allow_ignore:
+            queryset = queryset.filter(date_modified__lt=cls.get_ignore_after(now))
+        lists = {sl.id: sl for sl in queryset}
+        if not lists:
+            return []
+        return cls._upgrade_loaded_lists(lists, now)
+
+    @classmethod
+    def _upgrade_loaded_lists(
+        cls, lists: typing.Dict[int, "ShoppingList"], now: datetime.datetime
+    ) -> typing.List["ShoppingList"]:
+        """Upgrade the products on loaded shopping lists (by ID). Return the lists that changed."""
+        entries = list(ShoppingListEntry.objects.filter(list__in=list(lists)).select_related("product").order_by("id"))
+        current_revisions = Product.resolve_revisions([e.product for e in entries], now)
+        entries_by_product = {(e.list_id, e.product_id): e for e in entries}
+        upgraded: typing.Dict[int, ShoppingListEntry] = {}
+        deleted: typing.Dict[int, ShoppingListEntry] = {}
         for e in entries:
-            new_product = e.try_upgrade(now)
-            if not new_product:
+            new_product = current_revisions[e.product_id]
+            if new_product.id == e.product_id:
                 continue
-            other = products_in_entries.get(new_product.id)
+            other = entries_by_product.get((e.list_id, new_product.id))
             if other:
                 # User has two entries for the same product. This is a very rare case, but still possible.
                 # This conflict will be resolved by removing the older product.
                 if other.date_added < e.date_added:
-                    other.delete()
+                    deleted[other.id] = other
+                    upgraded.pop(other.id, None)
                 else:
-                    e.delete()
-                    any_changes = True
+                    deleted[e.id] = e
                     continue
 
             e.product_upgraded_from = e.product
             e.product = new_product
-            e.save()
-            any_changes = True
-            products_in_entries[e.product.id] = e
-        self.save()  # calls update_shopping_list_price_completion
-        return any_changes
-
-    def update_price_completion(self):
-        """Update the price and completion of this shopping list."""
-        now = django.utils.timezone.now()
-        entry_count = self.entries.count()
-        if entry_count:
-            self.price_cached = sum(e.amount * e.product.get_price(self.store, now) for e in self.entries.all())
-            self.completion = round(self.entries.filter(bought=True).count() * 100 / entry_count)
-        else:
-            self.price_cached = 0
-            self.completion = 0
+            upgraded[e.id] = e
+            entries_by_product[e.list_id, new_product.id] = e
+
+        remaining = [e for e in entries if e.id not in deleted]
+        changed_ids = {e.list_id for e in [*upgraded.values(), *deleted.values()]}
+        with transaction.atomic(), deferred_list_totals():
+            if deleted:
+                ShoppingListEntry.objects.filter(pk__in=list(deleted)).delete()
+            ShoppingListEntry.objects.bulk_update(list(upgraded.values()), ["product", "product_upgraded_from"])
+            cls.update_lists_totals(
+                [lists[list_id] for list_id in changed_ids],
+                [e for e in remaining if e.list_id in changed_ids],
+                now,
+                save_lists=False,
+            )
+            for list_id in changed_ids:
+                lists[list_id].date_modified = now
+            # Lists stay stale since the earliest replacement of their products: in the future for upgraded products,
+            # or in the past for products that could not be resolved to a newer revision (retried on the next upgrade).
+            for shopping_list in lists.values():
+                shopping_list.stale_since = None
+            for e in remaining:
+                stale_since = e.product.get_replacement_date()
+                shopping_list = lists[e.list_id]
+                if stale_since and (shopping_list.stale_since is None or stale_since < shopping_list.stale_since):
+                    shopping_list.stale_since = stale_since
+            cls.objects.bulk_update(list(lists.values()), [*cls.TOTALS_FIELDS, "stale_since", "date_modified"])
+        return [lists[list_id] for list_id in sorted(changed_ids)]
+
+    def _update_completion(self):
+        """Update the completion from the entry counts."""
+        self.completion = round(self.bought_count * 100 / self.entry_count) if self.entry_count else 0
+
+    def update_price_completion(self, now=None):
+        """Recompute the price and completion of this shopping list from all entries (e.g. after prices changed).
+
+        The prices of entries that changed are saved, the list is not.
+        """
+        entries: typing.List[ShoppingListEntry] = list(self.entries.select_related("product")) if self.pk else []
+        ShoppingList.update_lists_totals([self], entries, now, save_lists=False)
         return self.price_cached, self.completion
 
+    @classmethod
+    def update_lists_totals(
+        cls,
+        lists: typing.Sequence["ShoppingList"],
+        entries: typing.Sequence["ShoppingListEntry"],
+        now=None,
+        save_lists: bool = True,
+    ):
+        """Recompute the price and completion of shopping lists from all their entries (with their products loaded).
+
+        The prices (and the dates when they may change) are fetched with one query per store. The prices of saved
+        entries that changed are saved, and the lists are saved if save_lists is True.
+        """
+        lists_by_store: typing.Dict[int, typing.List[ShoppingList]] = {}
+        for shopping_list in lists:
+            lists_by_store.setdefault(shopping_list.store_id, []).append(shopping_list)
+            shopping_list.price_cached = 0
+            shopping_list.entry_count = 0
+            shopping_list.bought_count = 0
+            shopping_list.prices_valid_until = None
+        lists_by_id = {sl.id: sl for sl in lists}
+        changed = []
+        for store_id, store_lists in lists_by_store.items():
+            list_ids = {sl.id for sl in store_lists}
+            store_entries = [e for e in entries if e.list_id in list_ids]
+            prices, price_changes = Product.get_prices_and_changes([e.product for e in store_entries], store_id, now)
+            for e in store_entries:
+                price = e.compute_price(prices[e.product_id])
+                if price != e.price_cached:
+                    e.price_cached = price
+                    changed.append(e)
+                shopping_list = lists_by_id[e.list_id]
+                shopping_list.price_cached += e.price_cached
+                shopping_list.entry_count += 1
+                shopping_list.bought_count += e.bought
+                shopping_list._lower_prices_valid_until(price_changes.get(e.product_id))
+
+        ShoppingListEntry.objects.bulk_update([e for e in changed if e.pk is not None], ["price_cached"])
+        for e in changed:
+            e._counted = e.get_counted_values()
+        for shopping_list in lists:
+            shopping_list._update_completion()
+        if save_lists:
+            cls.objects.bulk_update(lists, cls.TOTALS_FIELDS)
+
+    @classmethod
+    def recompute_lists_totals(cls, queryset, now=None) -> typing.List["ShoppingList"]:
+        """Recompute and save the price and completion of shopping lists, with one prices query per store.
+
+        The lists are locked while their totals are recomputed, so concurrent entry changes are not lost. Return the
+        recomputed lists.
+        """
+        with transaction.atomic():
+            lists = list(cls.objects.select_for_update().filter(pk__in=queryset.values("pk")).order_by("pk"))
+            if not lists:
+                return lists
+            entries = list(ShoppingListEntry.objects.filter(list__in=lists).select_related("product"))
+            cls.update_lists_totals(lists, entries, now)
+        return lists
+
+    @classmethod
+    def recompute_expired_totals(cls, queryset, now=None):
+        """Recompute the totals of shopping lists with prices that may have changed since they were computed.
+
+        The lists are only locked if there are any.
+        """
+        if now is None:
+            now = django.utils.timezone.now()
+        list_ids = list(queryset.filter(prices_valid_until__lte=now).values_list("pk", flat=True))
+        if list_ids:
+            cls.recompute_lists_totals(cls.objects.filter(pk__in=list_ids), now)
+
+    def _lower_prices_valid_until(self, date: typing.Optional[datetime.datetime]):
+        """Move the date when a price of an entry may change to an earlier one."""
+        if date is not None and (self.prices_valid_until is None or date < self.prices_valid_until):
+            self.prices_valid_until = date
+
+    @classmethod
+    def mark_stale(cls, queryset, since: datetime.datetime):
+        """Mark shopping lists as having replaced products since a date (unless they were marked with an earlier one)."""
+        queryset.filter(Q(stale_since=None) | Q(stale_since__gt=since)).update(stale_since=since)
+
+    @classmethod
+    def apply_entry_change(
+        cls,
+        list_id: int,
+        price,
+        entries: int,
+        bought: int,
+        instance=None,
+        prices_valid_until: typing.Optional[datetime.datetime] = None,
+    ):
+        """Apply the change of one entry to the price and completion of a list, without reading the other entries.
+
+        prices_valid_until is the date when the price of the changed entry may change. The loaded list instance (if any)
+        is updated as well.
+        """
+        with transaction.atomic():
+            shopping_list = cls.objects.select_for_update().only(*cls.TOTALS_FIELDS).filter(pk=list_id).first()
+            if shopping_list is None:
+                return
+            shopping_list.price_cached += price
+            shopping_list.entry_count += entries
+            shopping_list.bought_count += bought
+            shopping_list._lower_prices_valid_until(prices_valid_until)
+            shopping_list._update_completion()
+            shopping_list.save(update_fields=[*cls.TOTALS_FIELDS, "date_modified"])
+        if instance is not None:
+            for field in [*cls.TOTALS_FIELDS, "date_modified"]:
+                setattr(instance, field, getattr(shopping_list, field))
+
     def get_sharing_url(self, request=None):
         """Get the sharing URL for a shopping list."""
         if not self.sharing_uuid:
@@ -140,6 +347,28 @@ class ShoppingListEntry(DateTrackedModel):
     product_upgraded_from = models.ForeignKey(
         Product, on_delete=models.SET_NULL, related_name="+", blank=True, null=True
     )
+    # The price of the entry in the store of the list (included in the price of the list)
+    price_cached = PriceField(default=0)
+
+    # The fields the totals of the list are computed from
+    COUNTED_FIELDS = ("list_id", "product_id", "amount", "bought", "price_cached")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Load an entry, remembering the values included in the totals of its list."""
+        instance = super().from_db(db, field_names, values)
+        instance._counted = instance.get_counted_values()
+        return instance
+
+    def get_counted_values(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Get the values of the entry that are included in the totals of its list (None if some are not loaded)."""
+        if any(f not in self.__dict__ for f in self.COUNTED_FIELDS):
+            return None
+        return {f: self.__dict__[f] for f in self.COUNTED_FIELDS}
+
+    def compute_price(self, product_price) -> decimal.Decimal:
+        """Compute the price of the entry from the price of the product."""
+        return (decimal.Decimal(self.amount) * product_price).quantize(PRICE_QUANTUM)
 
     @property
     def price(self):
@@ -151,8 +380,7 @@ class ShoppingListEntry(DateTrackedModel):
         if now is None:
             now = django.utils.timezone.now()
         orig_product = self.product
-        while self.product.replaced_by is not None and not self.product.in_effect(now):
-            self.product = self.product.replaced_by
+        self.product = Product.resolve_revisions([orig_product], now)[orig_product.id]
         if self.product != orig_product:
             self.product_upgraded_from = orig_product
             self.save()
@@ -162,9 +390,7 @@ class ShoppingListEntry(DateTrackedModel):
         if now is None:
             now = django.utils.timezone.now()
         orig_product = self.product
-        product = self.product
-        while product.replaced_by is not None and not product.in_effect(now):
-            product = product.replaced_by
+        product = Product.resolve_revisions([orig_product], now)[orig_product.id]
         if product != orig_product:
             return product
 
@@ -225,19 +451,113 @@ class ShoppingListInvite(DateTrackedModel):
         return f"{self.list.name} {self.email}"
 
 
-@receiver(models.signals.pre_save, sender=ShoppingList)
-def update_shopping_list_price_completion(instance: ShoppingList, **kwargs):
-    """Update a shopping list’s price and completion before saving."""
-    instance.update_price_completion()
+@receiver(models.signals.post_save, sender=ShoppingList)
+def update_shopping_list_price_completion(instance: ShoppingList, created: bool, update_fields=None, **kwargs):
+    """Recompute a shopping list’s price and completion (under a lock) after saving, if its store changed."""
+    if created or (update_fields is not None and "store" not in update_fields):
+        return
+    if instance.store_id != getattr(instance, "_loaded_store_id", None):
+        for shopping_list in ShoppingList.recompute_lists_totals(ShoppingList.objects.filter(pk=instance.pk)):
+            for field in ShoppingList.TOTALS_FIELDS:
+                setattr(instance, field, getattr(shopping_list, field))
+        instance._loaded_store_id = instance.store_id
+
+
+@receiver(models.signals.pre_save, sender=ShoppingListEntry)
+def update_shopping_list_entry_price(instance: ShoppingListEntry, **kwargs):
+    """Update the price of an entry before saving, if its product or amount changed."""
+    instance._stale_since = None
+    instance._prices_valid_until = None
+    if _deferred_list_totals.get():
+        return
+    old = None
+    if not instance._state.adding:
+        old = getattr(instance, "_counted", None)
+        if old is None:
+            old = ShoppingListEntry.objects.filter(pk=instance.pk).values(*ShoppingListEntry.COUNTED_FIELDS).first()
+    instance._counted_before_save = old
+    if old is None or any(old[f] != getattr(instance, f) for f in ("list_id", "product_id", "amount")):
+        if ShoppingListEntry.list.is_cached(instance):
+            store_id = instance.list.store_id
+        else:
+            store_id = ShoppingList.objects.filter(pk=instance.list_id).values_list("store_id", flat=True).first()
+        prices, price_changes = Product.get_prices_and_changes([instance.product], store_id)
+        instance.price_cached = instance.compute_price(prices[instance.product_id])
+        instance._prices_valid_until = price_changes.get(instance.product_id)
+        instance._stale_since = instance.product.get_replacement_date()
+
+
+def _apply_entry_change(instance: ShoppingListEntry, old, new):
+    """Apply the change of an entry (from the old counted values to the new ones) to the totals of its lists."""
+    changes = {}
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        price, entries, bought = changes.get(values["list_id"], (0, 0, 0))
+        changes[values["list_id"]] = (
+            price + sign * values["price_cached"],
+            entries + sign,
+            bought + sign * values["bought"],
+        )
+    prices_valid_until = getattr(instance, "_prices_valid_until", None)
+    cached_list = instance.list if ShoppingListEntry.list.is_cached(instance) else None
+    for list_id, (price, entries, bought) in changes.items():
+        valid_until = prices_valid_until if new is not None and list_id == new["list_id"] else None
+        if price or entries or bought or valid_until:
+            ShoppingList.apply_entry_change(
+                list_id,
+                price,
+                entries,
+                bought,
+                cached_list if getattr(cached_list, "pk", None) == list_id else None,
+                valid_until,
+            )
 
 
 @receiver(models.signals.post_save, sender=ShoppingListEntry)
 def update_shopping_list_entry_owner_price_save(instance: ShoppingListEntry, **kwargs):
-    """Update a shopping list’s price after saving an entry."""
-    instance.list.save()  # calls update_shopping_list_price_completion
+    """Update a shopping list’s price and completion after saving an entry (by the change of the entry)."""
+    if _deferred_list_totals.get():
+        return
+    if instance._stale_since:
+        ShoppingList.mark_stale(ShoppingList.objects.filter(pk=instance.list_id), instance._stale_since)
+    new = instance.get_counted_values()
+    _apply_entry_change(instance, instance._counted_before_save, new)
+    instance._counted = new
 
 
 @receiver(models.signals.post_delete, sender=ShoppingListEntry)
 def update_shopping_list_entry_owner_price_delete(instance: ShoppingListEntry, **kwargs):
-    """Update a shopping list’s price after saving an entry."""
-    instance.list.save()  # calls update_shopping_list_price_completion
+    """Update a shopping list’s price and completion after deleting an entry."""
+    if _deferred_list_totals.get():
+        return
+    old = getattr(instance, "_counted", None) or instance.get_counted_values()
+    _apply_entry_change(instance, old, None)
+
+
+@receiver(models.signals.post_save, sender=Product)
+@receiver(models.signals.post_save, sender=LocalProductOverride)
+@receiver(models.signals.post_delete, sender=LocalProductOverride)
+def update_shopping_list_prices(sender, instance, created: bool = False, **kwargs):
+    """Recompute the prices of shopping lists with a product after its price or local overrides changed."""
+    if sender is Product:
+        if created:
+            return
+        lists = ShoppingList.objects.filter(entries__product=instance.pk)
+    else:
+        lists = ShoppingList.objects.filter(store=instance.store_id, entries__product=instance.product_id)
+    ShoppingList.recompute_lists_totals(lists)
+
+
+@receiver(models.signals.post_save, sender=Product)
+def mark_shopping_lists_stale(instance: Product, **kwargs):
+    """Mark shopping lists with a product as stale after the product was replaced."""
+    stale_since = instance.get_replacement_date()
+    if stale_since:
+        ShoppingList.mark_stale(ShoppingList.objects.filter(entries__product=instance.pk), stale_since)
+
+
+@receiver(revisions_migrated, sender=Product)
+def mark_shopping_lists_stale_bulk(id_map: typing.Dict[int, int], date_started: datetime.datetime, **kwargs):
+    """Mark shopping lists with products that were replaced in bulk as stale."""
+    ShoppingList.mark_stale(ShoppingList.objects.filter(entries__product__in=list(id_map)), date_started)
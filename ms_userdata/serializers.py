@@ -3,21 +3,27 @@ from rest_framework import serializers
 
 import ms_products.serializers
 from ms_baseline.serializers import SimpleUserSerializer
+from ms_products.serializers import OverridePrefetchListSerializer, OverridePrefetchMixin
 from ms_userdata import models
 
 
-class ShoppingListEntrySerializer(serializers.ModelSerializer):
+class ShoppingListEntrySerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for ShoppingListEntries."""
 
     list = serializers.PrimaryKeyRelatedField(read_only=True)
     product = ms_products.serializers.ProductBasicSerializer(read_only=True)
 
+    def get_override_products(self, instance: models.ShoppingListEntry):
+        """Get the products that will be displayed when serializing the entry."""
+        return [instance.product]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.ShoppingListEntry
         fields = ["id", "list", "product", "amount", "price", "bought"]
 
 
-class ShoppingListSerializer(serializers.ModelSerializer):
+class ShoppingListSerializer(OverridePrefetchMixin, serializers.ModelSerializer):
     """A serializer for ShoppingLists."""
 
     user = SimpleUserSerializer(read_only=True)
@@ -31,7 +37,12 @@ class ShoppingListSerializer(serializers.ModelSerializer):
         """Get the sharing URL of a shopping list."""
         return obj.get_sharing_url(self.context.get("request"))
 
+    def get_override_products(self, instance: models.ShoppingList):
+        """Get the products that will be displayed when serializing the list."""
+        return [e.product for e in instance.entries.all()]
+
     class Meta:
+        list_serializer_class = OverridePrefetchListSerializer
         model = models.ShoppingList
         fields = [
             "id",
@@ -1,8 +1,13 @@
 """Tests for ms_userdata."""
+import datetime
+from decimal import Decimal
+
+import django.utils.timezone
 from django.test import TestCase
+from django.urls import reverse
 
 from ms_baseline.models import MsUser
-from ms_products.models import Category, Product, Store, Subcategory, Vendor
+from ms_products.models import Category, LocalProductOverride, Product, Store, Subcategory, Vendor
 from ms_userdata.models import ShoppingList, ShoppingListEntry
 
 
@@ -90,3 +95,235 @@ class TestShoppingListProductUpgrades(TestCase):
 
         self.assertEqual(self.list.entries.count(), 1)
         self.assertEqual(self.list.entries.all()[0].product.name, "test product 3")
+
+    def test_resolve_revisions(self):
+        """Test finding current revisions of products by their lineage."""
+        first_product = Product.objects.get(id=self.product.id)
+        for name in ("test product 2", "test product 3"):
+            old_product = Product.objects.get(id=self.product.id)
+            self.product.name = name
+            self.product.id = None
+            self.product.pk = None
+            self.product.save_as_replacement(None, old_product)
+        second_product = Product.objects.get(replaced_by=self.product)
+        other_product = Product(
+            name="other product", price=1, amount=1, amount_unit="pc", subcategory=self.subcategory, vendor=self.vendor
+        )
+        other_product.save()
+
+        self.assertEqual(len({p.lineage for p in Product.objects.exclude(id=other_product.id)}), 1)
+        first_product.refresh_from_db()
+        second_product.refresh_from_db()
+        with self.assertNumQueries(1):
+            revisions = Product.resolve_revisions([first_product, second_product, other_product])
+        self.assertEqual(revisions[first_product.id], self.product)
+        self.assertEqual(revisions[second_product.id], self.product)
+        self.assertEqual(revisions[other_product.id], other_product)
+
+    def test_resolve_revisions_lower_ids(self):
+        """Test finding current revisions when a replacement has a lower ID than the revision it replaces."""
+        now = django.utils.timezone.now()
+        replaced = []
+        for days in (10, 20):
+            product = Product(
+                name=f"test product {days} days ago",
+                price=1,
+                amount=1,
+                amount_unit="pc",
+                subcategory=self.subcategory,
+                vendor=self.vendor,
+                lineage=self.product.lineage,
+                replaced_by=replaced[-1] if replaced else self.product,
+                date_started=now - datetime.timedelta(days=days + 10),
+                date_ended=now - datetime.timedelta(days=days),
+            )
+            product.save()
+            replaced.append(product)
+        self.assertLess(self.product.id, replaced[0].id)
+        self.assertLess(replaced[0].id, replaced[1].id)
+
+        revisions = Product.resolve_revisions(replaced, now)
+        self.assertEqual(revisions[replaced[0].id], self.product)
+        self.assertEqual(revisions[replaced[1].id], self.product)
+
+        self.entry.delete()
+        ShoppingListEntry(list=self.list, product=replaced[1], amount=2, user=self.user).save()
+        self.list.upgrade_products(allow_ignore=False)
+        self.assertEqual([e.product for e in self.list.entries.all()], [self.product])
+
+    def test_batch_upgrades(self):
+        """Test upgrades of many shopping lists at once, which only load lists marked as stale."""
+        other_list = ShoppingList(user=self.user, store=self.store)
+        other_list.save()
+        ShoppingListEntry(list=other_list, product=self.product, amount=1, user=self.user).save()
+        fresh_list = ShoppingList(user=self.user, store=self.store)
+        fresh_list.save()
+        self.assertEqual(ShoppingList.objects.filter(stale_since__isnull=False).count(), 0)
+
+        old_product = Product.objects.get(id=self.product.id)
+        self.product.name = "test product 2"
+        self.product.id = None
+        self.product.pk = None
+        self.product.save_as_replacement(None, old_product)
+        self.assertEqual(ShoppingList.objects.filter(stale_since__isnull=False).count(), 2)
+
+        with self.assertNumQueries(8):
+            changed = ShoppingList.upgrade_lists(ShoppingList.objects.all(), allow_ignore=False)
+        self.assertEqual({sl.id for sl in changed}, {self.list.id, other_list.id})
+        self.assertFalse(ShoppingListEntry.objects.exclude(product=self.product).exists())
+        self.assertEqual(ShoppingList.objects.filter(stale_since__isnull=False).count(), 0)
+        self.assertEqual(ShoppingList.upgrade_lists(ShoppingList.objects.all(), allow_ignore=False), [])
+
+    def test_unresolved_upgrades(self):
+        """Test that lists with products that cannot be resolved to a newer revision stay stale."""
+        now = django.utils.timezone.now()
+        other_product = Product(
+            name="other product", price=1, amount=1, amount_unit="pc", subcategory=self.subcategory, vendor=self.vendor
+        )
+        other_product.save()
+        # The replacement is not a revision of the same lineage, so it cannot be found.
+        self.product.replaced_by = other_product
+        self.product.date_started = now - datetime.timedelta(days=2)
+        self.product.date_ended = now - datetime.timedelta(days=1)
+        self.product.save()
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.stale_since, self.product.date_ended)
+
+        self.assertEqual(ShoppingList.upgrade_lists(ShoppingList.objects.all(), allow_ignore=False), [])
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.stale_since, self.product.date_ended)
+
+
+class TestShoppingListTotals(TestCase):
+    """Test the maintenance of shopping list prices and completion."""
+
+    def setUp(self):
+        """Create a list with two entries."""
+        category = Category(name="test category")
+        category.save()
+        subcategory = Subcategory(name="test subcategory", parent=category)
+        subcategory.save()
+        vendor = Vendor(name="test vendor")
+        vendor.save()
+        self.products = [
+            Product(name=f"product {i}", price=i, amount=1, amount_unit="pc", subcategory=subcategory, vendor=vendor)
+            for i in (1, 2)
+        ]
+        for product in self.products:
+            product.save()
+        self.store = Store(name="test store")
+        self.store.save()
+        self.user = MsUser(email="example@example.com")
+        self.user.save()
+        self.list = ShoppingList(user=self.user, store=self.store)
+        self.list.save()
+        for product in self.products:
+            ShoppingListEntry(list=self.list, product=product, amount=2, user=self.user).save()
+
+    def assertTotals(self, price, completion):
+        """Check the totals of the list, and that they match a full recompute."""
+        self.list.refresh_from_db()
+        self.assertEqual((self.list.price_cached, self.list.completion), (price, completion))
+        self.assertEqual(self.list.update_price_completion(), (price, completion))
+
+    def test_incremental_changes(self):
+        """Test that changes of entries are applied to the totals without reading the other entries."""
+        self.assertTotals(6, 0)
+        entry = self.list.entries.get(product=self.products[0])
+        entry.bought = True
+        with self.assertNumQueries(5):
+            entry.save()
+        self.assertTotals(6, 50)
+
+        entry.amount = 3
+        entry.save()
+        self.assertTotals(7, 50)
+        entry.delete()
+        self.assertTotals(4, 0)
+
+    def test_price_changes(self):
+        """Test that the totals are recomputed when prices change, in a constant number of queries."""
+        for _i in range(3):
+            other_list = ShoppingList(user=self.user, store=self.store)
+            other_list.save()
+            ShoppingListEntry(list=other_list, product=self.products[1], amount=1, user=self.user).save()
+        override = LocalProductOverride(product=self.products[1], store=self.store, price=Decimal("0.5"))
+        with self.assertNumQueries(8):
+            override.save()
+        self.assertTotals(3, 0)
+        self.assertEqual(ShoppingList.objects.get(pk=other_list.pk).price_cached, Decimal("0.5"))
+        self.assertIsNone(self.list.prices_valid_until)
+        override.delete()
+        self.assertTotals(6, 0)
+        self.products[0].price = 3
+        self.products[0].save()
+        self.assertTotals(10, 0)
+
+    def test_override_expiry(self):
+        """Test that the totals are recomputed on read after a local override goes out of effect."""
+        other_list = ShoppingList(user=self.user, store=self.store)
+        other_list.save()
+        ShoppingListEntry(list=other_list, product=self.products[1], amount=2, user=self.user).save()
+        now = django.utils.timezone.now()
+        override = LocalProductOverride(
+            product=self.products[1],
+            store=self.store,
+            price=Decimal("0.5"),
+            date_ended=now + datetime.timedelta(hours=1),
+        )
+        override.save()
+        self.assertTotals(3, 0)
+        self.assertEqual(self.list.prices_valid_until, override.date_ended)
+
+        # The override goes out of effect (without being saved).
+        expired = now - datetime.timedelta(minutes=1)
+        LocalProductOverride.objects.filter(pk=override.pk).update(date_ended=expired)
+        ShoppingList.objects.update(prices_valid_until=expired)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("ms_userdata_api:lists_detail", args=(self.list.id,)))
+        self.assertEqual(Decimal(response.json()["price_cached"]), 6)
+        self.assertTotals(6, 0)
+        self.assertIsNone(self.list.prices_valid_until)
+        self.assertEqual(ShoppingList.objects.get(pk=other_list.pk).price_cached, 1)
+
+        response = self.client.get(reverse("ms_userdata_api:lists_list"))
+        self.assertEqual({Decimal(sl["price_cached"]) for sl in response.json()}, {6, 4})
+
+    def test_store_change(self):
+        """Test that the totals are recomputed for the new store when the store of a list changes."""
+        other_store = Store(name="other store")
+        other_store.save()
+        LocalProductOverride(product=self.products[1], store=other_store, price=Decimal("0.5")).save()
+        self.client.force_login(self.user)
+        url = reverse("ms_userdata_api:lists_detail", args=(self.list.id,))
+        response = self.client.patch(url, {"name": "renamed", "store": other_store.id}, content_type="application/json")
+        self.assertEqual(Decimal(response.json()["price_cached"]), 3)
+        self.assertTotals(3, 0)
+        self.assertEqual(self.list.name, "renamed")
+
+    def test_batch_operations(self):
+        """Test applying many entry operations at once through the API, with one recompute of the totals."""
+        third = Product(name="product 3", price=3, amount=1, amount_unit="pc")
+        third.subcategory, third.vendor = self.products[0].subcategory, self.products[0].vendor
+        third.save()
+        self.client.force_login(self.user)
+        url = reverse("ms_userdata_api:lists_entries_batch", args=(self.list.id,))
+        operations = [
+            {"op": "add", "product": third.id, "amount": 1},
+            {"op": "bought", "product": self.products[1].id},
+            {"op": "update", "product": self.products[1].id, "amount": 3},
+            {"op": "delete", "product": self.products[0].id},
+        ]
+        response = self.client.post(url, {"operations": operations}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["entries"]), 2)
+        self.assertTotals(9, 50)
+
+        operations = [{"op": "add", "product": self.products[0].id}, {"op": "update", "product": 0}]
+        response = self.client.post(url, {"operations": operations}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            url, {"operations": [{"op": "bought", "product": self.products[0].id}]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTotals(9, 50)
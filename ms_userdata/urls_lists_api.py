@@ -9,6 +9,7 @@ urlpatterns = [
     path("", rest_views.ShoppingListsList.as_view(), name="lists_list"),
     path("<int:pk>/", rest_views.ShoppingListDetail.as_view(), name="lists_detail"),
     path("<int:pk>/product/<int:product_pk>/", rest_views.shopping_list_entry, name="lists_entry"),
+    path("<int:pk>/entries/", rest_views.shopping_list_entries_batch, name="lists_entries_batch"),
     path("<int:pk>/share/", rest_views.shopping_list_share, name="lists_share"),
     path("<int:pk>/clean/", rest_views.shopping_list_clean_done_items, name="lists_clean_done_items"),
     path("<int:list_pk>/invites/", rest_views.ShoppingListInviteList.as_view(), name="lists_invites_list"),
@@ -1,10 +1,13 @@
 """REST API views for ms_userdata."""
 
 import datetime
+import decimal
+import typing
 from uuid import uuid4
 
 import django.utils.timezone
 import rest_framework.exceptions
+from django.conf import settings
 from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
@@ -25,6 +28,7 @@ from ms_baseline.serializers import (
 )
 from ms_products.constants import PREFETCH_PRODUCT_BASIC, PREFETCH_SHOPPING_LIST
 from ms_products.models import Product
+from ms_userdata.batch import OPERATIONS, EntryOperation, apply_entry_operations
 from ms_userdata.models import ShoppingList, ShoppingListEntry, ShoppingListInvite
 from ms_userdata.serializers import ShoppingListEntrySerializer, ShoppingListInviteSerializer, ShoppingListSerializer
 
@@ -40,7 +44,7 @@ def shopping_list_share(request: Request, pk: int):
         shopping_list.sharing_uuid = uuid4()
     else:
         shopping_list.sharing_uuid = None
-    shopping_list.save()
+    shopping_list.save(update_fields=["sharing_uuid", "date_modified"])
     return Response({"sharing_uuid": shopping_list.sharing_uuid, "sharing_url": shopping_list.get_sharing_url(request)})
 
 
@@ -54,16 +58,13 @@ class ShoppingListsList(SerializerContextMixin, mixins.ListModelMixin, generics.
 
     def get_queryset(self):
         """Get the queryset for the shopping lists list."""
-        return (
-            ShoppingList.objects.prefetch_related(*PREFETCH_SHOPPING_LIST)
-            .filter(filter_list_access(self.request.user))
-            .distinct()
-        )
+        return ShoppingList.objects.filter(filter_list_access(self.request.user)).distinct()
 
     def get(self, request, *args, **kwargs):
         """Handle GET requests."""
-        for sl in self.get_queryset():
-            sl.upgrade_products()
+        now = django.utils.timezone.now()
+        ShoppingList.upgrade_lists(self.get_queryset(), now=now)
+        ShoppingList.recompute_expired_totals(self.get_queryset(), now)
         return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
@@ -86,9 +87,7 @@ class ShoppingListDetail(
 
     def get_queryset(self):
         """Get the queryset for the shopping lists list."""
-        return ShoppingList.objects.prefetch_related(*PREFETCH_SHOPPING_LIST).filter(
-            filter_list_access(self.request.user)
-        )
+        return ShoppingList.objects.filter(filter_list_access(self.request.user))
 
     def perform_destroy(self, instance):
         """Perform the destruction of the instance."""
@@ -99,7 +98,13 @@ class ShoppingListDetail(
     def get(self, request, *args, **kwargs):
         """Handle GET requests."""
         instance: ShoppingList = self.get_object()
-        any_changes = instance.upgrade_products(allow_ignore=False)
+        now = django.utils.timezone.now()
+        any_changes = False
+        if instance.stale_since is not None and instance.stale_since <= now:
+            any_changes = instance.upgrade_products(allow_ignore=False)
+        if instance.prices_valid_until is not None and instance.prices_valid_until <= now:
+            ShoppingList.recompute_lists_totals(ShoppingList.objects.filter(pk=instance.pk), now)
+            any_changes = True
 
         if any_changes:
             instance = self.get_object()
@@ -114,7 +119,7 @@ class ShoppingListDetail(
             raise rest_framework.exceptions.PermissionDenied("Only the owner can change list properties.")
         instance.name = request.data["name"]
         instance.store_id = request.data["store"]
-        instance.save()
+        instance.save(update_fields=["name", "store", "date_modified"])
 
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
@@ -159,6 +164,69 @@ def shopping_list_entry(request, pk: int, product_pk: int):
     return Response(ShoppingListEntrySerializer(entry, context=get_serializer_context(request=request)).data, status)
 
 
+def _parse_entry_operations(data) -> typing.List[EntryOperation]:
+    """Parse the operations of a batch change of shopping list entries (fetching their products in one query)."""
+    raw_operations = data.get("operations") if isinstance(data, dict) else None
+    max_operations = getattr(settings, "MOBISHOPPER_LIST_BATCH_MAX_OPERATIONS", 500)
+    if not isinstance(raw_operations, list) or not raw_operations:
+        raise rest_framework.exceptions.ValidationError({"operations": _("A list of operations is required.")})
+    if len(raw_operations) > max_operations:
+        raise rest_framework.exceptions.ValidationError(
+            {"operations": _("At most %(count)d operations are allowed.") % {"count": max_operations}}
+        )
+
+    parsed = []
+    errors = {}
+    for index, raw in enumerate(raw_operations):
+        if not isinstance(raw, dict) or raw.get("op") not in OPERATIONS:
+            errors[index] = _("Invalid operation.")
+            continue
+        try:
+            product_id = int(raw.get("product"))
+            amount = raw.get("amount")
+            amount = decimal.Decimal(str(amount)) if amount is not None else None
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            errors[index] = _("Invalid product or amount.")
+            continue
+        bought = raw.get("bought")
+        if (amount is not None and not amount > 0) or (bought is not None and not isinstance(bought, bool)):
+            errors[index] = _("Invalid product or amount.")
+            continue
+        parsed.append((index, raw["op"], product_id, amount, bought))
+
+    products = Product.objects.in_bulk({operation[2] for operation in parsed})
+    for index, _op, product_id, _amount, _bought in parsed:
+        if product_id not in products:
+            errors[index] = _("Product not found.")
+    if errors:
+        raise rest_framework.exceptions.ValidationError({"operations": errors})
+    return [
+        EntryOperation(op=op, product=products[product_id], amount=amount, bought=bought)
+        for _index, op, product_id, amount, bought in parsed
+    ]
+
+
+@login_required_drf
+@api_view(["POST"])
+@parser_classes([JSONDecimalParser])
+def shopping_list_entries_batch(request, pk: int):
+    """Add, modify, mark as bought or delete many products on a shopping list at once.
+
+    Takes POST data with `operations`, a list of objects with `op` (add, update, delete or bought), `product`, and
+    optionally `amount` and `bought`. The operations are applied in order, and none of them is applied if one fails.
+    """
+    lists = ShoppingList.objects.filter(filter_list_access(request.user)).distinct()
+    shopping_list: ShoppingList = get_object_or_404(lists, pk=pk)
+    operations = _parse_entry_operations(request.data)
+    try:
+        apply_entry_operations(shopping_list, request.user, operations)
+    except ShoppingListEntry.DoesNotExist as e:
+        raise rest_framework.exceptions.ValidationError({"operations": {e.args[0]: _("Product not on the list.")}})
+
+    shopping_list = get_object_or_404(lists.prefetch_related(*PREFETCH_SHOPPING_LIST), pk=pk)
+    return Response(ShoppingListSerializer(shopping_list, context=get_serializer_context(request=request)).data)
+
+
 class ShoppingListInviteList(SerializerContextMixin, mixins.ListModelMixin, generics.GenericAPIView):
     """List or create shopping list invites."""
 
@@ -288,7 +356,7 @@ def shopping_list_clean_done_items(request, pk: int):
     for e in shopping_list.entries.all():
         if e.bought:
             e.delete()
-    shopping_list.save()
+    shopping_list.save(update_fields=["date_modified"])
     shopping_list: ShoppingList = get_object_or_404(ShoppingList, filter_list_access(request.user), pk=pk)
     return Response(ShoppingListSerializer(shopping_list, context=get_serializer_context(request=request)).data)
 